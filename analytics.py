@@ -0,0 +1,435 @@
+"""Движение запасов и потери по временным рядам показаний
+
+Ряд - массивы (tank, ts, height, density[, temperature]) любой длины и порядка.
+Объемы считаются пакетно тем же путем, что и readings.compute_chunk, ряд
+упорядочивается по (резервуар, время), дальше все считается по массивам:
+
+- изменение объема к предыдущему показанию того же резервуара раскладывается
+  на приемку (рост больше receipt_threshold), отпуск (падение больше
+  dispense_threshold) и дрейф - все остальное: испарение, утечки, шум уровнемера;
+- темп убыли в покое, л/ч - наклон прямой по показаниям каждого периода без
+  операций не короче quiet_period (чаще всего ночь): выше loss_rate - отметка потерь;
+- одиночные скачки дрейфа больше jump_sigmas робастных отклонений - отметка скачка;
+- дневной баланс: остаток на начало и конец суток, приемка, отпуск, потери и,
+  если есть журнал операций, невязка с книжным остатком.
+
+Расчет идет по объему при 15 °C, поэтому суточное температурное сжатие не
+считается потерей (без температуры - по объему при температуре продукта).
+"""
+import csv
+import time
+from itertools import islice
+
+import numpy as np
+
+from density import STANDARD_TEMPERATURE
+from instrumentation import timed
+from readings import CHUNK_SIZE, compute_chunk
+from report import ROW, TOTAL, Report
+
+RECEIPT_THRESHOLD = 200.0
+DISPENSE_THRESHOLD = 20.0
+QUIET_PERIOD = 3 * 3600
+LOSS_RATE = 2.0
+JUMP_SIGMAS = 8.0
+MAX_GAP = 3 * 3600
+VARIANCE_LITERS = 50.0
+VARIANCE_SHARE = 0.005
+MAX_OFFSET_HOURS = 24 * 366 * 5
+
+FLAG_RECEIPT = 1
+FLAG_DISPENSE = 2
+FLAG_LOSS = 4
+FLAG_JUMP = 8
+FLAG_GAP = 16
+FLAG_NAMES = {
+    FLAG_RECEIPT: "приемка", FLAG_DISPENSE: "отпуск", FLAG_LOSS: "потери",
+    FLAG_JUMP: "скачок", FLAG_GAP: "пропуск",
+}
+ANOMALY_FLAGS = FLAG_LOSS | FLAG_JUMP
+
+BALANCE_COLUMNS = [
+    ("День", ''), ("Объект", ''), ("Начало, л", '.1f'), ("Приемка, л", '.1f'), ("Отпуск, л", '.1f'),
+    ("Конец, л", '.1f'), ("Потери, л", '.1f'), ("Потери, %", '.3f'), ("Приход по журналу, л", '.1f'),
+    ("Расход по журналу, л", '.1f'), ("Невязка, л", '.1f'), ("Отметки", ''),
+]
+EVENT_COLUMNS = [
+    ("Время", ''), ("Объект", ''), ("Высота, мм", ''), ("Объем 15 °C, л", '.1f'),
+    ("Изменение, л", '.1f'), ("Темп потерь, л/ч", '.2f'), ("Отметки", ''),
+]
+
+
+def local_days(timestamps) -> np.ndarray:
+    """Номер местных суток (дни от 1970-01-01) для каждой отметки времени, как day_of в history
+
+    Смещение часового пояса берется по часам: localtime вызывается один раз на час ряда.
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    hours = np.floor_divide(timestamps, 3600).astype(np.int64)
+    if not len(hours):
+        return hours
+    first, last = int(hours.min()), int(hours.max())
+    if last - first < MAX_OFFSET_HOURS:
+        offsets = np.array([time.localtime(hour * 3600).tm_gmtoff for hour in range(first, last + 1)])
+        offset = offsets[hours - first]
+    else:
+        unique, inverse = np.unique(hours, return_inverse=True)
+        offset = np.array([time.localtime(hour * 3600).tm_gmtoff for hour in unique.tolist()])[inverse]
+    return np.floor_divide(timestamps + offset, 86400).astype(np.int64)
+
+
+def day_text(day: int) -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime(day * 86400))
+
+
+def flag_text(flags: int) -> str:
+    return ", ".join(name for flag, name in FLAG_NAMES.items() if flags & flag)
+
+
+class StockSeries:
+    """Ряд показаний по (резервуар, время) с разложением изменений объема
+
+    Для строки i deltas, receipts, dispensed и drift относятся к интервалу от
+    предыдущего показания того же резервуара (у первого показания - нули):
+    deltas = receipts - dispensed + drift. Объемы - л при 15 °C.
+    """
+
+    __slots__ = ('tank_ids', 'timestamps', 'heights', 'densities', 'volumes', 'volumes15', 'masses',
+                 'deltas', 'receipts', 'dispensed', 'drift', 'loss_rates', 'flags', 'starts', 'skipped')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def segments(self):
+        """(tank, start, stop) по резервуарам"""
+        stops = np.append(self.starts[1:], len(self)).tolist()
+        for start, stop in zip(self.starts.tolist(), stops):
+            yield self.tank_ids[start].item(), start, stop
+
+    def anomalies(self, flags=ANOMALY_FLAGS) -> np.ndarray:
+        """Индексы строк с любой из отметок flags"""
+        return np.flatnonzero(self.flags & flags)
+
+    def events_report(self, flags=ANOMALY_FLAGS, title=None) -> Report:
+        """Отмеченные интервалы с темпом потерь"""
+        def rows():
+            for i in self.anomalies(flags).tolist():
+                yield ROW, (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.timestamps[i])),
+                            self.tank_ids[i].item(), self.heights[i].item(), self.volumes15[i].item(),
+                            self.deltas[i].item(), self.loss_rates[i].item(), flag_text(self.flags[i]))
+
+        return Report(title or "Отметки по показаниям", EVENT_COLUMNS, rows())
+
+
+@timed('analytics.analyze')
+def analyze(tank_ids, timestamps, heights, densities, tanks, temperatures=None,
+            receipt_threshold=RECEIPT_THRESHOLD, dispense_threshold=DISPENSE_THRESHOLD,
+            quiet_period=QUIET_PERIOD, loss_rate=LOSS_RATE, jump_sigmas=JUMP_SIGMAS, max_gap=MAX_GAP,
+            density_temperature=STANDARD_TEMPERATURE) -> StockSeries:
+    """Разложение ряда показаний на приемку, отпуск и дрейф с отметками аномалий
+
+    Показания резервуаров, которых нет в tanks, отбрасываются (их число - в skipped).
+    """
+    tank_ids = np.asarray(tank_ids, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=float)
+    heights = np.asarray(heights)
+    densities = np.asarray(densities, dtype=float)
+    temperatures = (np.full(len(timestamps), np.nan) if temperatures is None
+                    else np.asarray(temperatures, dtype=float))
+
+    known = np.isin(tank_ids, np.fromiter(tanks, dtype=np.int64, count=len(tanks)))
+    series = StockSeries()
+    series.skipped = int(len(known) - np.count_nonzero(known))
+    if series.skipped:
+        tank_ids, timestamps, heights, densities, temperatures = (
+            column[known] for column in (tank_ids, timestamps, heights, densities, temperatures))
+
+    order = _series_order(tank_ids, timestamps)
+    if order is not None:
+        tank_ids, timestamps, heights, densities, temperatures = (
+            column[order] for column in (tank_ids, timestamps, heights, densities, temperatures))
+    count = len(timestamps)
+    first = np.ones(count, dtype=bool)
+    first[1:] = tank_ids[1:] != tank_ids[:-1]
+    starts = np.flatnonzero(first)
+
+    volumes, volumes15, masses = compute_chunk(tank_ids, heights, densities, temperatures, tanks,
+                                               density_temperature)
+    deltas = np.zeros(count)
+    deltas[1:] = np.diff(volumes15)
+    deltas[first] = 0.0
+    intervals = np.zeros(count)
+    intervals[1:] = np.diff(timestamps)
+    intervals[first] = 0.0
+
+    receipt = deltas > receipt_threshold
+    dispense = deltas < -dispense_threshold
+    receipt |= _neighbours(receipt, first) & ~dispense
+    dispense |= _neighbours(dispense, first) & ~receipt
+    drift = np.where(receipt | dispense, 0.0, deltas)
+
+    flags = np.zeros(count, dtype=np.int64)
+    flags[receipt] |= FLAG_RECEIPT
+    flags[dispense] |= FLAG_DISPENSE
+    flags[intervals > max_gap] |= FLAG_GAP
+
+    loss_rates = _loss_rates(timestamps, volumes15, receipt | dispense | first, quiet_period)
+    flags[loss_rates > loss_rate] |= FLAG_LOSS
+    flags[_jumps(drift, receipt | dispense | first, starts, jump_sigmas)] |= FLAG_JUMP
+
+    series.tank_ids, series.timestamps, series.heights, series.densities = tank_ids, timestamps, heights, densities
+    series.volumes, series.volumes15, series.masses = volumes, volumes15, masses
+    series.deltas, series.drift = deltas, drift
+    series.receipts = np.where(receipt, deltas, 0.0)
+    series.dispensed = np.where(dispense, -deltas, 0.0)
+    series.loss_rates, series.flags, series.starts = loss_rates, flags, starts
+    return series
+
+
+def _series_order(tank_ids, timestamps):
+    """Перестановка к порядку (резервуар, время) или None, если ряд уже так упорядочен
+
+    Из истории показания приходят сгруппированными по резервуару и по времени внутри
+    группы (номера как текст, поэтому группы не по возрастанию) - сортировка не нужна.
+    """
+    if len(tank_ids) < 2:
+        return None
+    change = tank_ids[1:] != tank_ids[:-1]
+    if np.all(change | (timestamps[1:] >= timestamps[:-1])):
+        grouped = tank_ids[np.append(True, change)]
+        if len(np.unique(grouped)) == len(grouped):
+            return None
+    return np.lexsort((timestamps, tank_ids))
+
+
+def _neighbours(moving, first) -> np.ndarray:
+    """Интервалы рядом с операцией в том же резервуаре
+
+    Операция редко совпадает с моментами показаний: первый и последний интервалы
+    несут только ее часть. Соседи относятся к операции независимо от знака
+    изменения, иначе отбор по знаку смещал бы дрейф на шум уровнемера.
+    """
+    near = np.zeros_like(moving)
+    near[:-1] |= moving[1:] & ~first[1:]
+    near[1:] |= moving[:-1] & ~first[1:]
+    return near
+
+
+def _loss_rates(timestamps, volumes, moving, quiet_period) -> np.ndarray:
+    """Темп убыли, л/ч, для строк периодов покоя не короче quiet_period (иначе 0)
+
+    Темп - наклон прямой МНК по всем показаниям периода, а не разность его концов:
+    шум уровнемера в одном показании почти не влияет на результат.
+    Суммы для наклона считаются по всем периодам сразу через reduceat.
+    """
+    rates = np.zeros(len(timestamps))
+    idle = np.flatnonzero(~moving)
+    if not len(idle):
+        return rates
+    run_start = np.ones(len(idle), dtype=bool)
+    run_start[1:] = np.diff(idle) != 1
+    starts = np.flatnonzero(run_start)
+    runs = np.cumsum(run_start) - 1
+
+    t = timestamps[idle] - timestamps[idle[starts]][runs]
+    v = volumes[idle] - volumes[idle[starts]][runs]
+    n, st, sv, stt, stv = (np.add.reduceat(values, starts) for values in (np.ones(len(idle)), t, v, t * t, t * v))
+    duration = np.maximum.reduceat(t, starts)
+    spread = n * stt - st * st
+    quiet = (duration >= quiet_period) & (spread > 0)
+    run_rates = np.zeros(len(starts))
+    run_rates[quiet] = -(n[quiet] * stv[quiet] - st[quiet] * sv[quiet]) / spread[quiet] * 3600
+    rates[idle] = run_rates[runs]
+    return rates
+
+
+def _jumps(drift, moving, starts, sigmas) -> np.ndarray:
+    """Маска скачков дрейфа: отклонение от медианы больше sigmas оценок по MAD"""
+    jumps = np.zeros(len(drift), dtype=bool)
+    stops = np.append(starts[1:], len(drift))
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        idle = ~moving[start:stop]
+        values = drift[start:stop][idle]
+        if len(values) < 3:
+            continue
+        median = np.median(values)
+        scale = 1.4826 * np.median(np.abs(values - median))
+        if scale > 0:
+            segment = jumps[start:stop]
+            segment[idle] = np.abs(values - median) > sigmas * scale
+    return jumps
+
+
+class DailyBalance:
+    """Баланс по (резервуар, сутки), столбцы - массивы одной длины
+
+    loss - потери по дрейфу уровнемера (положительные - убыль); при журнале
+    операций variance = конец - (начало + приход - расход) по журналу,
+    отрицательная невязка - недостача. alarms - дни сверх допуска.
+    """
+
+    __slots__ = ('tank_ids', 'days', 'opening', 'receipts', 'dispensed', 'closing', 'loss',
+                 'book_receipts', 'book_dispensed', 'variance', 'events', 'alarms')
+
+    def __len__(self):
+        return len(self.days)
+
+    def rows(self):
+        """Строки отчета: (день, резервуар, начало, приемка, отпуск, конец, потери, потери %,
+        приход и расход по журналу, невязка, отметки)
+        """
+        for i in range(len(self)):
+            yield (day_text(self.days[i]), self.tank_ids[i].item(), *self._values(i))
+
+    def _values(self, i, events=None, alarm=None):
+        dispensed = self.dispensed[i].item()
+        book = not np.isnan(self.variance[i])
+        events = self.events[i].item() if events is None else events
+        alarm = self.alarms[i].item() if alarm is None else alarm
+        marks = ([f"отметок {events}"] if events else []) + (["сверх допуска"] if alarm else [])
+        return (self.opening[i].item(), self.receipts[i].item(), dispensed, self.closing[i].item(),
+                self.loss[i].item(), self.loss[i].item() / dispensed * 100 if dispensed else None,
+                self.book_receipts[i].item() if book else None,
+                self.book_dispensed[i].item() if book else None,
+                self.variance[i].item() if book else None, ", ".join(marks))
+
+    def report(self, title=None) -> Report:
+        """Дни по резервуарам с итогом за период после каждого резервуара"""
+        def rows():
+            stops = np.append(np.flatnonzero(self.tank_ids[1:] != self.tank_ids[:-1]) + 1, len(self))
+            start = 0
+            for stop in stops.tolist():
+                for i in range(start, stop):
+                    yield ROW, (day_text(self.days[i]), self.tank_ids[i].item(), *self._values(i))
+                yield TOTAL, self._period(start, stop)
+                start = stop
+
+        return Report(title or "Баланс запасов по дням", BALANCE_COLUMNS, rows())
+
+    def _period(self, start, stop):
+        last = stop - 1
+        receipts, dispensed, loss = (float(column[start:stop].sum())
+                                     for column in (self.receipts, self.dispensed, self.loss))
+        book = not np.isnan(self.variance[start])
+        variance = float(self.variance[start:stop].sum()) if book else None
+        events = int(self.events[start:stop].sum())
+        alarms = int(self.alarms[start:stop].sum())
+        marks = ([f"отметок {events}"] if events else []) + ([f"дней сверх допуска {alarms}"] if alarms else [])
+        return (f"{day_text(self.days[start])} - {day_text(self.days[last])}", self.tank_ids[start].item(),
+                self.opening[start].item(), receipts, dispensed, self.closing[last].item(), loss,
+                loss / dispensed * 100 if dispensed else None,
+                float(self.book_receipts[start:stop].sum()) if book else None,
+                float(self.book_dispensed[start:stop].sum()) if book else None,
+                variance, ", ".join(marks))
+
+
+@timed('analytics.daily_balance')
+def daily_balance(series: StockSeries, journal=None, variance_liters=VARIANCE_LITERS,
+                  variance_share=VARIANCE_SHARE) -> DailyBalance:
+    """Суточный баланс ряда; journal - (tank_ids, timestamps, volumes) операций,
+    объем положительный для прихода и отрицательный для расхода
+
+    Допуск: variance_liters плюс variance_share от отпуска за сутки; сверх него -
+    потери по дрейфу, а при журнале и невязка по модулю. Операции журнала за сутки
+    без показаний резервуара в баланс не попадают.
+    """
+    days = local_days(series.timestamps)
+    boundary = np.ones(len(series), dtype=bool)
+    boundary[1:] = (series.tank_ids[1:] != series.tank_ids[:-1]) | (days[1:] != days[:-1])
+    starts = np.flatnonzero(boundary)
+    lasts = np.append(starts[1:], len(series)) - 1
+
+    balance = DailyBalance()
+    balance.tank_ids = series.tank_ids[starts]
+    balance.days = days[starts]
+    balance.opening = series.volumes15[starts] - series.deltas[starts]
+    balance.closing = series.volumes15[lasts]
+    balance.receipts, balance.dispensed, drift = (
+        np.add.reduceat(column, starts) if len(starts) else np.zeros(0)
+        for column in (series.receipts, series.dispensed, series.drift))
+    balance.loss = 0.0 - drift
+    events = (series.flags & ANOMALY_FLAGS) != 0
+    balance.events = np.add.reduceat(events.astype(np.int64), starts) if len(starts) else np.zeros(0, np.int64)
+
+    limit = variance_liters + variance_share * balance.dispensed
+    alarms = balance.loss > limit
+    balance.book_receipts = np.zeros(len(starts))
+    balance.book_dispensed = np.zeros(len(starts))
+    balance.variance = np.full(len(starts), np.nan)
+    if journal is not None:
+        _add_journal(balance, *journal)
+        balance.variance = balance.closing - (balance.opening + balance.book_receipts - balance.book_dispensed)
+        book_limit = variance_liters + variance_share * balance.book_dispensed
+        alarms |= np.abs(balance.variance) > book_limit
+    balance.alarms = alarms
+    return balance
+
+
+def _add_journal(balance, tank_ids, timestamps, volumes):
+    """Сложить операции журнала в строки баланса с тем же резервуаром и сутками"""
+    tank_ids = np.asarray(tank_ids, dtype=np.int64)
+    volumes = np.asarray(volumes, dtype=float)
+    if not len(volumes) or not len(balance):
+        return
+    days = local_days(timestamps)
+    keys = _day_keys(balance.tank_ids, balance.days)
+    order = np.argsort(keys, kind='stable')
+    journal_keys = _day_keys(tank_ids, days)
+    position = np.clip(np.searchsorted(keys[order], journal_keys), 0, len(keys) - 1)
+    rows = order[position]
+    matched = keys[rows] == journal_keys
+    np.add.at(balance.book_receipts, rows[matched], np.clip(volumes[matched], 0, None))
+    np.add.at(balance.book_dispensed, rows[matched], np.clip(-volumes[matched], 0, None))
+
+
+def _day_keys(tank_ids, days) -> np.ndarray:
+    return tank_ids * 1_000_000 + days
+
+
+def series_from_history(store, tanks, tank=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Массивы (tank_ids, timestamps, heights, densities) из HistoryStore для резервуаров tanks
+
+    Ручные объекты и неизвестные резервуары пропускаются; строки читаются блоками.
+    """
+    names = {str(number): number for number in tanks}
+    columns = [[], [], [], []]
+    readings = store.iter_readings(tank, start, end)
+    while True:
+        raw = list(islice(readings, chunk_size))
+        if not raw:
+            break
+        block = [(names[key], ts, height or 0, density) for ts, key, height, density, _, _ in raw if key in names]
+        if block:
+            for column, values in zip(columns, zip(*block)):
+                column.append(np.array(values))
+    dtypes = (np.int64, float, np.int64, float)
+    return tuple(np.concatenate(column) if column else np.zeros(0, dtype)
+                 for column, dtype in zip(columns, dtypes))
+
+
+def parse_time(text) -> float:
+    """Отметка времени: секунды эпохи или местное 'YYYY-MM-DD HH:MM[:SS]'"""
+    text = str(text).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"некорректное время {text!r}")
+
+
+def read_journal(stream):
+    """Журнал операций из CSV с колонками tank, ts, volume_l (приход +, расход -)
+    в виде (tank_ids, timestamps, volumes)
+    """
+    rows = [(int(row['tank']), parse_time(row['ts']), float(row['volume_l']))
+            for row in csv.DictReader(stream) if row.get('tank')]
+    dtypes = (np.int64, float, float)
+    if not rows:
+        return tuple(np.zeros(0, dtype) for dtype in dtypes)
+    return tuple(np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes))
+
@@ -0,0 +1,105 @@
+"""Сравнение CalibrationTable с прежним резервуаром на pandas.DataFrame
+
+Запуск: python benchmarks/bench_calibration_table.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from calibration import CalibrationTable
+
+TANKS = 8
+ROWS = 320
+QUERIES = 2000
+
+
+class DataFrameTank:
+    """Резервуар в прежнем виде: DataFrame и построчный поиск"""
+
+    def __init__(self, calibration_data: pd.DataFrame):
+        self.calibration_data = calibration_data
+        self.max_height_mm = calibration_data['height_mm'].max()
+
+    def get_volume(self, height) -> float:
+        if height <= 0 or self.calibration_data.empty:
+            return 0.0
+        elif height >= self.max_height_mm:
+            return round(self.calibration_data['liters'].iloc[-1], 1)
+
+        heights = self.calibration_data['height_mm'].values
+
+        exact_match = self.calibration_data[
+            self.calibration_data['height_mm'] == height
+        ]
+        if not exact_match.empty:
+            return round(exact_match['liters'].iloc[0], 1)
+
+        for i in range(len(heights) - 1):
+            if heights[i] < height < heights[i + 1]:
+                h1, h2 = heights[i], heights[i + 1]
+                v1 = self.calibration_data[
+                    self.calibration_data['height_mm'] == h1
+                ]['liters'].iloc[0]
+                v2 = self.calibration_data[
+                    self.calibration_data['height_mm'] == h2
+                ]['liters'].iloc[0]
+                return round(v1 + (v2 - v1) * (height - h1) / (h2 - h1), 1)
+
+        return 0.0
+
+
+def make_rows(seed):
+    rng = np.random.default_rng(seed)
+    heights = np.arange(ROWS) * 10.0
+    liters = np.cumsum(rng.uniform(10, 200, ROWS))
+    return list(zip(heights.tolist(), liters.tolist()))
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    tanks = [build(make_rows(seed)) for seed in range(TANKS)]
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tanks, elapsed, retained, peak
+
+
+def main():
+    df_tanks, df_build, df_mem, df_peak = measure(
+        lambda rows: DataFrameTank(pd.DataFrame(rows, columns=['height_mm', 'liters']))
+    )
+    tables, tb_build, tb_mem, tb_peak = measure(CalibrationTable.from_rows)
+
+    heights = np.random.default_rng(42).integers(-10, ROWS * 10 + 10, QUERIES)
+
+    start = time.perf_counter()
+    expected = [df_tanks[0].get_volume(int(h)) for h in heights]
+    df_scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar = [tables[0].volumes(int(h))[()] for h in heights]
+    tb_scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = tables[0].volumes(heights)
+    tb_batch = time.perf_counter() - start
+
+    assert scalar == expected and batch.tolist() == expected
+
+    print(f"{'':24}{'DataFrame':>14}{'CalibrationTable':>18}")
+    print(f"{'build 8 tanks, ms':24}{df_build * 1e3:14.2f}{tb_build * 1e3:18.2f}")
+    print(f"{'retained memory, KiB':24}{df_mem / 1024:14.1f}{tb_mem / 1024:18.1f}")
+    print(f"{'peak memory, KiB':24}{df_peak / 1024:14.1f}{tb_peak / 1024:18.1f}")
+    print(f"{'scalar lookup, us':24}{df_scalar / QUERIES * 1e6:14.2f}{tb_scalar / QUERIES * 1e6:18.2f}")
+    print(f"{'batch lookup, us':24}{'-':>14}{tb_batch / QUERIES * 1e6:18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Плотный индекс по миллиметрам против бинарного поиска: точка окупаемости
+
+Время включает построение индекса, поэтому при малом числе запросов
+выигрывает бинарный поиск. Запуск: python benchmarks/bench_dense_index.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from calibration import CalibrationTable
+
+MAX_HEIGHT_MM = 32000
+BATCHES = [1, 10, 100, 1000, 10000, 100000, 1000000]
+
+
+def make_table():
+    rng = np.random.default_rng(11)
+    heights = np.arange(0, MAX_HEIGHT_MM + 1, 10)
+    return heights, np.cumsum(rng.uniform(10, 200, len(heights)))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    heights, liters = make_table()
+    rng = np.random.default_rng(5)
+    crossover = None
+
+    print(f"{'queries':>10}{'search, ms':>14}{'dense, ms':>14}{'dense qps':>16}")
+    for batch in BATCHES:
+        queries = rng.integers(-10, MAX_HEIGHT_MM + 10, batch)
+
+        search_table = CalibrationTable(heights, liters)
+        expected, search_time = timed(lambda: search_table.volumes(queries))
+
+        dense_table = CalibrationTable(heights, liters)
+        result, dense_time = timed(lambda: dense_table.dense_volumes(queries))
+
+        assert np.array_equal(result, expected)
+        if crossover is None and dense_time < search_time:
+            crossover = batch
+        print(f"{batch:>10}{search_time * 1e3:>14.3f}{dense_time * 1e3:>14.3f}{batch / dense_time:>16,.0f}")
+
+    table = CalibrationTable(heights, liters)
+    table.dense_index()
+    queries = rng.integers(0, MAX_HEIGHT_MM, 1000)
+    _, scalar_search = timed(lambda: [table.volumes(int(h)) for h in queries])
+    _, scalar_dense = timed(lambda: [table.dense_volumes(int(h)) for h in queries])
+    print(f"scalar query, us: search {scalar_search * 1e3:.2f}, dense {scalar_dense * 1e3:.2f}")
+    print(f"index size: {table.dense_index().nbytes / 1024:.0f} KiB")
+    print(f"crossover (index build included): {crossover or '>' + str(BATCHES[-1])} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Масштабирование режима парка станций по числу процессов
+
+Запуск: python benchmarks/bench_fleet.py [станций] [показаний на станцию]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_workbook_loader import write_workbook
+from fleet import discover_stations, run_fleet
+
+
+def make_fleet(directory, stations, readings):
+    rng = random.Random(3)
+    write_workbook(os.path.join(directory, "template.xlsx"))
+    for index in range(stations):
+        station = f"station_{index:03d}"
+        shutil.copy(os.path.join(directory, "template.xlsx"), os.path.join(directory, station + ".xlsx"))
+        with open(os.path.join(directory, station + ".csv"), "w", encoding="utf-8") as f:
+            f.write("tank,height_mm,density\n")
+            for _ in range(readings):
+                f.write(f"{rng.randint(1, 8)},{rng.randint(0, 3300)},0.8{rng.randint(0, 9)}\n")
+    os.remove(os.path.join(directory, "template.xlsx"))
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    readings = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    cpus = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_fleet(tmp, stations, readings)
+        found = discover_stations(tmp)
+
+        baseline = None
+        reference = None
+        jobs = 1
+        while True:
+            for path in os.listdir(tmp):
+                if path.endswith(".fcal"):
+                    os.remove(os.path.join(tmp, path))
+            start = time.perf_counter()
+            _, totals = run_fleet(found, jobs)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            reference = reference or (totals.volume, totals.mass)
+            assert (totals.volume, totals.mass) == reference
+            print(f"jobs={jobs:3d}  {elapsed:8.2f} s  {stations * readings / elapsed:12,.0f} readings/s"
+                  f"  speedup {baseline / elapsed:5.2f}x")
+            if jobs >= cpus:
+                break
+            jobs = min(jobs * 2, cpus)
+
+
+if __name__ == "__main__":
+    main()
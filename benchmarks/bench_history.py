@@ -0,0 +1,59 @@
+"""История расчетов: запись 10^6 показаний и запросы по интервалам и дням
+
+Запуск: python benchmarks/bench_history.py [показаний]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from history import HistoryStore, day_of
+
+TANKS = ['1', '2', '3', '4', '5', '6', '7', '8', 'automobile', 'pipeline']
+YEAR = 365 * 24 * 3600
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    start_ts = 1.6e9
+    step = 3 * YEAR / (total / len(TANKS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.sqlite3"))
+
+        started = time.perf_counter()
+        calculation = []
+        for index in range(total // len(TANKS)):
+            ts = start_ts + index * step
+            calculation = [(ts, tank, index % 3000, 0.84, float(index % 3000) * 3, float(index % 3000) * 2.5)
+                           for tank in TANKS]
+            store.append(calculation)
+        enqueued = time.perf_counter() - started
+        store.flush(timeout=None)
+        written = time.perf_counter() - started
+
+        middle = start_ts + 1.5 * YEAR
+        started = time.perf_counter()
+        week = store.tank_range('3', middle, middle + 7 * 24 * 3600)
+        range_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        days = store.daily('3', day_of(middle), day_of(middle + YEAR))
+        daily_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        everything = store.daily()
+        all_daily_time = time.perf_counter() - started
+        store.close()
+
+    print(f"append (UI thread):        {enqueued:8.2f} s for {total:,} rows")
+    print(f"written to disk:           {written:8.2f} s ({total / written:,.0f} rows/s)")
+    print(f"tank week range:           {range_time * 1e3:8.2f} ms ({len(week)} rows)")
+    print(f"tank year of daily stats:  {daily_time * 1e3:8.2f} ms ({len(days)} days)")
+    print(f"all daily stats:           {all_daily_time * 1e3:8.2f} ms ({len(everything)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Линейная интерполяция против монотонного кубического сплайна
+
+Горизонтальный цилиндр с точным объемом: ошибка по шагу таблицы
+(наибольшая у дна и у верха, где профиль сильнее всего изогнут)
+и пропускная способность пакетного расчета.
+Запуск: python benchmarks/bench_interpolation.py
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from calibration import CalibrationTable
+
+DIAMETER_MM = 3200
+LENGTH_MM = 9000
+STEPS_MM = [10, 50, 100]
+QUERIES = 1000000
+
+
+def exact_liters(heights):
+    r = DIAMETER_MM / 2
+    h = np.clip(np.asarray(heights, dtype=float), 0, DIAMETER_MM)
+    area = r * r * np.arccos((r - h) / r) - (r - h) * np.sqrt(2 * r * h - h * h)
+    return area * LENGTH_MM / 1e6
+
+
+def best_of(func, repeat=5):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    queries = np.random.default_rng(3).uniform(0, DIAMETER_MM, QUERIES)
+    ends = np.concatenate([np.arange(1, 200), np.arange(DIAMETER_MM - 200, DIAMETER_MM)])
+    expected, expected_ends = exact_liters(queries), exact_liters(ends)
+
+    print(f"{'step, mm':>9}{'mode':>8}{'max err, l':>12}{'ends err, l':>13}{'rms err, l':>12}{'1e6, ms':>10}")
+    for step in STEPS_MM:
+        heights = np.arange(0, DIAMETER_MM + 1, step)
+        table = CalibrationTable(heights, np.round(exact_liters(heights), 3))
+        table.cubic_coefficients()
+        for mode, evaluate in (('linear', table.volumes), ('cubic', table.cubic_volumes)):
+            error = evaluate(queries) - expected
+            ends_error = np.abs(evaluate(ends) - expected_ends).max()
+            elapsed = best_of(lambda: evaluate(queries))
+            print(f"{step:>9}{mode:>8}{np.abs(error).max():>12.2f}{ends_error:>13.2f}"
+                  f"{np.sqrt(np.mean(error * error)):>12.3f}{elapsed * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
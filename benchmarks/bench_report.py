@@ -0,0 +1,49 @@
+"""Выгрузка истории за месяц в CSV, XLSX и PDF: время и пик памяти Python
+
+Пик памяти не должен расти с числом показаний - строки идут потоком.
+Запуск: python benchmarks/bench_report.py [показаний]
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from history import HistoryStore
+from report import export_report, find_font, history_report
+
+TANKS = ['1', '2', '3', '4', '5', '6', '7', '8']
+MONTH = 30 * 24 * 3600
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    formats = ['.csv', '.xlsx'] + (['.pdf'] if find_font() else [])
+    start_ts = time.time() - MONTH
+    step = MONTH / (total / len(TANKS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.sqlite3"))
+        store.append(
+            (start_ts + (index // len(TANKS)) * step, TANKS[index % len(TANKS)],
+             index % 3000, 0.84, float(index % 3000) * 3, float(index % 3000) * 2.52)
+            for index in range(total)
+        )
+        store.flush(timeout=None)
+
+        print(f"{'format':>8}{'s':>8}{'rows/s':>12}{'size, KiB':>12}{'max RSS, MiB':>14}")
+        for ext in formats:
+            path = os.path.join(tmp, "report" + ext)
+            started = time.perf_counter()
+            export_report(history_report(store), path)
+            elapsed = time.perf_counter() - started
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{ext:>8}{elapsed:>8.2f}{total / elapsed:>12,.0f}"
+                  f"{os.path.getsize(path) / 1024:>12,.0f}{rss:>14.1f}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Обмен между станциями: выгрузка пакетов и слияние в центральную базу
+
+Каждая станция - сутки показаний 8 резервуаров раз в минуту и 8 таблиц по 320 строк.
+Слияние повторяется, чтобы показать пропуск уже принятых пакетов по заголовку.
+Запуск: python benchmarks/bench_sync.py [станций]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from core import create_test_tank
+from history import HistoryStore
+from sync import export_bundle, import_directory, record_calibrations
+
+TANKS = 8
+MINUTES = 1440
+START = 1704067200.0
+
+
+def write_station(path, seed):
+    store = HistoryStore(path)
+    store.append((START + minute * 60, tank, 1000 + (minute * tank + seed) % 2000, 0.835,
+                  2800.0 + minute, 2338.0 + minute)
+                 for minute in range(MINUTES) for tank in range(1, TANKS + 1))
+    store.close()
+    record_calibrations(path, {tank: create_test_tank(tank).calibration for tank in range(1, TANKS + 1)})
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = os.path.join(tmp, 'outbox')
+        os.mkdir(outbox)
+        export = 0.0
+        for station in range(stations):
+            path = os.path.join(tmp, f'station{station}.sqlite3')
+            write_station(path, station)
+            start = time.perf_counter()
+            export_bundle(path, outbox, station=f'azs-{station:03d}')
+            export += time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(outbox, name)) for name in os.listdir(outbox))
+        rows = stations * MINUTES * TANKS
+        print(f"станций: {stations}, показаний: {rows:,}, пакеты: {size / 1024:.0f} КиБ "
+              f"({size / rows:.1f} байт на показание), выгрузка: {export / stations * 1e3:.1f} мс на станцию")
+
+        central = os.path.join(tmp, 'central.sqlite3')
+        for attempt in ('первый прием', 'повтор'):
+            start = time.perf_counter()
+            summary = import_directory(central, outbox)
+            elapsed = time.perf_counter() - start
+            print(f"{attempt}: {elapsed:.2f} с ({summary.rows / elapsed / 1e3:.0f} тыс. показаний/с) - "
+                  f"{summary.summary()}")
+        db = sqlite3.connect(central)
+        print(f"в центральной базе: {db.execute('SELECT count(*) FROM readings').fetchone()[0]:,} показаний")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
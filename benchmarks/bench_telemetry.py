@@ -0,0 +1,47 @@
+"""Пропускная способность приема показаний уровнемеров
+
+Несколько имитаторов шлют строки без ограничения скорости; очередь
+ограничена, поэтому скорость задает сервис, а имитаторы ждут в drain().
+Запуск: python benchmarks/bench_telemetry.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from core import create_test_tank
+from telemetry import TelemetryService, simulate_gauge
+
+GAUGES = 8
+READINGS_PER_GAUGE = 50000
+
+
+def main():
+    tanks = {num: create_test_tank(num) for num in range(1, 9)}
+    max_heights = {num: int(tank.max_height_mm) for num, tank in tanks.items()}
+    batches = []
+    service = TelemetryService(tanks, lambda chunk: batches.append(len(chunk[0])), port=0, queue_size=5000)
+    service.start()
+
+    async def run_gauges():
+        return await asyncio.gather(*(
+            simulate_gauge(service.host, service.port, max_heights, READINGS_PER_GAUGE, seed=gauge)
+            for gauge in range(GAUGES)
+        ))
+
+    start = time.perf_counter()
+    sent = sum(asyncio.run(run_gauges()))
+    while service.processed + service.errors < sent:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    service.stop()
+
+    print(f"sent {sent:,}, processed {service.processed:,}, errors {service.errors}")
+    print(f"throughput: {sent / elapsed:,.0f} readings/s over {elapsed:.2f} s")
+    print(f"batches: {len(batches)}, mean size {sum(batches) / len(batches):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Время загрузки резерв.xlsx: pandas + iloc, потоковое чтение и бинарный кэш;
+книга с листом на резервуар: разбор раскладки против чтения всех листов
+
+Запуск: python benchmarks/bench_workbook_loader.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from calibration_cache import load_cached_tables
+from workbook import load_calibration_tables, open_workbook_tables
+
+TANKS = 8
+ROWS = 340
+REPEAT = 5
+SHEET_ROWS = 4000
+
+
+def write_workbook(path):
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(7)
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Градуировочные таблицы"])
+    sheet.append(sum([["см", "л", ""] for _ in range(TANKS)], []))
+    for row in range(ROWS):
+        values = []
+        for tank in range(TANKS):
+            liters = float(round(row * (30 + tank) + rng.uniform(0, 5), 3))
+            cell = [row, liters, None]
+            if tank == 2 and row % 37 == 0:
+                cell[1] = None
+            if tank == 3 and row % 53 == 0:
+                cell[0] = "н/д"
+            values.extend(cell)
+        sheet.append(values)
+    workbook.save(path)
+
+
+def write_sheet_per_tank_workbook(path, tanks=TANKS, rows=SHEET_ROWS):
+    """Лист на резервуар, таблица через 1 мм"""
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for tank in range(1, tanks + 1):
+        sheet = workbook.create_sheet(f"Резервуар {tank}")
+        sheet.append(["Высота, мм", "Объем, л"])
+        for height in range(rows):
+            sheet.append([height, round(height * (2.5 + tank * 0.1), 3)])
+    workbook.save(path)
+
+
+def load_with_pandas(file_path):
+    """Прежний разбор: pd.read_excel и iloc по каждой ячейке"""
+    import pandas as pd
+
+    df_raw = pd.read_excel(file_path, header=None)
+    tables = {}
+    for tank_num in range(1, TANKS + 1):
+        col_offset = (tank_num - 1) * 3
+        if col_offset + 1 >= df_raw.shape[1]:
+            continue
+        tank_data = []
+        for row in range(2, min(len(df_raw), 322)):
+            try:
+                cm_val = df_raw.iloc[row, col_offset]
+                liters_val = df_raw.iloc[row, col_offset + 1]
+                if pd.isna(cm_val) or pd.isna(liters_val):
+                    continue
+                tank_data.append((float(cm_val) * 10, float(liters_val)))
+            except:
+                continue
+        if tank_data:
+            tables[tank_num] = tank_data
+    return tables
+
+
+def best_of(func, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "резерв.xlsx")
+        write_workbook(path)
+
+        expected, legacy_time = best_of(load_with_pandas, path)
+        tables, stream_time = best_of(load_calibration_tables, path)
+        load_cached_tables(path)
+        cached, cache_time = best_of(load_cached_tables, path)
+
+        sheets_path = os.path.join(tmp, "листы.xlsx")
+        write_sheet_per_tank_workbook(sheets_path)
+        layout, scan_time = best_of(open_workbook_tables, sheets_path)
+        sheets, sheets_time = best_of(load_calibration_tables, sheets_path)
+
+    # прежний разбор читал строки только до 322-й
+    assert sorted(expected) == sorted(tables)
+    for tank_num, rows in expected.items():
+        heights, liters = np.array(rows).T
+        assert np.array_equal(tables[tank_num].heights[:len(heights)], heights)
+        assert np.array_equal(tables[tank_num].liters[:len(liters)], liters)
+        assert np.array_equal(cached[tank_num].heights, tables[tank_num].heights)
+        assert np.array_equal(cached[tank_num].liters, tables[tank_num].liters)
+    assert sorted(layout) == sorted(sheets) and all(len(table) == SHEET_ROWS for table in sheets.values())
+
+    print(f"pandas + iloc:     {legacy_time * 1e3:8.1f} ms")
+    print(f"streaming loader:  {stream_time * 1e3:8.1f} ms")
+    print(f"binary cache:      {cache_time * 1e3:8.1f} ms")
+    print(f"speedup:           {legacy_time / stream_time:8.1f}x / {legacy_time / cache_time:.0f}x")
+    print(f"{TANKS} листов по {SHEET_ROWS} строк: раскладка {scan_time * 1e3:.1f} ms, "
+          f"все листы {sheets_time * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,788 @@
+"""Замеры и проверки расчетного ядра без Kivy и дисплея
+
+    python benchmarks/run.py                          # JSON в stdout
+    python benchmarks/run.py -o baseline.json
+    python benchmarks/run.py --baseline baseline.json --tolerance 0.3
+
+Код выхода 1, если провалена проверка точности или какой-либо замер
+хуже базового больше чем на tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from calibration import CalibrationTable
+from core import (INTERPOLATION_MODES, CalculationModel, FuelTank, ManualStorage, create_test_tank,
+                  plan_delivery)
+from density import PRODUCTS, correct
+
+REPEAT = 5
+
+# Значения получены прежней реализацией FuelTank на pandas.DataFrame:
+# (высота, мм, плотность) -> (объем, л; масса, кг).
+PINNED = {
+    'test_tank_5': [
+        (0, 0.74, 0.0, 0.0), (1, 0.74, 2.8, 2.1), (333, 0.74, 932.4, 690.0),
+        (999, 0.74, 2797.2, 2069.9), (1000, 0.74, 2800.0, 2072.0), (1001, 0.74, 2802.8, 2074.1),
+        (15555, 0.74, 43554.0, 32230.0), (31999, 0.74, 89597.2, 66301.9),
+        (32000, 0.74, 89600.0, 66304.0), (40000, 0.74, 89600.0, 66304.0),
+    ],
+    'cylinder': [
+        (-5, 0.835, 0.0, 0.0), (0, 0.835, 0.0, 0.0), (1, 0.835, 2.1, 1.8), (5, 0.835, 10.7, 8.9),
+        (7, 0.835, 15.0, 12.5), (15, 0.835, 41.0, 34.2), (1234, 0.835, 25743.1, 21495.5),
+        (1235, 0.835, 25771.1, 21518.9), (1600, 0.835, 36191.1, 30219.6),
+        (3189, 0.835, 72356.9, 60418.0), (3190, 0.835, 72360.8, 60421.3),
+        (3191, 0.835, 72360.8, 60421.3), (5000, 0.835, 72360.8, 60421.3),
+    ],
+    'half_even': [
+        (1, 0.85, 0.2, 0.2), (3, 0.85, 0.4, 0.3), (5, 0.85, 0.8, 0.7),
+        (11, 0.85, 1.6, 1.4), (15, 0.85, 2.0, 1.7),
+    ],
+}
+
+# VCF по формулам API MPMS 11.1 при внедрении density.py:
+# (продукт, плотность при 15 °C кг/м3, температура, VCF до 4 знаков).
+VCF_PINNED = [
+    ('products', 840.0, 25.0, 0.9915), ('products', 840.0, -10.0, 1.021),
+    ('products', 740.0, 30.0, 0.9815), ('crude', 870.0, 40.0, 0.9796),
+]
+
+
+def cylinder_rows(diameter_mm=3200, length_mm=9000, step_mm=10):
+    """Горизонтальный цилиндр: по умолчанию 320 строк через 1 см, как в резерв.xlsx"""
+    r = diameter_mm / 2
+    rows = []
+    for h in range(0, diameter_mm, step_mm):
+        area = r * r * math.acos((r - h) / r) - (r - h) * math.sqrt(2 * r * h - h * h)
+        rows.append((h, round(area * length_mm / 1e6, 3)))
+    return rows
+
+
+def pinned_tanks():
+    return {
+        'test_tank_5': create_test_tank(5),
+        'cylinder': FuelTank(1, CalibrationTable.from_rows(cylinder_rows())),
+        'half_even': FuelTank(1, CalibrationTable([0.0, 10.0, 20.0], [0.0, 1.5, 2.5])),
+    }
+
+
+def best_of(func, repeat=REPEAT):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_kib(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def check_pinned():
+    failures = []
+    for name, tank in pinned_tanks().items():
+        for height, density, volume, mass in PINNED[name]:
+            tank.set_height(height)
+            tank.set_density(density)
+            got = (float(tank.get_volume()), float(tank.get_mass()))
+            if got != (volume, mass):
+                failures.append(f"{name} h={height}: {got} != {(volume, mass)}")
+    return failures
+
+
+def check_density():
+    failures = []
+    for product, rho15, temperature, expected in VCF_PINNED:
+        vcf = round(float(PRODUCTS[product].vcf(rho15, temperature)), 4)
+        if vcf != expected:
+            failures.append(f"vcf {product} {rho15}@{temperature}: {vcf} != {expected}")
+    volume15, mass = correct(10000.0, 0.84, 25.0)
+    observed = correct(10000.0, 0.8331, 25.0, density_temperature=None)[1]
+    if (float(volume15), float(mass), float(observed)) != (9915.4, 8328.9, 8331.0):
+        failures.append(f"correct: {(volume15, mass, observed)}")
+    return failures
+
+
+def check_model_totals():
+    tanks = {num: create_test_tank(num) for num in range(1, 9)}
+    storages = {'automobile': ManualStorage("🚗 Автомобиль")}
+    model = CalculationModel(tanks, storages)
+    rng = np.random.default_rng(7)
+    for _ in range(2000):
+        num = int(rng.integers(1, 9))
+        model.update_tank(num, int(rng.integers(0, 32000)), float(rng.uniform(0.7, 0.9)))
+        model.update_storage('automobile', float(rng.uniform(0, 100)), float(rng.uniform(0.7, 0.9)))
+    expected = (math.fsum(entry.volume for entry in model.entries.values()),
+                math.fsum(entry.mass for entry in model.entries.values()))
+    if (model.totals.volume, model.totals.mass) != tuple(round(value, 1) for value in expected):
+        return [f"model totals {model.totals.volume}, {model.totals.mass} != sum of entries {expected}"]
+    for num in tanks:
+        model.update_tank(num, 0, 0.85)
+    model.update_storage('automobile', 0.0, 0.85)
+    totals = (model.totals.volume, model.totals.mass, model.totals.average_density)
+    if totals != (0.0, 0.0, 0.0):
+        return [f"model totals after reset to zero: {totals}"]
+    return []
+
+
+def check_cli_workbook():
+    """Пакетные команды без файла таблиц завершаются ошибкой, а не считают по тестовым данным"""
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        readings = os.path.join(tmp, 'readings.csv')
+        with open(readings, 'w', encoding='utf-8') as f:
+            f.write("tank,height_mm,density\n1,1500,0.84\n2,1800,0.84\n")
+        missing = os.path.join(tmp, 'missing.xlsx')
+        for command in (['volumes', '-w', missing, readings, '--summary'],
+                        ['plan', '-w', missing, '--receipt', '1:1500:1000']):
+            done = subprocess.run([sys.executable, os.path.join(ROOT, 'cli.py'), *command],
+                                  cwd=tmp, capture_output=True, text=True)
+            if done.returncode == 0 or done.stdout.strip():
+                failures.append(f"cli {command[0]} with missing workbook: exit {done.returncode}, "
+                                f"output {done.stdout[:80]!r}")
+    return failures
+
+
+def check_engines():
+    tank = pinned_tanks()['cylinder']
+    heights = np.random.default_rng(0).integers(-20, 3300, 10000)
+    batch = tank.volumes_for_heights(heights)
+    scalar = []
+    for height in heights[:2000].tolist():
+        tank.set_height(height)
+        scalar.append(tank.get_volume())
+    tank.set_lookup('dense')
+    dense = tank.volumes_for_heights(heights)
+    failures = []
+    if batch[:2000].tolist() != scalar:
+        failures.append("batch != scalar")
+    if not np.array_equal(batch, dense):
+        failures.append("dense != batch")
+
+    table = tank.calibration
+    slope = np.max(np.diff(table.liters) / np.diff(table.heights))
+    targets = np.random.default_rng(4).uniform(0, table.top_liters, 10000)
+    for mode in ('linear', 'cubic'):
+        tank.set_interpolation(mode)
+        error = np.abs(tank.volumes_for_heights(tank.heights_for_volumes(targets)) - targets).max()
+        if error > slope * 0.05 + 0.05:
+            failures.append(f"{mode} inverse round trip error {error:.2f} l")
+    tank.set_interpolation('linear')
+    return failures
+
+
+def check_decimation():
+    table = CalibrationTable.from_rows(cylinder_rows(step_mm=1))
+    failures = []
+    for tolerance in (0.01, 0.1, 1.0):
+        decimated = table.decimated(tolerance)
+        heights = np.random.default_rng(5).uniform(-10, table.max_height_mm + 10, 20000)
+        error = np.abs(np.interp(heights, decimated.heights, decimated.liters)
+                       - np.interp(heights, table.heights, table.liters)).max()
+        if error > tolerance + 1e-9 or decimated.decimation.max_error > tolerance + 1e-9:
+            failures.append(f"decimate {tolerance}: error {error:.4f} l")
+        if decimated.heights[-1] != table.heights[-1] or decimated.max_height_mm != table.max_height_mm:
+            failures.append(f"decimate {tolerance}: top row lost")
+    if table.decimated(0.1).decimation.ratio < 4:
+        failures.append("decimate 0.1: cylinder ratio below 4")
+    return failures + check_decimation_cache()
+
+
+def check_empty_block():
+    """Пустой блок в книге из нескольких листов: тестовые данные в приложении и пропуск
+    в пакетном режиме - как в книге из одного листа, с кэшем и без
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return []
+    from core import load_tanks
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "резерв.xlsx")
+        workbook = Workbook()
+        workbook.active.title = "Резервуар 1"
+        workbook.create_sheet("Резервуар 2").append(["Резервуар 2, мм"])
+        for mm in range(0, 3000, 10):
+            workbook.active.append([mm, mm * 3.0])
+        workbook.save(path)
+        for attempt in ('lazy', 'cached'):
+            tanks = load_tanks(path)
+            volume = tanks[2].volumes_for_heights(1000)[()]
+            if tanks[2].source is not None or volume != create_test_tank(2).volumes_for_heights(1000)[()]:
+                failures.append(f"empty block {attempt}: tank 2 gives {volume} l instead of test data")
+            if 2 in load_tanks(path, fallback=False):
+                failures.append(f"empty block {attempt}: tank 2 kept without fallback")
+    return failures
+
+
+def check_fleet_config():
+    """Станции парка с разными наборами резервуаров: у каждой свой <станция>.tanks.json,
+    tanks.json текущего каталога не подхватывается
+    """
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return []
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_workbook_loader import write_workbook
+    from fleet import discover_stations, run_fleet
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for station in ('a', 'b'):
+            write_workbook(os.path.join(tmp, station + '.xlsx'))
+            with open(os.path.join(tmp, station + '.csv'), 'w', encoding='utf-8') as f:
+                f.write("tank,height_mm,density\n" + "".join(f"{tank},1500,0.84\n" for tank in range(1, 5)))
+        with open(os.path.join(tmp, 'a.tanks.json'), 'w', encoding='utf-8') as f:
+            json.dump({'tanks': [{'number': 1}, {'number': 2}]}, f)
+        with open(os.path.join(tmp, 'tanks.json'), 'w', encoding='utf-8') as f:
+            json.dump({'count': 1}, f)
+        os.chdir(tmp)
+        try:
+            results, _ = run_fleet(discover_stations(tmp), jobs=1)
+        finally:
+            os.chdir(cwd)
+    found = {result.station: (result.readings, result.errors, result.failure) for result in results}
+    if found != {'a': (2, 2, None), 'b': (4, 0, None)}:
+        return [f"fleet: per-station tank sets not applied: {found}"]
+    return []
+
+
+def check_decimation_cache():
+    """Прореживание по допускам из конфигурации сохраняется в кэше таблиц; без допусков - полные таблицы"""
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return []
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_workbook_loader import write_workbook
+    from calibration_cache import load_cached_tables
+    from workbook import load_calibration_tables
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "резерв.xlsx")
+        write_workbook(path)
+        full = load_calibration_tables(path)
+        for attempt in ('build', 'cached'):
+            tables = load_cached_tables(path, tolerances={1: 0.5})
+            report = tables[1].decimation
+            if report is None or report.rows != len(full[1]) or len(tables[1]) != report.kept:
+                failures.append(f"decimation cache {attempt}: tank 1 not decimated")
+            if tables[2].decimation is not None or len(tables[2]) != len(full[2]):
+                failures.append(f"decimation cache {attempt}: tank 2 decimated without tolerance")
+        if len(load_cached_tables(path)[1]) != len(full[1]):
+            failures.append("decimation cache: tolerance change did not rebuild the cache")
+    return failures
+
+
+def bench_decimation(metrics):
+    table = CalibrationTable.from_rows(cylinder_rows(step_mm=1))
+    metrics['calibration.decimate_cylinder_1mm'] = (best_of(lambda: table.decimated(0.1)) * 1e3, 'ms')
+    metrics['calibration.decimated_rows'] = (len(table.decimated(0.1)), 'rows')
+
+
+def bench_lookups(metrics):
+    for name, tank in (('test_tank', create_test_tank(1)), ('cylinder', pinned_tanks()['cylinder'])):
+        heights = np.random.default_rng(1).integers(0, int(tank.max_height_mm) + 10, 1000).tolist()
+
+        def scalar():
+            for height in heights:
+                tank.set_height(height)
+                tank.get_volume()
+
+        metrics[f'{name}.scalar_lookup'] = (best_of(scalar) / len(heights) * 1e6, 'us')
+
+        batch = np.random.default_rng(2).integers(0, int(tank.max_height_mm) + 10, 1000000)
+        metrics[f'{name}.batch_lookup_1e6'] = (best_of(lambda: tank.volumes_for_heights(batch)) * 1e3, 'ms')
+        metrics[f'{name}.batch_lookup_1e6_peak'] = (peak_kib(lambda: tank.volumes_for_heights(batch)), 'KiB')
+
+        tank.set_lookup('dense')
+        tank.volumes_for_heights(batch[:1])
+        metrics[f'{name}.dense_lookup_1e6'] = (best_of(lambda: tank.volumes_for_heights(batch)) * 1e3, 'ms')
+        tank.set_lookup('search')
+
+        tank.set_interpolation('cubic')
+        metrics[f'{name}.cubic_lookup_1e6'] = (best_of(lambda: tank.volumes_for_heights(batch)) * 1e3, 'ms')
+        tank.set_interpolation('linear')
+
+        targets = tank.volumes_for_heights(batch)
+        metrics[f'{name}.inverse_lookup_1e6'] = (best_of(lambda: tank.heights_for_volumes(targets)) * 1e3, 'ms')
+
+
+def bench_model(metrics):
+    tanks = {num: create_test_tank(num) for num in range(1, 9)}
+    storages = {'automobile': ManualStorage("🚗 Автомобиль"), 'pipeline': ManualStorage("🔧 Трубопровод")}
+    state = {'height': 0}
+
+    def full_pass():
+        model = CalculationModel(tanks, storages)
+        for num in tanks:
+            model.update_tank(num, 12345 + num, 0.85)
+        for key in storages:
+            model.update_storage(key, 100.0, 0.85)
+
+    model = CalculationModel(tanks, storages)
+
+    def incremental_pass():
+        state['height'] += 1
+        for num in tanks:
+            model.update_tank(num, 12345 + num if num != 3 else state['height'], 0.85)
+        for key in storages:
+            model.update_storage(key, 100.0, 0.85)
+
+    heights = {num: 12345 for num in tanks}
+    receipts = {num: 5000.0 for num in tanks}
+    metrics['plan.delivery_8_tanks'] = (best_of(lambda: plan_delivery(tanks, heights, receipts), 50) * 1e6, 'us')
+    metrics['model.full_pass'] = (best_of(full_pass, 50) * 1e6, 'us')
+    metrics['model.incremental_pass'] = (best_of(incremental_pass, 50) * 1e6, 'us')
+
+
+def analytics_series():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_analytics import synthetic_series
+
+    return synthetic_series(30, leak_day=15)
+
+
+def bench_analytics(metrics):
+    from analytics import analyze, daily_balance
+
+    fleet, tank_ids, stamps, heights, densities, journal = analytics_series()
+
+    def month():
+        daily_balance(analyze(tank_ids, stamps, heights, densities, fleet), journal)
+
+    metrics['analytics.month_8_tanks'] = (best_of(month) * 1e3, 'ms')
+
+
+def check_analytics():
+    from analytics import FLAG_LOSS, analyze, daily_balance
+    from bench_analytics import LEAK_TANK, START
+
+    fleet, tank_ids, stamps, heights, densities, journal = analytics_series()
+    series = analyze(tank_ids[::-1], stamps[::-1], heights[::-1], densities[::-1], fleet)
+    balance = daily_balance(series, journal)
+    failures = []
+    if not np.allclose(series.receipts - series.dispensed + series.drift, series.deltas):
+        failures.append("analytics: deltas != receipts - dispensed + drift")
+    if not np.allclose(balance.opening - balance.loss + balance.receipts - balance.dispensed, balance.closing):
+        failures.append("analytics: daily balance does not close")
+    flagged = series.flags & FLAG_LOSS != 0
+    leak = flagged & (series.tank_ids == LEAK_TANK)
+    if np.any(flagged & ~leak) or not leak.any() or series.timestamps[leak].min() < START + 14 * 86400:
+        failures.append("analytics: leak detection mismatch")
+    return failures
+
+
+def parse_pdf(data: bytes) -> dict:
+    """Объекты PDF по таблице xref: {номер: (словарь, распакованный поток или None)}
+
+    Смещения xref и startxref проверяются: по каждому должен начинаться свой объект.
+    """
+    import re
+    import zlib
+
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    if not data.startswith(b'xref\n', xref):
+        raise ValueError(f"startxref {xref} does not point at xref")
+    first, count = map(int, data[xref:].split(b'\n', 2)[1].split())
+    entries = data[xref:].split(b'\n', 2)[2].splitlines()[:count]
+    objects = {}
+    for number, entry in enumerate(entries[1:], first + 1):
+        offset = int(entry[:10])
+        header = f'{number} 0 obj\n'.encode('ascii')
+        if not data.startswith(header, offset):
+            raise ValueError(f"xref offset {offset} of object {number} points at {data[offset:offset + 12]!r}")
+        body = data[offset + len(header):data.index(b'\nendobj\n', offset)]
+        stream = None
+        if b'\nstream\n' in body:
+            body, raw = body.split(b'\nstream\n', 1)
+            length = int(re.search(rb'/Length (\d+)', body).group(1))
+            stream = zlib.decompress(raw[:length])
+        objects[number] = (body.decode('latin-1'), stream)
+    return objects
+
+
+def font_outlines(data: bytes, glyphs) -> dict:
+    """Контуры глифов TrueType по loca/glyf: {номер глифа: байты}"""
+    import struct
+
+    tables = {}
+    for i in range(struct.unpack_from('>H', data, 4)[0]):
+        tag, _, offset, _ = struct.unpack_from('>4sIII', data, 12 + 16 * i)
+        tables[tag] = offset
+    long_loca = struct.unpack_from('>h', data, tables[b'head'] + 50)[0]
+    outlines = {}
+    for glyph in glyphs:
+        if long_loca:
+            start, end = struct.unpack_from('>II', data, tables[b'loca'] + 4 * glyph)
+        else:
+            start, end = (2 * value for value in struct.unpack_from('>HH', data, tables[b'loca'] + 2 * glyph))
+        outlines[glyph] = data[tables[b'glyf'] + start:tables[b'glyf'] + end].rstrip(b'\0')
+    return outlines
+
+
+def check_pdf():
+    """PDF отчета разбирается обратно: xref, текст через ToUnicode, подмножество шрифта"""
+    import io
+    import re
+    import struct
+
+    from report import RESULT_COLUMNS, ROW, TOTAL, Report, TrueTypeFont, find_font, write_pdf
+
+    font_path = find_font()
+    if font_path is None:
+        return []
+    names = [f"Резервуар {num}" for num in range(1, 121)]
+    rows = [(ROW, (name, 1500, 0.84, 4500.0, 3780.0)) for name in names + ["🚗 Автомобиль"]]
+    report = Report("Проверка отчета, объём", RESULT_COLUMNS, rows + [(TOTAL, ("ИТОГО", None, 0.84, 1.0, 2.0))])
+    target = io.BytesIO()
+    write_pdf(report, target, font_path)
+    try:
+        objects = parse_pdf(target.getvalue())
+    except (ValueError, AttributeError) as e:
+        return [f"pdf: {e}"]
+
+    def find(pattern):
+        return [(number, match) for number, (body, _) in objects.items()
+                for match in [re.search(pattern, body)] if match]
+
+    failures = []
+    pages = find(r'/Type /Page .*/Contents (\d+) 0 R')
+    (_, to_unicode), = find(r'/Subtype /Type0 .*/ToUnicode (\d+) 0 R')
+    (font_file, _), = find(r'/Length1 \d+')
+    cmap = dict(re.findall(r'<([0-9A-F]{4})> <([0-9A-F]{4})>',
+                           objects[int(to_unicode.group(1))][1].decode('ascii')))
+    text = set()
+    for _, contents in pages:
+        for codes in re.findall(rb'<([0-9A-F]*)> Tj', objects[int(contents.group(1))][1]):
+            codes = codes.decode('ascii')
+            text.add(''.join(chr(int(cmap[codes[i:i + 4]], 16)) for i in range(0, len(codes), 4)).strip())
+    expected = {*names, "Автомобиль", "ИТОГО", "Проверка отчета, объём - стр. 1", "Масса, кг", "4500.0"}
+    if not expected <= text:
+        failures.append(f"pdf text via ToUnicode: missing {sorted(expected - text)[:5]}")
+    if len(pages) < 2:
+        failures.append(f"pdf: {len(pages)} pages for {len(rows)} rows")
+
+    font = TrueTypeFont(font_path)
+    embedded = objects[font_file][1]
+    if len(embedded) > len(font.data) // 4:
+        failures.append(f"pdf: embedded font {len(embedded)} bytes of {len(font.data)}, not a subset")
+    padded = embedded + bytes(-len(embedded) % 4)
+    if sum(struct.unpack(f'>{len(padded) // 4}I', padded)) & 0xFFFFFFFF != 0xB1B0AFBA:
+        failures.append("pdf: embedded font checksum adjustment is wrong")
+    if 'glyf' in font.tables:
+        # составные глифы (ё, Й) ссылаются на другие: те тоже должны попасть в подмножество
+        used = [int(code, 16) for code in cmap]
+        kept = {glyph: outline for glyph, outline in font_outlines(embedded, range(len(font.advances))).items()
+                if outline}
+        if font_outlines(embedded, used) != font_outlines(font.data, used):
+            failures.append("pdf: outlines of used glyphs differ from the original font")
+        elif kept != font_outlines(font.data, kept) or len(kept) <= len(used):
+            failures.append(f"pdf: subset keeps {len(kept)} glyphs for {len(used)} used, components missing")
+    return failures
+
+
+def check_history_writer():
+    """Ошибка записи пакета не останавливает поток записи и не вешает flush"""
+    import sqlite3
+
+    import history
+
+    def broken(db, rows):
+        raise sqlite3.OperationalError("database or disk is full")
+
+    failures = []
+    rows = [(1704067200.0 + minute * 60, 1, 1500, 0.84, 2800.0, 2352.0) for minute in range(10)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = history.HistoryStore(os.path.join(tmp, 'history.sqlite3'))
+        history.log.disabled = True
+        try:
+            store._write = broken
+            store.append(rows)
+            if not store.flush(timeout=5):
+                failures.append("history flush did not return after a failed batch")
+            del store._write
+            store.append(rows[:3])
+            if not store.flush(timeout=5):
+                failures.append("history flush did not return after recovery")
+        finally:
+            history.log.disabled = False
+            store.close()
+        written = len(store.tank_range(1))
+        if (store.dropped, written) != (10, 3):
+            failures.append(f"history after a failed batch: dropped {store.dropped}, written {written}")
+    return failures
+
+
+def check_profile_scope():
+    """profile_next при выключенных замерах включает их на один вызов, журнал - по заданному пути"""
+    from instrumentation import Timings
+
+    probe = Timings()
+    probe.disable()
+
+    @probe.timed('probe')
+    def work():
+        return sum(range(1000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        probe.profile_next('probe', os.path.join(tmp, 'timings.log'))
+        work()
+        work()
+        logged = sorted(os.listdir(tmp))
+        for handler in probe._logger.handlers[:]:
+            probe._logger.removeHandler(handler)
+            handler.close()
+    if probe.enabled or probe.histograms['probe'].count != 1 or 'timings.log' not in logged:
+        return [f"profile_next: enabled {probe.enabled}, files {logged}"]
+    return []
+
+
+def check_results_cache():
+    from results_cache import ResultsCache
+
+    tank = pinned_tanks()['cylinder']
+    heights = np.random.default_rng(6).integers(-20, 3300, 3000).tolist()
+    expected = {}
+    for mode in INTERPOLATION_MODES:
+        tank.set_interpolation(mode)
+        for height in heights:
+            tank.set_height(height)
+            expected[mode, height] = tank.get_volume()
+
+    failures = []
+    cache = ResultsCache(max_entries=1000)
+    tank.results_cache = cache
+    for mode in INTERPOLATION_MODES * 2:
+        tank.set_interpolation(mode)
+        for height in heights:
+            tank.set_height(height)
+            if tank.get_volume() != expected[mode, height]:
+                failures.append(f"results cache {mode} h={height}: {tank.get_volume()} != {expected[mode, height]}")
+                break
+    if len(cache) != 1000 or not cache.evictions or not cache.hits:
+        failures.append(f"results cache bound: {cache.summary()}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results_cache.json')
+        cache.save(path)
+        restored = ResultsCache(max_entries=1000)
+        if restored.load(path) != 1000 or list(restored.entries.items()) != list(cache.entries.items()):
+            failures.append("results cache: save/load round trip")
+    tank.decimate(1.0)
+    if cache.retain({1: tank.calibration_key}) != 1000 or len(cache):
+        failures.append("results cache: entries of the replaced table kept")
+    return failures
+
+
+def bench_results_cache(metrics):
+    from results_cache import ResultsCache
+
+    tank = create_test_tank(5)
+    tank.results_cache = ResultsCache()
+    heights = list(range(1000, 33000, 32))
+
+    def dip():
+        for height in heights:
+            tank.set_height(height)
+            tank.get_volume()
+
+    dip()
+    metrics['results_cache.hit'] = (best_of(dip) / len(heights) * 1e6, 'us')
+
+
+def sync_outbox(tmp, stations):
+    """Каталог пакетов станций из bench_sync и повторная выгрузка первой станции с перекрытием"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_sync import write_station
+    from sync import export_bundle
+
+    outbox = os.path.join(tmp, 'outbox')
+    os.mkdir(outbox)
+    for station in range(stations):
+        path = os.path.join(tmp, f'station{station}.sqlite3')
+        write_station(path, station)
+        export_bundle(path, outbox, station=f'azs-{station}')
+    export_bundle(os.path.join(tmp, 'station0.sqlite3'), outbox, since=(5000, 4))
+    return outbox
+
+
+def check_sync():
+    import sqlite3
+
+    from bench_sync import MINUTES, TANKS
+    from sync import import_directory, record_calibrations
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = sync_outbox(tmp, 2)
+        central = os.path.join(tmp, 'central.sqlite3')
+        decimated = {1: create_test_tank(1).calibration.decimated(0.1)}
+        if record_calibrations(os.path.join(tmp, 'station0.sqlite3'), decimated):
+            failures.append("sync: decimated table recorded as a calibration version")
+        first = import_directory(central, outbox)
+        again = import_directory(central, outbox)
+        db = sqlite3.connect(central)
+        rows, count = db.execute('SELECT count(*), (SELECT sum(count) FROM daily) FROM readings').fetchone()
+        versions = db.execute('SELECT count(*) FROM calibrations').fetchone()[0]
+        db.close()
+    if (rows, count, versions) != (2 * MINUTES * TANKS, 2 * MINUTES * TANKS, 2 * TANKS) or first.failures:
+        failures.append(f"sync: {rows} rows, {count} in daily, {versions} versions after import")
+    if again.rows or again.versions or again.skipped != first.bundles + first.skipped:
+        failures.append(f"sync: repeated import not idempotent ({again.summary()})")
+    return failures
+
+
+def check_sync_corrupt():
+    """Пакет, оборванный на середине, не принимается и не попадает в итоги приема"""
+    import gzip
+    import sqlite3
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_sync import write_station
+    from sync import export_bundle, import_directory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        station = os.path.join(tmp, 'station.sqlite3')
+        write_station(station, 0)
+        bundle = export_bundle(station, tmp, station='azs-0').path
+        with gzip.open(bundle, 'rt', encoding='utf-8') as f:
+            lines = f.readlines()
+        outbox = os.path.join(tmp, 'outbox')
+        os.mkdir(outbox)
+        with gzip.open(os.path.join(outbox, os.path.basename(bundle)), 'wt', encoding='utf-8') as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][:len(lines[-1]) // 2])
+        central = os.path.join(tmp, 'central.sqlite3')
+        summary = import_directory(central, outbox)
+        db = sqlite3.connect(central)
+        rows = db.execute('SELECT count(*) FROM readings').fetchone()[0]
+        db.close()
+    if len(lines) < 3 or len(summary.failures) != 1 or (summary.bundles, summary.rows, summary.duplicates,
+                                                        summary.versions, rows) != (0, 0, 0, 0, 0):
+        return [f"sync: truncated bundle counted ({summary.summary()}, {rows} rows in the database)"]
+    return []
+
+
+def bench_sync(metrics):
+    from sync import import_directory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = sync_outbox(tmp, 4)
+        central = os.path.join(tmp, 'central.sqlite3')
+
+        def merge():
+            if os.path.exists(central):
+                os.remove(central)
+            import_directory(central, outbox)
+
+        metrics['sync.import_4_stations'] = (best_of(merge, 3) * 1e3, 'ms')
+
+
+def bench_workbook(metrics):
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_workbook_loader import write_workbook
+    from calibration_cache import cache_path, load_cached_tables
+    from workbook import load_calibration_tables
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "резерв.xlsx")
+        write_workbook(path)
+        metrics['workbook.parse'] = (best_of(lambda: load_calibration_tables(path)) * 1e3, 'ms')
+        metrics['workbook.parse_peak'] = (peak_kib(lambda: load_calibration_tables(path)), 'KiB')
+        load_cached_tables(path)
+        metrics['workbook.cached_load'] = (best_of(lambda: load_cached_tables(path)) * 1e3, 'ms')
+        os.remove(cache_path(path))
+
+
+def bench_imports(metrics):
+    for module in ('core', 'cli'):
+        def cold_import():
+            subprocess.run([sys.executable, '-c', f'import {module}'], cwd=ROOT, check=True)
+
+        def interpreter():
+            subprocess.run([sys.executable, '-c', 'pass'], check=True)
+
+        metrics[f'import.{module}'] = ((best_of(cold_import) - best_of(interpreter)) * 1e3, 'ms')
+
+
+def run():
+    metrics = {}
+    bench_lookups(metrics)
+    bench_model(metrics)
+    bench_analytics(metrics)
+    bench_decimation(metrics)
+    bench_sync(metrics)
+    bench_results_cache(metrics)
+    bench_workbook(metrics)
+    bench_imports(metrics)
+    failures = (check_pinned() + check_model_totals() + check_cli_workbook() + check_engines() + check_density()
+                + check_empty_block() + check_analytics() + check_decimation() + check_sync() + check_sync_corrupt()
+                + check_results_cache() + check_history_writer() + check_profile_scope() + check_fleet_config()
+                + check_pdf())
+    return {
+        'metrics': {name: {'value': round(value, 4), 'unit': unit} for name, (value, unit) in metrics.items()},
+        'correctness': {'passed': not failures, 'failures': failures},
+    }
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for name, metric in report['metrics'].items():
+        base = baseline.get('metrics', {}).get(name)
+        if base and metric['value'] > base['value'] * (1 + tolerance):
+            found.append(f"{name}: {metric['value']} {metric['unit']} > {base['value']} * {1 + tolerance}")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры и проверки расчетного ядра")
+    parser.add_argument('-o', '--output', help="файл JSON для отчета (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="отчет предыдущего прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="допустимое ухудшение, доля")
+    args = parser.parse_args(argv)
+
+    report = run()
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = regressions(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for failure in report['correctness']['failures'] + report.get('regressions', []):
+        print(failure, file=sys.stderr)
+    return 0 if report['correctness']['passed'] and not report.get('regressions') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
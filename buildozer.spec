@@ -7,7 +7,7 @@ source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,txt
 
 version = 0.1
-requirements = python3,kivy==2.1.0,kivymd==1.1.1,pandas,openpyxl,android
+requirements = python3,kivy==2.1.0,kivymd==1.1.1,numpy,openpyxl,android
 
 orientation = portrait
 osx.python_version = 3
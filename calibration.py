@@ -0,0 +1,428 @@
+import hashlib
+import math
+from bisect import bisect_right
+
+import numpy as np
+
+DENSE_INDEX_MAX_BYTES = 1 << 20
+DECIMATE_WINDOW = 16
+
+
+class TableDiagnostics:
+    """Итоги проверки таблицы при построении; номера строк - индексы входных массивов
+
+    invalid - нечисловые, бесконечные или отрицательные значения (пустые строки не считаются),
+    duplicates - точные повторы строк, conflicts - повтор высоты с другим объемом
+    (остается первая строка), outliers - строки, на которых объем убывает с ростом высоты,
+    unsorted - число строк, стоящих выше предыдущей по высоте. first_row - номер
+    строки источника для индекса 0 (задает загрузчик книги), sheet - лист источника.
+    """
+
+    __slots__ = ('rows', 'kept', 'invalid', 'duplicates', 'conflicts', 'outliers', 'unsorted',
+                 'first_row', 'sheet')
+
+    def __init__(self, rows=0, kept=0, invalid=(), duplicates=(), conflicts=(), outliers=(), unsorted=0,
+                 first_row=0, sheet=None):
+        self.rows = rows
+        self.kept = kept
+        self.invalid = list(invalid)
+        self.duplicates = list(duplicates)
+        self.conflicts = list(conflicts)
+        self.outliers = list(outliers)
+        self.unsorted = unsorted
+        self.first_row = first_row
+        self.sheet = sheet
+
+    @property
+    def ok(self) -> bool:
+        return not (self.invalid or self.duplicates or self.conflicts or self.outliers or self.unsorted)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def summary(self) -> str:
+        if self.ok:
+            return f"строк: {self.kept}, замечаний нет"
+        parts = [f"строк: {self.kept} из {self.rows}"]
+        for label, rows in (("некорректных", self.invalid), ("повторов", self.duplicates),
+                            ("конфликтов высоты", self.conflicts), ("выбросов объема", self.outliers)):
+            if rows:
+                parts.append(f"{label}: {len(rows)}")
+        if self.unsorted:
+            parts.append(f"не по порядку: {self.unsorted}")
+        return ", ".join(parts)
+
+    def messages(self, first_row: int = None) -> list:
+        """Замечания по строкам; first_row - номер, с которого нумеруются строки источника
+        (по умолчанию - записанный загрузчиком)
+        """
+        if first_row is None:
+            first_row = self.first_row
+        labels = (
+            (self.invalid, "некорректные значения, строка пропущена"),
+            (self.duplicates, "повтор строки, пропущена"),
+            (self.conflicts, "повтор высоты с другим объемом, оставлена первая строка"),
+            (self.outliers, "объем убывает с ростом высоты, строка пропущена"),
+        )
+        messages = [f"строка {row + first_row}: {label}" for row, label in sorted(
+            (row, label) for rows, label in labels for row in rows
+        )]
+        if self.unsorted:
+            messages.append(f"строки не упорядочены по высоте ({self.unsorted}), таблица отсортирована")
+        return messages
+
+
+def _monotone_subsequence(values) -> np.ndarray:
+    """Индексы наибольшей неубывающей подпоследовательности (O(n log n))"""
+    tails, tail_index = [], []
+    parents = [-1] * len(values)
+    for i, value in enumerate(values):
+        k = bisect_right(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[k] = value
+            tail_index[k] = i
+        parents[i] = tail_index[k - 1] if k else -1
+    chain = []
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        chain.append(i)
+        i = parents[i]
+    return np.array(chain[::-1], dtype=np.intp)
+
+
+def repair_rows(heights, liters):
+    """Проверка и исправление строк таблицы: (высоты, объемы, TableDiagnostics)
+
+    Результат отсортирован по высоте без повторов, объем не убывает - движкам
+    поиска не нужны проверки на каждый запрос.
+    """
+    heights = np.asarray(heights, dtype=float).ravel()
+    liters = np.asarray(liters, dtype=float).ravel()
+    blank = np.isnan(heights) & np.isnan(liters)
+    valid = np.isfinite(heights) & np.isfinite(liters) & (heights >= 0) & (liters >= 0)
+    invalid = np.flatnonzero(~valid & ~blank)
+    rows = np.flatnonzero(valid)
+    unsorted = int(np.count_nonzero(np.diff(heights[rows]) < 0))
+
+    order = rows[np.argsort(heights[rows], kind='stable')]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = heights[order[1:]] != heights[order[:-1]]
+    kept = order[first]
+    dropped = order[~first]
+    first_of = kept[np.cumsum(first) - 1][~first]
+    exact = liters[dropped] == liters[first_of]
+
+    outliers = np.empty(0, dtype=np.intp)
+    if np.any(np.diff(liters[kept]) < 0):
+        monotone = _monotone_subsequence(liters[kept].tolist())
+        outliers = np.sort(np.setdiff1d(kept, kept[monotone]))
+        kept = kept[monotone]
+
+    diagnostics = TableDiagnostics(
+        rows=int(np.count_nonzero(~blank)),
+        kept=len(kept),
+        invalid=invalid.tolist(),
+        duplicates=np.sort(dropped[exact]).tolist(),
+        conflicts=np.sort(dropped[~exact]).tolist(),
+        outliers=outliers.tolist(),
+        unsorted=unsorted,
+    )
+    return np.ascontiguousarray(heights[kept]), np.ascontiguousarray(liters[kept]), diagnostics
+
+
+class DecimationReport:
+    """Итоги прореживания таблицы: строк до и после, допуск и фактическая ошибка, л, байты"""
+
+    __slots__ = ('rows', 'kept', 'tolerance', 'max_error', 'bytes_before', 'bytes_after')
+
+    def __init__(self, rows, kept, tolerance, max_error, bytes_before, bytes_after):
+        self.rows = rows
+        self.kept = kept
+        self.tolerance = tolerance
+        self.max_error = max_error
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_after
+
+    @property
+    def ratio(self) -> float:
+        """Во сколько раз меньше строк"""
+        return self.rows / self.kept if self.kept else 1.0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def summary(self) -> str:
+        return (f"строк: {self.kept} из {self.rows} (в {self.ratio:.1f} раза меньше), "
+                f"ошибка до {self.max_error:.3f} л при допуске {self.tolerance:g} л")
+
+
+def decimate_rows(heights, liters, tolerance: float) -> np.ndarray:
+    """Индексы опорных строк, по которым линейная интерполяция отличается от таблицы
+    не больше чем на tolerance л; первая и последняя строки сохраняются
+
+    От каждой опорной строки берется самый дальний конец отрезка, чей наклон проходит
+    через коридор +-tolerance у всех промежуточных строк: коридор задает конус
+    допустимых наклонов, который сужается по мере удаления (накопленные max/min).
+    Конус считается окнами (вдвое длиннее предыдущего отрезка, не меньше
+    DECIMATE_WINDOW строк), окно удваивается, пока конус не опустеет. Обе функции
+    линейны между строками исходной таблицы, поэтому ошибка в строках - это ошибка
+    для любой высоты.
+    """
+    count = len(heights)
+    if count <= 2:
+        return np.arange(count)
+    keep = [0]
+    start = 0
+    window = DECIMATE_WINDOW
+    while start < count - 1:
+        while True:
+            stop = min(start + 1 + window, count)
+            dx = heights[start + 1:stop] - heights[start]
+            dy = liters[start + 1:stop] - liters[start]
+            lower = np.maximum.accumulate((dy - tolerance) / dx)
+            upper = np.minimum.accumulate((dy + tolerance) / dx)
+            if stop == count or lower[-1] > upper[-1]:
+                break
+            window *= 2
+        slopes = dy / dx
+        feasible = np.ones(len(dx), dtype=bool)
+        feasible[1:] = (lower[:-1] <= slopes[1:]) & (slopes[1:] <= upper[:-1])
+        step = 1 + int(np.flatnonzero(feasible)[-1])
+        window = max(2 * step, DECIMATE_WINDOW)
+        start += step
+        keep.append(start)
+    return np.array(keep)
+
+
+def _end_slope(h0, h1, delta0, delta1):
+    """Производная на краю таблицы: трехточечная оценка с ограничением монотонности"""
+    slope = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+    if np.sign(slope) != np.sign(delta0):
+        return 0.0
+    if np.sign(delta0) != np.sign(delta1) and abs(slope) > abs(3 * delta0):
+        return 3 * delta0
+    return slope
+
+
+def pchip_coefficients(heights, liters) -> np.ndarray:
+    """Коэффициенты монотонного кубического сплайна (Fritsch-Carlson, как PCHIP)
+
+    Возвращает матрицу (4, n - 1): на отрезке i объем равен
+    c0 + t * (c1 + t * (c2 + t * c3)), где t = h - heights[i].
+    """
+    widths = np.diff(heights)
+    deltas = np.diff(liters) / widths
+    slopes = np.empty(len(heights))
+    if len(deltas) == 1:
+        slopes[:] = deltas[0]
+    else:
+        w1 = 2 * widths[1:] + widths[:-1]
+        w2 = widths[1:] + 2 * widths[:-1]
+        same_sign = deltas[:-1] * deltas[1:] > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            harmonic = (w1 + w2) / (w1 / deltas[:-1] + w2 / deltas[1:])
+        slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+        slopes[0] = _end_slope(widths[0], widths[1], deltas[0], deltas[1])
+        slopes[-1] = _end_slope(widths[-1], widths[-2], deltas[-1], deltas[-2])
+
+    c2 = (3 * deltas - 2 * slopes[:-1] - slopes[1:]) / widths
+    c3 = (slopes[:-1] + slopes[1:] - 2 * deltas) / (widths * widths)
+    return np.ascontiguousarray([liters[:-1], slopes[:-1], c2, c3])
+
+
+class CalibrationTable:
+    """Градуировочная таблица резервуара: высота, мм -> объем, л
+
+    Строки проверяются и исправляются один раз при построении (repair_rows),
+    итоги проверки - в diagnostics.
+    """
+
+    __slots__ = ('heights', 'liters', 'max_height_mm', 'top_liters', 'diagnostics', 'decimation',
+                 '_dense', '_cubic', '_digest')
+
+    def __init__(self, heights, liters):
+        self.heights, self.liters, self.diagnostics = repair_rows(heights, liters)
+        self.max_height_mm = self.heights[-1] if len(self.heights) else 0
+        self.top_liters = self.liters[-1] if len(self.liters) else 0.0
+        self.decimation = None
+        self._dense = None
+        self._cubic = None
+        self._digest = None
+
+    @classmethod
+    def from_buffers(cls, heights, liters, max_height_mm, top_liters, diagnostics=None):
+        """Таблица поверх готовых проверенных буферов (без копирования)"""
+        table = cls.__new__(cls)
+        table.heights = heights
+        table.liters = liters
+        table.max_height_mm = max_height_mm
+        table.top_liters = top_liters
+        table.diagnostics = diagnostics
+        table.decimation = None
+        table._dense = None
+        table._cubic = None
+        table._digest = None
+        return table
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Построение таблицы из пар (height_mm, liters)"""
+        data = np.array(list(rows), dtype=float).reshape(-1, 2)
+        return cls(data[:, 0], data[:, 1])
+
+    def __len__(self):
+        return len(self.heights)
+
+    @property
+    def empty(self) -> bool:
+        return not len(self.heights)
+
+    @property
+    def nbytes(self) -> int:
+        return self.heights.nbytes + self.liters.nbytes
+
+    def digest(self) -> str:
+        """Отпечаток содержимого (высоты и объемы); считается один раз"""
+        if self._digest is None:
+            digest = hashlib.sha1(np.ascontiguousarray(self.heights, dtype='<f8').tobytes())
+            digest.update(np.ascontiguousarray(self.liters, dtype='<f8').tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def decimated(self, tolerance: float) -> 'CalibrationTable':
+        """Таблица из наименьшего (жадно) числа строк с ошибкой линейной интерполяции
+        не больше tolerance л; итоги - в decimation
+
+        Для кубической интерполяции допуск не гарантируется: сплайн строится по
+        оставшимся строкам.
+        """
+        keep = decimate_rows(self.heights, self.liters, tolerance)
+        table = CalibrationTable.from_buffers(self.heights[keep], self.liters[keep], self.max_height_mm,
+                                              self.top_liters, self.diagnostics)
+        error = np.abs(np.interp(self.heights, table.heights, table.liters) - self.liters)
+        table.decimation = DecimationReport(len(self), len(table), tolerance,
+                                            float(error.max()) if len(error) else 0.0,
+                                            self.nbytes, table.nbytes)
+        return table
+
+    def volumes(self, heights) -> np.ndarray:
+        """Объемы для массива высот (бинарный поиск + линейная интерполяция)"""
+        h = np.asarray(heights, dtype=float)
+        if self.empty:
+            return np.zeros(h.shape)
+
+        idx = np.searchsorted(self.heights, h)
+        lo = np.maximum(idx - 1, 0)
+        hi = np.minimum(idx, len(self.heights) - 1)
+        h1, h2 = self.heights[lo], self.heights[hi]
+        v1, v2 = self.liters[lo], self.liters[hi]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            interpolated = v1 + (v2 - v1) * (h - h1) / (h2 - h1)
+
+        volumes = np.where(h2 == h, v2, np.where(idx > 0, interpolated, 0.0))
+        volumes = np.where(h >= self.max_height_mm, self.top_liters, volumes)
+        volumes = np.where(h <= 0, 0.0, volumes)
+        return np.round(volumes, 1)
+
+    def cubic_coefficients(self) -> np.ndarray:
+        """Коэффициенты сплайна (строятся при первом вызове)"""
+        if self._cubic is None:
+            self._cubic = pchip_coefficients(self.heights, self.liters)
+        return self._cubic
+
+    def cubic_volumes(self, heights) -> np.ndarray:
+        """Объемы для массива высот по монотонному кубическому сплайну
+
+        Вне таблицы поведение как у volumes: ниже первой строки и при h <= 0 - 0,
+        от max_height_mm и выше - объем последней строки.
+        """
+        if len(self.heights) < 2:
+            return self.volumes(heights)
+        h = np.asarray(heights, dtype=float)
+        c0, c1, c2, c3 = self.cubic_coefficients()
+
+        idx = np.clip(np.searchsorted(self.heights, h, side='right') - 1, 0, len(c0) - 1)
+        t = h - self.heights[idx]
+        volumes = c0[idx] + t * (c1[idx] + t * (c2[idx] + t * c3[idx]))
+        volumes = np.where(h < self.heights[0], 0.0, volumes)
+        volumes = np.where(h >= self.max_height_mm, self.top_liters, volumes)
+        volumes = np.where(h <= 0, 0.0, volumes)
+        return np.round(volumes, 1)
+
+    def heights_for_volumes(self, volumes) -> np.ndarray:
+        """Высоты, мм, для массива объемов: бинарный поиск по объемам + линейная интерполяция
+
+        Обратная к volumes: на горизонтальных участках - наименьшая высота с данным объемом,
+        объем от top_liters и выше - max_height_mm. Округление до 0.1 мм.
+        """
+        v = np.asarray(volumes, dtype=float)
+        if self.empty:
+            return np.zeros(v.shape)
+
+        idx = np.searchsorted(self.liters, v)
+        lo = np.maximum(idx - 1, 0)
+        hi = np.minimum(idx, len(self.liters) - 1)
+        h1, h2 = self.heights[lo], self.heights[hi]
+        v1, v2 = self.liters[lo], self.liters[hi]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            interpolated = h1 + (h2 - h1) * (v - v1) / (v2 - v1)
+
+        heights = np.where((v2 == v) | (idx == 0), h2, interpolated)
+        heights = np.where(v >= self.top_liters, self.max_height_mm, heights)
+        heights = np.where(v <= 0, 0.0, heights)
+        return np.round(heights, 1)
+
+    def cubic_heights_for_volumes(self, volumes, iterations: int = 40) -> np.ndarray:
+        """Обратная к cubic_volumes: отрезок бинарным поиском, внутри отрезка - бисекция
+
+        Сплайн монотонный, поэтому на отрезке корень единственный.
+        """
+        if len(self.heights) < 2:
+            return self.heights_for_volumes(volumes)
+        v = np.asarray(volumes, dtype=float)
+        c0, c1, c2, c3 = self.cubic_coefficients()
+
+        idx = np.clip(np.searchsorted(self.liters, v) - 1, 0, len(c0) - 1)
+        a0, a1, a2, a3 = c0[idx], c1[idx], c2[idx], c3[idx]
+        lo = np.zeros(v.shape)
+        hi = self.heights[idx + 1] - self.heights[idx]
+        for _ in range(iterations):
+            mid = (lo + hi) / 2
+            below = a0 + mid * (a1 + mid * (a2 + mid * a3)) < v
+            lo = np.where(below, mid, lo)
+            hi = np.where(below, hi, mid)
+
+        heights = self.heights[idx] + hi
+        heights = np.where(v <= self.liters[0], self.heights[0], heights)
+        heights = np.where(v >= self.top_liters, self.max_height_mm, heights)
+        heights = np.where(v <= 0, 0.0, heights)
+        return np.round(heights, 1)
+
+    def dense_index(self, max_bytes: int = DENSE_INDEX_MAX_BYTES):
+        """Объем для каждого целого миллиметра (строится при первом вызове)
+
+        Последний элемент - объем при высоте от max_height_mm и выше.
+        Возвращает None, если индекс не помещается в max_bytes.
+        """
+        if self._dense is None:
+            size = max(math.floor(self.max_height_mm), 0) + 2
+            if size * 8 > max_bytes:
+                return None
+            self._dense = self.volumes(np.arange(size))
+        return self._dense
+
+    def dense_volumes(self, heights) -> np.ndarray:
+        """Объемы для целых высот чтением из плотного индекса"""
+        dense = self.dense_index()
+        if dense is None:
+            return self.volumes(heights)
+        return dense[np.clip(heights, 0, len(dense) - 1)]
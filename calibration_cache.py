@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from calibration import CalibrationTable, DecimationReport, TableDiagnostics
+from instrumentation import timed
+from workbook import TANK_COUNT, open_workbook_tables
+
+CACHE_MAGIC = b'FCAL'
+CACHE_VERSION = 4
+CACHE_SUFFIX = '.fcal'
+
+_PREFIX = struct.Struct('<4sII')
+_ALIGN = 8
+
+
+def cache_path(file_path) -> str:
+    """Путь к кэшу рядом с файлом таблиц"""
+    return file_path + CACHE_SUFFIX
+
+
+def file_digest(file_path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_info(file_path) -> dict:
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _tolerance_key(tolerances) -> dict:
+    """Допуски прореживания в виде, сравнимом с заголовком кэша"""
+    return {str(tank_num): float(tolerance) for tank_num, tolerance in (tolerances or {}).items() if tolerance}
+
+
+def write_cache(path, tables: dict, source: dict, tank_count: int = TANK_COUNT, tolerances=None):
+    """Запись таблиц в плоский бинарный файл: заголовок JSON + float64"""
+    header = {
+        'source': source,
+        'tank_count': tank_count,
+        'tolerances': _tolerance_key(tolerances),
+        'tanks': [
+            {
+                'number': tank_num,
+                'count': len(table),
+                'max_height_mm': float(table.max_height_mm),
+                'top_liters': float(table.top_liters),
+                'diagnostics': table.diagnostics.as_dict() if table.diagnostics is not None else None,
+                'decimation': table.decimation.as_dict() if table.decimation is not None else None,
+            }
+            for tank_num, table in sorted(tables.items())
+        ],
+    }
+    raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    raw += b' ' * (-(_PREFIX.size + len(raw)) % _ALIGN)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(CACHE_MAGIC, CACHE_VERSION, len(raw)))
+        f.write(raw)
+        for _, table in sorted(tables.items()):
+            f.write(np.ascontiguousarray(table.heights, dtype='<f8').tobytes())
+            f.write(np.ascontiguousarray(table.liters, dtype='<f8').tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Заголовок кэша или None, если файл отсутствует или другой версии"""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return None
+            header = json.loads(f.read(length).decode('utf-8'))
+    except (OSError, struct.error, ValueError):
+        return None
+    header['data_offset'] = _PREFIX.size + length
+    return header
+
+
+def map_tables(path, header: dict) -> dict:
+    """Таблицы поверх отображенного в память кэша"""
+    total = sum(tank['count'] for tank in header['tanks'])
+    if not total:
+        return {}
+    data = np.memmap(
+        path, dtype='<f8', mode='r', offset=header['data_offset'], shape=(2 * total,)
+    ).view(np.ndarray)
+
+    tables = {}
+    offset = 0
+    for tank in header['tanks']:
+        count = tank['count']
+        table = CalibrationTable.from_buffers(
+            data[offset:offset + count],
+            data[offset + count:offset + 2 * count],
+            tank['max_height_mm'],
+            tank['top_liters'],
+            TableDiagnostics.from_dict(tank['diagnostics']) if tank.get('diagnostics') else None,
+        )
+        if tank.get('decimation'):
+            table.decimation = DecimationReport(**tank['decimation'])
+        tables[tank['number']] = table
+        offset += 2 * count
+    return tables
+
+
+@timed('calibration_cache.load')
+def load_cached_tables(file_path, tank_count: int = TANK_COUNT, lazy: bool = False, tolerances=None):
+    """Таблицы из кэша; кэш пересобирается только при изменении файла или допусков
+
+    tolerances - {резервуар: допуск, л}: таблицы этих резервуаров прореживаются при
+    сборке кэша (CalibrationTable.decimated) и хранятся в нем уже прореженными, вместе
+    с итогами прореживания. При промахе кэша с lazy=True книга из нескольких листов
+    возвращается как WorkbookTables: листы читаются по требованию, кэш пишется, когда
+    прочитаны все.
+    """
+    path = cache_path(file_path)
+    source = _source_info(file_path)
+    header = read_header(path)
+    tolerances = {tank_num: tolerance for tank_num, tolerance in (tolerances or {}).items() if tolerance}
+    if header is not None and (header.get('tank_count', TANK_COUNT) != tank_count
+                               or header.get('tolerances', {}) != _tolerance_key(tolerances)):
+        header = None
+
+    if header is not None:
+        cached = header['source']
+        if cached['size'] == source['size'] and cached['mtime_ns'] == source['mtime_ns']:
+            return map_tables(path, header)
+        source['sha256'] = file_digest(file_path)
+        if cached['sha256'] == source['sha256']:
+            tables = map_tables(path, header)
+            try:
+                write_cache(path, tables, source, tank_count, tolerances)
+            except OSError:
+                pass
+            return tables
+    else:
+        source['sha256'] = file_digest(file_path)
+
+    def store(tables):
+        """Кэш без пустых блоков - как таблицы, прочитанные сразу"""
+        try:
+            write_cache(path, {tank_num: table for tank_num, table in tables.items() if not table.empty},
+                        source, tank_count, tolerances)
+        except OSError:
+            pass
+
+    def decimate(tank_num, table):
+        tolerance = tolerances.get(tank_num)
+        return table.decimated(tolerance) if tolerance else table
+
+    workbook_tables = open_workbook_tables(file_path, tank_count, lazy, decimate if tolerances else None)
+    if not workbook_tables.complete:
+        workbook_tables.on_complete = store
+        return workbook_tables
+    tables = {tank_num: table for tank_num, table in sorted(workbook_tables.tables.items()) if not table.empty}
+    store(tables)
+    return tables
@@ -0,0 +1,497 @@
+"""Пакетный расчет без интерфейса
+
+    python cli.py volumes readings.csv > results.csv
+    python cli.py volumes -w резерв.xlsx readings.jsonl --summary
+    python cli.py fleet stations/ -j 8 > fleet.csv
+    python cli.py telemetry 0.0.0.0:7070 --history history.sqlite3
+    python cli.py gauge 127.0.0.1:7070 --rate 1000
+    python cli.py report history.sqlite3 -o month.pdf --since 2024-05-01
+    python cli.py validate резерв.xlsx
+    python cli.py decimate резерв.xlsx --tolerance 0.1
+    python cli.py sync-export history.sqlite3 outbox/ --station azs-12 -w резерв.xlsx
+    python cli.py sync-import central.sqlite3 outbox/
+    python cli.py losses history.sqlite3 --journal operations.csv -o balance.xlsx
+    python cli.py plan --receipt 1:1500:20000 --receipt 2:800:15000 --fill-limit 0.95
+    python cli.py --timings --cprofile volumes.prof volumes readings.csv > results.csv
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import threading
+import time
+
+from analytics import (ANOMALY_FLAGS, FLAG_NAMES, LOSS_RATE, analyze, daily_balance, read_journal,
+                       series_from_history)
+from core import (DECIMATE_TOLERANCE, INTERPOLATION_LINEAR, INTERPOLATION_MODES, LOOKUP_MODES,
+                  LOOKUP_SEARCH, Totals, load_tanks, plan_delivery)
+from density import STANDARD_TEMPERATURE
+from fleet import discover_stations, run_fleet
+from history import HistoryStore
+from instrumentation import timings
+from readings import detect_format, iter_results, open_stream, read_readings
+from report import export_report, history_report, write_csv
+from sync import export_bundle, import_directory, record_calibrations
+from telemetry import DEFAULT_PORT, TelemetryService, parse_address, simulate_gauge
+from workbook import TANK_COUNT, find_workbook, load_calibration_tables
+
+OUTPUT_FIELDS = ['tank', 'height_mm', 'density', 'volume_l', 'mass_kg', 'temperature', 'volume15_l']
+DENSITY_STANDARD = 'standard'
+DENSITY_OBSERVED = 'observed'
+FLEET_FIELDS = ['station', 'readings', 'errors', 'volume_l', 'mass_kg', 'avg_density']
+HISTORY_FIELDS = ['time', 'height_mm', 'density', 'volume_l', 'mass_kg']
+PLAN_FIELDS = ['tank', 'height_mm', 'volume_l', 'receipt_l', 'ullage_l',
+               'final_volume_l', 'final_height_mm', 'overflow_l']
+DAILY_FIELDS = ['tank', 'day', 'count', 'avg_volume_l', 'avg_mass_kg',
+                'min_volume_l', 'max_volume_l', 'last_volume_l', 'last_mass_kg']
+
+
+def write_results(stream, fmt, results, totals=None):
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(OUTPUT_FIELDS)
+    for tank, height, density, temperature, volume, volume15, mass in results:
+        if totals is not None:
+            totals.add(volume, mass)
+        if temperature != temperature:
+            temperature = None
+        if fmt == 'jsonl':
+            row = (tank, height, density, volume, mass, temperature, volume15)
+            stream.write(json.dumps(dict(zip(OUTPUT_FIELDS, row))) + '\n')
+        else:
+            writer.writerow((tank, height, density, f"{volume:.1f}", f"{mass:.1f}",
+                             "" if temperature is None else temperature, f"{volume15:.1f}"))
+
+
+def print_summary(totals, stream=sys.stderr):
+    print(f"ОБЩИЙ ОБЪЕМ: {totals.volume:,.1f} л", file=stream)
+    print(f"ОБЩАЯ МАССА: {totals.mass:,.1f} кг", file=stream)
+    if totals.volume > 0:
+        print(f"СРЕДНЯЯ ПЛОТНОСТЬ: {totals.average_density:.3f} кг/л", file=stream)
+
+
+def workbook_tanks(args, **kwargs):
+    """Резервуары из файла таблиц без подстановки тестовых данных (все таблицы читаются сразу);
+    None (с сообщением в stderr), если файл не найден или не читается
+    """
+    file_path = args.workbook or find_workbook()
+    if file_path is None:
+        print("файл градуировочных таблиц не найден", file=sys.stderr)
+        return None
+    try:
+        tanks = load_tanks(file_path, fallback=False, **kwargs)
+    except Exception as e:
+        print(f"{file_path}: {e}", file=sys.stderr)
+        return None
+    if not tanks:
+        print(f"{file_path}: нет таблиц резервуаров из списка", file=sys.stderr)
+        return None
+    return tanks
+
+
+def run_volumes(args):
+    tanks = workbook_tanks(args, tolerance=args.tolerance)
+    if tanks is None:
+        return 1
+    for tank in tanks.values():
+        tank.set_lookup(args.lookup)
+        tank.set_interpolation(args.interpolation)
+    input_format = args.input_format or detect_format(args.readings)
+    output_format = args.output_format or (
+        detect_format(args.output) if args.output != '-' else input_format
+    )
+    totals = Totals() if args.summary else None
+
+    with open_stream(args.readings, 'r') as source, open_stream(args.output, 'w') as target:
+        density_temperature = STANDARD_TEMPERATURE if args.density_at == DENSITY_STANDARD else None
+        results = iter_results(read_readings(source, input_format), tanks,
+                               density_temperature=density_temperature)
+        write_results(target, output_format, results, totals)
+
+    if totals is not None:
+        print_summary(totals)
+    return 0
+
+
+def run_fleet_command(args):
+    stations = discover_stations(args.stations, args.readings_dir)
+    results, totals = run_fleet(stations, args.jobs)
+
+    with open_stream(args.output, 'w') as target:
+        writer = csv.writer(target)
+        writer.writerow(FLEET_FIELDS)
+        for result in results:
+            for message in result.messages:
+                print(f"{result.station}: {message}", file=sys.stderr)
+            if result.failure:
+                print(f"{result.station}: ошибка {result.failure}", file=sys.stderr)
+            writer.writerow(fleet_row(result.station, result.readings, result.errors, result.totals))
+        writer.writerow(fleet_row("ИТОГО", sum(r.readings for r in results),
+                                  sum(r.errors for r in results), totals))
+    return 1 if any(result.failure for result in results) else 0
+
+
+def fleet_row(station, readings, errors, totals):
+    return (station, readings, errors, f"{totals.volume:.1f}", f"{totals.mass:.1f}",
+            f"{totals.average_density:.3f}")
+
+
+def day_start(day):
+    return time.mktime(time.strptime(day, '%Y-%m-%d'))
+
+
+def run_history(args):
+    store = HistoryStore(args.database)
+    try:
+        with open_stream(args.output, 'w') as target:
+            writer = csv.writer(target)
+            if args.daily:
+                writer.writerow(DAILY_FIELDS)
+                writer.writerows(store.daily(args.tank, args.since, args.until))
+            else:
+                start = day_start(args.since) if args.since else None
+                end = day_start(args.until) + 86400 if args.until else None
+                writer.writerow(HISTORY_FIELDS)
+                for ts, *values in store.tank_range(args.tank, start, end):
+                    writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), *values])
+    finally:
+        store.close()
+    return 0
+
+
+def run_telemetry(args):
+    tanks = workbook_tanks(args)
+    if tanks is None:
+        return 1
+    host, port = parse_address(args.address)
+    history = HistoryStore(args.history) if args.history else None
+    lock = threading.Lock()
+
+    with open_stream(args.output, 'w') as target:
+        def on_batch(chunk):
+            with lock:
+                write_results(target, 'jsonl', zip(*(column.tolist() for column in chunk)))
+                target.flush()
+            if history is not None:
+                tank_ids, heights, densities, _, volumes, _, chunk_masses = chunk
+                ts = time.time()
+                history.append(zip([ts] * len(tank_ids), tank_ids.tolist(), heights.tolist(),
+                                   densities.tolist(), volumes.tolist(), chunk_masses.tolist()))
+
+        service = TelemetryService(tanks, on_batch, host, port, args.serial)
+        service.start()
+        print(f"прием показаний на {service.host}:{service.port}", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+            if history is not None:
+                history.close()
+    print(f"принято {service.received}, рассчитано {service.processed}, ошибок {service.errors}",
+          file=sys.stderr)
+    return 0
+
+
+def run_gauge(args):
+    host, port = parse_address(args.address)
+    tanks = {num: float(height) for num, height in
+             (item.split(':') for item in args.tanks.split(','))}
+    sent = asyncio.run(simulate_gauge(host, port, tanks, args.count, args.rate, args.seed))
+    print(f"отправлено {sent}", file=sys.stderr)
+    return 0
+
+
+def run_report(args):
+    store = HistoryStore(args.database)
+    try:
+        start = day_start(args.since) if args.since else None
+        end = day_start(args.until) + 86400 if args.until else None
+        report = history_report(store, args.tank, start, end, args.title)
+        if args.output == '-':
+            write_csv(report, sys.stdout)
+        else:
+            export_report(report, args.output, args.font)
+    finally:
+        store.close()
+    return 0
+
+
+def run_losses(args):
+    tanks = workbook_tanks(args)
+    if tanks is None:
+        return 1
+    store = HistoryStore(args.database)
+    try:
+        start = day_start(args.since) if args.since else None
+        end = day_start(args.until) + 86400 if args.until else None
+        series = analyze(*series_from_history(store, tanks, args.tank, start, end), tanks,
+                         loss_rate=args.loss_rate)
+    finally:
+        store.close()
+    journal = None
+    if args.journal:
+        with open_stream(args.journal, 'r') as source:
+            journal = read_journal(source)
+    balance = daily_balance(series, journal)
+
+    if args.output == '-':
+        write_csv(balance.report(), sys.stdout)
+    else:
+        export_report(balance.report(), args.output, args.font)
+    if args.events:
+        export_report(series.events_report(), args.events, args.font)
+
+    print(f"показаний: {len(series)}, дней: {len(balance)}", file=sys.stderr)
+    for flag, name in FLAG_NAMES.items():
+        if flag & ANOMALY_FLAGS:
+            print(f"отметок '{name}': {int(((series.flags & flag) != 0).sum())}", file=sys.stderr)
+    print(f"дней сверх допуска: {int(balance.alarms.sum())}", file=sys.stderr)
+    return 1 if balance.alarms.any() or len(series.anomalies()) else 0
+
+
+def run_validate(args):
+    file_path = args.workbook or find_workbook()
+    if file_path is None:
+        print("файл градуировочных таблиц не найден", file=sys.stderr)
+        return 1
+    tables = load_calibration_tables(file_path, args.tanks)
+    if args.json:
+        report = {tank_num: table.diagnostics.as_dict() for tank_num, table in sorted(tables.items())}
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for tank_num, table in sorted(tables.items()):
+            print(f"резервуар {tank_num} (лист '{table.diagnostics.sheet}'): {table.diagnostics.summary()}")
+            for message in table.diagnostics.messages():
+                print(f"  {message}")
+    return 0 if all(table.diagnostics.ok for table in tables.values()) else 1
+
+
+def run_decimate(args):
+    file_path = args.workbook or find_workbook()
+    if file_path is None:
+        print("файл градуировочных таблиц не найден", file=sys.stderr)
+        return 1
+    tables = load_calibration_tables(file_path, args.tanks)
+    reports = {tank_num: table.decimated(args.tolerance).decimation for tank_num, table in tables.items()}
+    if args.json:
+        print(json.dumps({tank_num: report.as_dict() for tank_num, report in reports.items()},
+                         ensure_ascii=False, indent=2))
+        return 0
+    for tank_num, report in reports.items():
+        print(f"резервуар {tank_num}: {report.summary()}")
+    rows = sum(report.rows for report in reports.values())
+    kept = sum(report.kept for report in reports.values())
+    before = sum(report.bytes_before for report in reports.values())
+    after = sum(report.bytes_after for report in reports.values())
+    print(f"всего строк: {kept} из {rows}, памяти: {after / 1024:.1f} из {before / 1024:.1f} КиБ", file=sys.stderr)
+    return 0
+
+
+def since_arg(text):
+    """READINGS[:CALIBRATIONS] -> (readings, calibrations)"""
+    try:
+        readings, _, calibrations = text.partition(':')
+        return int(readings), int(calibrations or 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается номер_показания[:номер_таблицы], получено {text!r}")
+
+
+def run_sync_export(args):
+    if args.workbook:
+        tables = load_calibration_tables(args.workbook)
+        print(f"новых версий таблиц: {record_calibrations(args.database, tables)}", file=sys.stderr)
+    info = export_bundle(args.database, args.directory, args.since, args.station)
+    print(info.summary() if info is not None else "новых данных нет", file=sys.stderr)
+    return 0
+
+
+def run_sync_import(args):
+    summary = import_directory(args.database, args.directory)
+    print(summary.summary(), file=sys.stderr)
+    for failure in summary.failures:
+        print(f"  {failure}", file=sys.stderr)
+    return 1 if summary.failures else 0
+
+
+def receipt_arg(text):
+    """TANK:HEIGHT_MM:LITERS -> (tank, height, liters)"""
+    try:
+        tank, height, liters = text.split(':')
+        return int(tank), int(height), float(liters)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается резервуар:высота_мм:литры, получено {text!r}")
+
+
+def run_plan(args):
+    tanks = workbook_tanks(args)
+    if tanks is None:
+        return 1
+    for tank in tanks.values():
+        tank.set_interpolation(args.interpolation)
+    unknown = [tank for tank, _, _ in args.receipt if tank not in tanks]
+    if unknown:
+        print(f"неизвестные резервуары: {unknown}", file=sys.stderr)
+        return 1
+    heights = {tank: height for tank, height, _ in args.receipt}
+    receipts = {tank: liters for tank, _, liters in args.receipt}
+    plans = plan_delivery(tanks, heights, receipts, args.fill_limit)
+
+    with open_stream(args.output, 'w') as target:
+        writer = csv.writer(target)
+        writer.writerow(PLAN_FIELDS)
+        for plan in plans:
+            writer.writerow((plan.tank, plan.height, f"{plan.volume:.1f}", f"{plan.receipt:.1f}",
+                             f"{plan.ullage:.1f}", f"{plan.final_volume:.1f}", f"{plan.final_height:.1f}",
+                             f"{plan.overflow:.1f}"))
+    print(f"свободно всего: {sum(plan.ullage for plan in plans):,.1f} л", file=sys.stderr)
+    return 1 if any(plan.overflow > 0 for plan in plans) else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Калькулятор топлива: пакетный расчет")
+    parser.add_argument('--timings', action='store_true', help="замеры участков расчета в stderr")
+    parser.add_argument('--cprofile', metavar='FILE', help="выполнить команду под cProfile и сохранить .prof")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    volumes = commands.add_parser('volumes', help="объем и масса по показаниям tank, height_mm, density[, temperature]")
+    volumes.add_argument('readings', nargs='?', default='-', help="файл CSV/JSONL или '-' для stdin")
+    volumes.add_argument('-w', '--workbook', help="файл градуировочных таблиц (по умолчанию резерв.xlsx)")
+    volumes.add_argument('-o', '--output', default='-', help="файл результата или '-' для stdout")
+    volumes.add_argument('--input-format', choices=['csv', 'jsonl'])
+    volumes.add_argument('--output-format', choices=['csv', 'jsonl'])
+    volumes.add_argument('--summary', action='store_true', help="вывести итоги в stderr")
+    volumes.add_argument('--lookup', choices=LOOKUP_MODES, default=LOOKUP_SEARCH,
+                         help="бинарный поиск по таблице или плотный индекс по миллиметрам")
+    volumes.add_argument('--interpolation', choices=INTERPOLATION_MODES, default=INTERPOLATION_LINEAR,
+                         help="линейная интерполяция или монотонный кубический сплайн между строками таблицы")
+    volumes.add_argument('--density-at', choices=[DENSITY_STANDARD, DENSITY_OBSERVED], default=DENSITY_STANDARD,
+                         help="плотность в показаниях: при 15 °C или при температуре продукта")
+    volumes.add_argument('--tolerance', type=float,
+                         help="проредить таблицы до ошибки интерполяции не больше заданной, л "
+                              "(вместо decimate_tolerance из tanks.json)")
+    volumes.set_defaults(func=run_volumes)
+
+    fleet = commands.add_parser('fleet', help="итоги по парку станций: <станция>.xlsx + <станция>.csv/.jsonl "
+                                              "[+ <станция>.tanks.json]")
+    fleet.add_argument('stations', help="каталог с файлами таблиц станций")
+    fleet.add_argument('--readings-dir', help="каталог с показаниями (по умолчанию тот же)")
+    fleet.add_argument('-j', '--jobs', type=int, help="число процессов (по умолчанию число ядер)")
+    fleet.add_argument('-o', '--output', default='-', help="файл результата или '-' для stdout")
+    fleet.set_defaults(func=run_fleet_command)
+
+    telemetry = commands.add_parser('telemetry', help="прием показаний уровнемеров по TCP/HTTP")
+    telemetry.add_argument('address', nargs='?', default=str(DEFAULT_PORT), help="[host:]port")
+    telemetry.add_argument('-w', '--workbook', help="файл градуировочных таблиц (по умолчанию резерв.xlsx)")
+    telemetry.add_argument('--serial', help="последовательный порт или FIFO с теми же строками")
+    telemetry.add_argument('--history', help="дописывать рассчитанные показания в history.sqlite3")
+    telemetry.add_argument('-o', '--output', default='-', help="файл JSONL результатов или '-' для stdout")
+    telemetry.set_defaults(func=run_telemetry)
+
+    gauge = commands.add_parser('gauge', help="имитатор уровнемера для проверки приема")
+    gauge.add_argument('address', nargs='?', default=str(DEFAULT_PORT), help="[host:]port")
+    gauge.add_argument('--tanks', default='1:32000,2:32000,3:32000,4:32000',
+                       help="резервуары и высоты взлива, мм: 1:32000,2:12000")
+    gauge.add_argument('--count', type=int, default=10000, help="число показаний")
+    gauge.add_argument('--rate', type=float, default=100, help="показаний в секунду (0 - без ограничения)")
+    gauge.add_argument('--seed', type=int)
+    gauge.set_defaults(func=run_gauge)
+
+    history = commands.add_parser('history', help="выборка из истории расчетов приложения")
+    history.add_argument('database', help="файл history.sqlite3")
+    history.add_argument('--tank', help="номер резервуара или automobile/pipeline")
+    history.add_argument('--since', help="с даты YYYY-MM-DD включительно")
+    history.add_argument('--until', help="по дату YYYY-MM-DD включительно")
+    history.add_argument('--daily', action='store_true', help="итоги по дням вместо показаний")
+    history.add_argument('-o', '--output', default='-', help="файл результата или '-' для stdout")
+    history.set_defaults(func=run_history)
+
+    report = commands.add_parser('report', help="отчет по истории: CSV, XLSX или PDF по расширению файла")
+    report.add_argument('database', help="файл history.sqlite3")
+    report.add_argument('-o', '--output', default='-', help="файл .csv/.xlsx/.pdf или '-' для CSV в stdout")
+    report.add_argument('--tank', help="только один объект")
+    report.add_argument('--since', help="с даты YYYY-MM-DD включительно")
+    report.add_argument('--until', help="по дату YYYY-MM-DD включительно")
+    report.add_argument('--title', help="заголовок отчета")
+    report.add_argument('--font', help="шрифт TrueType для PDF (по умолчанию системный с кириллицей)")
+    report.set_defaults(func=run_report)
+
+    losses = commands.add_parser('losses', help="движение запасов, потери и суточный баланс по истории (код 1 при отметках)")
+    losses.add_argument('database', help="файл history.sqlite3")
+    losses.add_argument('-w', '--workbook', help="файл градуировочных таблиц (по умолчанию резерв.xlsx)")
+    losses.add_argument('--tank', help="только один резервуар")
+    losses.add_argument('--since', help="с даты YYYY-MM-DD включительно")
+    losses.add_argument('--until', help="по дату YYYY-MM-DD включительно")
+    losses.add_argument('--journal', help="CSV операций tank, ts, volume_l (приход +, расход -)")
+    losses.add_argument('--loss-rate', type=float, default=LOSS_RATE, help="порог убыли в покое, л/ч")
+    losses.add_argument('-o', '--output', default='-', help="баланс в .csv/.xlsx/.pdf или '-' для CSV в stdout")
+    losses.add_argument('--events', help="отмеченные показания в .csv/.xlsx/.pdf")
+    losses.add_argument('--font', help="шрифт TrueType для PDF")
+    losses.set_defaults(func=run_losses)
+
+    validate = commands.add_parser('validate', help="проверка градуировочных таблиц (код 1 при замечаниях)")
+    validate.add_argument('workbook', nargs='?', help="файл таблиц (по умолчанию резерв.xlsx)")
+    validate.add_argument('--tanks', type=int, default=TANK_COUNT, help="число блоков таблиц в листе")
+    validate.add_argument('--json', action='store_true', help="замечания в JSON")
+    validate.set_defaults(func=run_validate)
+
+    decimate = commands.add_parser('decimate', help="прореживание таблиц: сколько строк нужно при допуске ошибки")
+    decimate.add_argument('workbook', nargs='?', help="файл таблиц (по умолчанию резерв.xlsx)")
+    decimate.add_argument('--tanks', type=int, default=TANK_COUNT, help="число блоков таблиц в листе")
+    decimate.add_argument('--tolerance', type=float, default=DECIMATE_TOLERANCE,
+                          help="допустимая ошибка линейной интерполяции, л")
+    decimate.add_argument('--json', action='store_true', help="итоги в JSON")
+    decimate.set_defaults(func=run_decimate)
+
+    sync_export = commands.add_parser('sync-export', help="пакет новых показаний и версий таблиц станции в каталог обмена")
+    sync_export.add_argument('database', help="база истории станции")
+    sync_export.add_argument('directory', help="каталог обмена")
+    sync_export.add_argument('--station', help="имя станции (задается при первой выгрузке)")
+    sync_export.add_argument('--since', type=since_arg,
+                             help="номер_показания[:номер_таблицы] (по умолчанию - с прошлой выгрузки)")
+    sync_export.add_argument('-w', '--workbook', help="сначала записать версии таблиц из этого файла")
+    sync_export.set_defaults(func=run_sync_export)
+
+    sync_import = commands.add_parser('sync-import', help="прием пакетов каталога обмена в базу (повторный прием не дублирует)")
+    sync_import.add_argument('database', help="центральная база истории")
+    sync_import.add_argument('directory', help="каталог обмена")
+    sync_import.set_defaults(func=run_sync_import)
+
+    plan = commands.add_parser('plan', help="план приемки: свободный объем и высота после слива (код 1 при переливе)")
+    plan.add_argument('--receipt', type=receipt_arg, action='append', required=True,
+                      help="резервуар:текущая_высота_мм:объем_приемки_л, можно несколько")
+    plan.add_argument('-w', '--workbook', help="файл градуировочных таблиц (по умолчанию резерв.xlsx)")
+    plan.add_argument('--fill-limit', type=float, default=1.0, help="допустимая доля вместимости")
+    plan.add_argument('--interpolation', choices=INTERPOLATION_MODES, default=INTERPOLATION_LINEAR)
+    plan.add_argument('-o', '--output', default='-', help="файл результата или '-' для stdout")
+    plan.set_defaults(func=run_plan)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'history' and not args.daily and args.tank is None:
+        parser.error("для выборки показаний нужен --tank (или --daily)")
+    if args.timings:
+        timings.enable()
+    try:
+        if args.cprofile:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(args.func, args)
+            finally:
+                profiler.dump_stats(args.cprofile)
+        return args.func(args)
+    finally:
+        if timings.enabled:
+            print(timings.text(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+import json
+from functools import partial
+
+import numpy as np
+
+from calibration import CalibrationTable
+from calibration_cache import load_cached_tables
+from density import DEFAULT_PRODUCT, STANDARD_TEMPERATURE, correct, observed_volumes
+from instrumentation import timed
+from workbook import TANK_COUNT, WorkbookTables, find_file, find_workbook
+
+DEFAULT_DENSITY = 0.85
+
+TANK_CONFIG_PATHS = [
+    '/storage/emulated/0/tanks.json',
+    './tanks.json',
+    'tanks.json'
+]
+
+DECIMATE_TOLERANCE = 0.1
+
+LOOKUP_SEARCH = 'search'
+LOOKUP_DENSE = 'dense'
+LOOKUP_MODES = (LOOKUP_SEARCH, LOOKUP_DENSE)
+
+INTERPOLATION_LINEAR = 'linear'
+INTERPOLATION_CUBIC = 'cubic'
+INTERPOLATION_MODES = (INTERPOLATION_LINEAR, INTERPOLATION_CUBIC)
+
+
+class FuelTank:
+    def __init__(self, number: int, calibration, name: str = ""):
+        """calibration - таблица или функция без аргументов, возвращающая ее при первом обращении"""
+        self.number = number
+        self.name = name or f"Резервуар {number}"
+        self._calibration = None if callable(calibration) else calibration
+        self._loader = calibration if callable(calibration) else None
+        self.source = None  # файл таблиц; None - тестовая градуировка
+        self.calibration_version = 0
+        self.density = 0.83
+        self.current_height = 0
+        self.lookup = LOOKUP_SEARCH
+        self.interpolation = INTERPOLATION_LINEAR
+        self.product = DEFAULT_PRODUCT
+        self.temperature = None
+        self.density_temperature = STANDARD_TEMPERATURE
+        self.results_cache = None
+
+    @property
+    def calibration(self) -> CalibrationTable:
+        if self._calibration is None:
+            self._calibration = self._loader()
+        return self._calibration
+
+    def load(self) -> CalibrationTable:
+        """Прочитать отложенную таблицу сейчас, например в фоновом потоке до первого расчета"""
+        return self.calibration
+
+    @property
+    def loaded(self) -> bool:
+        """Таблица уже прочитана (обращение к calibration не будет читать книгу)"""
+        return self._calibration is not None
+
+    @property
+    def max_height_mm(self) -> float:
+        return self.calibration.max_height_mm
+
+    @property
+    def calibration_key(self) -> str:
+        """Отпечаток таблицы и режима интерполяции - часть ключа кэша результатов"""
+        return f"{self.calibration.digest()}:{self.interpolation}"
+
+    def set_calibration(self, calibration: CalibrationTable):
+        self._calibration = calibration
+        self.calibration_version += 1
+
+    def decimate(self, tolerance: float = DECIMATE_TOLERANCE):
+        """Заменить таблицу прореженной с ошибкой интерполяции до tolerance л; итоги прореживания"""
+        self.set_calibration(self.calibration.decimated(tolerance))
+        return self.calibration.decimation
+
+    def set_height(self, height_mm: int):
+        self.current_height = height_mm
+
+    def set_density(self, density: float):
+        self.density = density
+
+    def set_temperature(self, temperature, density_temperature=STANDARD_TEMPERATURE):
+        """Температура продукта; None - масса по плотности без приведения к 15 °C"""
+        self.temperature = temperature
+        self.density_temperature = density_temperature
+
+    def set_lookup(self, lookup: str):
+        """Бинарный поиск по таблице или плотный индекс по миллиметрам"""
+        if lookup not in LOOKUP_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {lookup}")
+        self.lookup = lookup
+
+    def set_interpolation(self, interpolation: str):
+        """Линейная интерполяция между строками таблицы или монотонный кубический сплайн"""
+        if interpolation not in INTERPOLATION_MODES:
+            raise ValueError(f"Неизвестный режим интерполяции: {interpolation}")
+        self.interpolation = interpolation
+
+    def volumes_for_heights(self, heights) -> np.ndarray:
+        heights = np.asarray(heights)
+        if self.interpolation == INTERPOLATION_CUBIC:
+            return self.calibration.cubic_volumes(heights)
+        if self.lookup == LOOKUP_DENSE and heights.dtype.kind in 'iu':
+            return self.calibration.dense_volumes(heights)
+        return self.calibration.volumes(heights)
+
+    @timed('tank.get_volume')
+    def get_volume(self) -> float:
+        """Объем при текущей высоте; с results_cache (ResultsCache) - через общий кэш"""
+        if self.results_cache is None:
+            return self.volumes_for_heights(self.current_height)[()]
+        key = (self.number, self.calibration_key, self.current_height)
+        volume = self.results_cache.get(key)
+        if volume is None:
+            volume = self.volumes_for_heights(self.current_height)[()]
+            self.results_cache.put(key, volume)
+        return volume
+
+    @property
+    def capacity(self) -> float:
+        """Объем при максимальной высоте таблицы, л"""
+        return self.calibration.top_liters
+
+    def heights_for_volumes(self, volumes) -> np.ndarray:
+        """Обратный расчет: высоты, мм, для массива объемов, л (в режиме интерполяции резервуара)"""
+        if self.interpolation == INTERPOLATION_CUBIC:
+            return self.calibration.cubic_heights_for_volumes(volumes)
+        return self.calibration.heights_for_volumes(volumes)
+
+    def height_for_volume(self, volume: float) -> float:
+        return self.heights_for_volumes(volume)[()]
+
+    def volumes_for_masses(self, masses) -> np.ndarray:
+        """Объемы при текущей плотности (и температуре, если задана) для массива масс, кг"""
+        if self.temperature is None:
+            return np.asarray(masses, dtype=float) / self.density
+        return observed_volumes(masses, self.density, self.temperature, self.product, self.density_temperature)
+
+    def heights_for_masses(self, masses) -> np.ndarray:
+        return self.heights_for_volumes(self.volumes_for_masses(masses))
+
+    def height_for_mass(self, mass: float) -> float:
+        return self.heights_for_masses(mass)[()]
+
+    def get_mass(self) -> float:
+        return self.mass_for_volume(self.get_volume())
+
+    @timed('tank.mass')
+    def mass_for_volume(self, volume) -> float:
+        if self.temperature is None:
+            return round(volume * self.density, 1)
+        return correct(volume, self.density, self.temperature, self.product, self.density_temperature)[1][()]
+
+    def get_volume_15(self) -> float:
+        """Объем, приведенный к 15 °C (без температуры - как get_volume)"""
+        if self.temperature is None:
+            return self.get_volume()
+        return correct(self.get_volume(), self.density, self.temperature,
+                       self.product, self.density_temperature)[0][()]
+
+
+class ManualStorage:
+    def __init__(self, name: str, volume: float = 0.0):
+        self.name = name
+        self.volume = volume
+        self.density = 0.85
+        self.product = DEFAULT_PRODUCT
+        self.temperature = None
+        self.density_temperature = STANDARD_TEMPERATURE
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+
+    def set_density(self, density: float):
+        self.density = density
+
+    def set_temperature(self, temperature, density_temperature=STANDARD_TEMPERATURE):
+        """Температура продукта; None - масса по плотности без приведения к 15 °C"""
+        self.temperature = temperature
+        self.density_temperature = density_temperature
+
+    def get_volume(self) -> float:
+        return round(self.volume, 1)
+
+    def get_mass(self) -> float:
+        if self.temperature is None:
+            return round(self.volume * self.density, 1)
+        return correct(self.volume, self.density, self.temperature, self.product, self.density_temperature)[1][()]
+
+    def get_volume_15(self) -> float:
+        if self.temperature is None:
+            return self.get_volume()
+        return correct(self.volume, self.density, self.temperature,
+                       self.product, self.density_temperature)[0][()]
+
+
+def masses(volumes, densities) -> np.ndarray:
+    """Массы по объемам и плотностям с округлением как в get_mass"""
+    return np.round(np.asarray(volumes) * densities, 1)
+
+
+class Totals:
+    """Итоги расчета: общий объем, масса и средняя плотность"""
+
+    def __init__(self):
+        self.volume = 0
+        self.mass = 0
+
+    def add(self, volume, mass):
+        self.volume += volume
+        self.mass += mass
+
+    def merge(self, other):
+        self.add(other.volume, other.mass)
+
+    @property
+    def average_density(self) -> float:
+        return self.mass / self.volume if self.volume > 0 else 0.0
+
+
+class CalculationEntry:
+    """Запомненный результат расчета одного объекта"""
+
+    __slots__ = ('inputs', 'name', 'height', 'density', 'volume', 'mass')
+
+    def __init__(self, inputs, name, height, density, volume, mass):
+        self.inputs = inputs
+        self.name = name
+        self.height = height
+        self.density = density
+        self.volume = volume
+        self.mass = mass
+
+
+class CalculationModel:
+    """Расчет с запоминанием: пересчитываются только объекты с измененными входами
+
+    Результат резервуара зависит от высоты, плотности, температуры и версии градуировки.
+    Итоги обновляются на разницу между старым и новым результатом в целых десятых
+    (результаты округлены до 0.1): сумма точная, после возврата к нулю ровно 0.0.
+    """
+
+    def __init__(self, tanks: dict, storages: dict):
+        self.tanks = tanks
+        self.storages = storages
+        self.entries = {}
+        self.totals = Totals()
+        self.recalculations = 0
+        self._tenths = [0, 0]  # итоги объема и массы в десятых долях
+
+    def update_tank(self, tank_num: int, height: int, density: float) -> CalculationEntry:
+        tank = self.tanks[tank_num]
+        inputs = (height, density, tank.temperature, tank.density_temperature,
+                  tank.product, tank.interpolation, tank.calibration_version)
+        entry = self.entries.get(tank_num)
+        if entry is not None and entry.inputs == inputs:
+            return entry
+
+        tank.set_height(height)
+        tank.set_density(density)
+        volume = tank.get_volume()
+        mass = tank.mass_for_volume(volume)
+        return self._store(tank_num, CalculationEntry(inputs, tank.name, height, density, volume, mass))
+
+    def update_storage(self, key: str, volume: float, density: float) -> CalculationEntry:
+        storage = self.storages[key]
+        inputs = (volume, density, storage.temperature, storage.density_temperature, storage.product)
+        entry = self.entries.get(key)
+        if entry is not None and entry.inputs == inputs:
+            return entry
+
+        storage.set_volume(volume)
+        storage.set_density(density)
+        return self._store(key, CalculationEntry(inputs, storage.name, None, density, volume, storage.get_mass()))
+
+    def _store(self, key, entry: CalculationEntry) -> CalculationEntry:
+        previous = self.entries.get(key)
+        if previous is not None:
+            self._shift(previous, -1)
+        self.entries[key] = entry
+        self._shift(entry, 1)
+        self.recalculations += 1
+        return entry
+
+    def discard(self, key):
+        """Убрать объект из итогов (например, после смены набора резервуаров)"""
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self._shift(previous, -1)
+
+    def _shift(self, entry: CalculationEntry, sign: int):
+        self._tenths[0] += sign * round(entry.volume * 10)
+        self._tenths[1] += sign * round(entry.mass * 10)
+        self.totals.volume = self._tenths[0] / 10
+        self.totals.mass = self._tenths[1] / 10
+
+    def ordered_entries(self) -> list:
+        """Пары (ключ, результат): резервуары по номеру, затем ручные объекты"""
+        keys = sorted(self.tanks) + list(self.storages)
+        return [(key, self.entries[key]) for key in keys if key in self.entries]
+
+
+class DeliveryPlan:
+    """План приемки в один резервуар: объемы, л, высоты, мм"""
+
+    __slots__ = ('tank', 'height', 'volume', 'receipt', 'ullage', 'final_volume', 'final_height', 'overflow')
+
+    def __init__(self, tank, height, volume, receipt, ullage, final_volume, final_height, overflow):
+        self.tank = tank
+        self.height = height
+        self.volume = volume
+        self.receipt = receipt
+        self.ullage = ullage
+        self.final_volume = final_volume
+        self.final_height = final_height
+        self.overflow = overflow
+
+
+def plan_delivery(tanks: dict, heights: dict, receipts: dict, fill_limit: float = 1.0) -> list:
+    """Свободный объем и высота после приемки для каждого резервуара из receipts
+
+    heights - текущие высоты, мм (нет высоты - пустой резервуар), receipts - объемы приемки, л,
+    fill_limit - допустимая доля вместимости. Что не помещается до предела, попадает в overflow.
+    """
+    plans = []
+    for tank_num, receipt in receipts.items():
+        tank = tanks[tank_num]
+        height = heights.get(tank_num, 0)
+        volume = float(tank.volumes_for_heights(height))
+        limit = float(tank.capacity) * fill_limit
+        final_volume = max(min(volume + receipt, limit), volume)
+        plans.append(DeliveryPlan(
+            tank_num, height, volume, receipt,
+            ullage=round(max(limit - volume, 0.0), 1),
+            final_volume=round(final_volume, 1),
+            final_height=float(tank.height_for_volume(final_volume)),
+            overflow=round(volume + receipt - final_volume, 1),
+        ))
+    return plans
+
+
+def tank_name(tank_num: int) -> str:
+    if tank_num == 5:
+        return "⛽ Резервуар 5 (Бензин)"
+    return f"Резервуар {tank_num}"
+
+
+class TankConfig:
+    """Описание резервуара: номер (он же номер блока в файле таблиц), имя, плотность, продукт,
+    допуск прореживания таблицы, л (None - таблица используется целиком)
+    """
+
+    __slots__ = ('number', 'name', 'density', 'product', 'tolerance')
+
+    def __init__(self, number: int, name: str = "", density: float = DEFAULT_DENSITY,
+                 product: str = DEFAULT_PRODUCT, tolerance: float = None):
+        self.number = number
+        self.name = name or tank_name(number)
+        self.density = density
+        self.product = product
+        self.tolerance = float(tolerance) if tolerance else None
+
+
+def default_tank_config(count: int = TANK_COUNT) -> list:
+    densities = {1: 0.83, 5: 0.74}
+    return [TankConfig(num, density=densities.get(num, DEFAULT_DENSITY)) for num in range(1, count + 1)]
+
+
+def load_tank_config(path=None) -> list:
+    """Список резервуаров из tanks.json; без файла - 8 резервуаров по умолчанию
+
+    Формат: {"tanks": [{"number": 1, "name": "...", "density": 0.83, "product": "products"}, ...]}
+    или {"count": 60} для резервуаров 1..60 с именами по умолчанию. Необязательный
+    "decimate_tolerance" (л) - прореживание таблиц при сборке кэша, на верхнем уровне
+    для всех резервуаров или в описании одного.
+    """
+    path = path or find_file(TANK_CONFIG_PATHS)
+    if path is None:
+        return default_tank_config()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    tolerance = data.get('decimate_tolerance')
+    if 'tanks' not in data:
+        config = default_tank_config(int(data.get('count', TANK_COUNT)))
+        for tank in config:
+            tank.tolerance = float(tolerance) if tolerance else None
+    else:
+        config = [
+            TankConfig(int(item['number']), item.get('name', ""), float(item.get('density', DEFAULT_DENSITY)),
+                       item.get('product', DEFAULT_PRODUCT), item.get('decimate_tolerance', tolerance))
+            for item in data['tanks']
+        ]
+    if not config:
+        raise ValueError(f"{path}: нет ни одного резервуара")
+    return sorted(config, key=lambda tank: tank.number)
+
+
+def create_test_tank(tank_num: int, name: str = "") -> FuelTank:
+    """Резервуар с тестовой градуировкой"""
+    heights = list(range(0, 32001, 1000))
+    coefficients = {1: 3.0, 2: 3.1, 3: 3.2, 4: 3.3, 5: 2.8, 6: 2.9, 7: 3.0, 8: 3.1}
+    coefficient = coefficients.get(tank_num, 3.0)
+    volumes = [h * coefficient for h in heights]
+    return FuelTank(tank_num, CalibrationTable(heights, volumes), name or tank_name(tank_num))
+
+
+def workbook_table(tanks: dict, tank_num: int, tables, fallback: bool) -> CalibrationTable:
+    """Таблица резервуара из книги при первом обращении; пустой блок, как и в книге без
+    отложенного чтения, заменяется тестовыми данными (с fallback)
+    """
+    table = tables[tank_num]
+    if table.empty and fallback:
+        tanks[tank_num].source = None
+        return create_test_tank(tank_num).calibration
+    return table
+
+
+@timed('load_tanks')
+def load_tanks(file_path=None, fallback: bool = True, config=None, tolerance: float = None) -> dict:
+    """Резервуары из файла таблиц; недостающие заполняются тестовыми данными
+
+    С fallback=False ошибки чтения не подавляются, тестовые данные не добавляются и все
+    таблицы читаются сразу. Иначе таблицы книги из нескольких листов без кэша читаются при
+    первом расчете резервуара (ошибки чтения такого листа - тоже при нем). Таблицы
+    резервуаров с допуском в config (или всех - с tolerance) прореживаются при сборке кэша
+    таблиц и хранятся в нем прореженными (итоги - в calibration.decimation).
+    """
+    config = config or load_tank_config()
+    names = {tank.number: tank.name for tank in config}
+    products = {tank.number: tank.product for tank in config}
+    tolerances = {tank.number: tolerance or tank.tolerance for tank in config}
+    tanks = {}
+    try:
+        file_path = file_path or find_workbook()
+        if file_path is not None:
+            tables = load_cached_tables(file_path, max(names), lazy=fallback, tolerances=tolerances)
+            lazy = isinstance(tables, WorkbookTables)
+            for tank_num in tables:
+                if tank_num in names:
+                    if lazy:
+                        calibration = partial(workbook_table, tanks, tank_num, tables, fallback)
+                    else:
+                        calibration = tables[tank_num]
+                    tanks[tank_num] = FuelTank(tank_num, calibration, names[tank_num])
+                    tanks[tank_num].source = file_path
+    except Exception:
+        if not fallback:
+            raise
+        tanks = {}
+
+    if fallback:
+        for tank_num, name in names.items():
+            if tank_num not in tanks:
+                tanks[tank_num] = create_test_tank(tank_num, name)
+    for tank in tanks.values():
+        tank.product = products[tank.number]
+    return dict(sorted(tanks.items()))
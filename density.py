@@ -0,0 +1,94 @@
+"""Приведение плотности и объема к 15 °C (таблицы ASTM D1250 / API MPMS 11.1)
+
+Коэффициент объемного расширения при 15 °C:
+    alpha = A + K0 / rho15**2 + K1 / rho15, rho15 в кг/м3
+Поправочный коэффициент объема (VCF):
+    vcf = exp(-alpha * dt * (1 + 0.8 * alpha * dt)), dt = t - 15
+"""
+import numpy as np
+
+STANDARD_TEMPERATURE = 15.0
+DEFAULT_PRODUCT = 'products'
+
+_ITERATIONS = 20
+_TOLERANCE = 1e-6
+
+
+class ProductClass:
+    """Коэффициенты класса продукта по диапазонам плотности при 15 °C"""
+
+    __slots__ = ('name', 'bounds', 'a', 'k0', 'k1')
+
+    def __init__(self, name: str, ranges):
+        """ranges: [(нижняя граница rho15 кг/м3, A, K0, K1), ...] по возрастанию"""
+        self.name = name
+        self.bounds, self.a, self.k0, self.k1 = (
+            np.array(column, dtype=float) for column in zip(*ranges)
+        )
+
+    def alpha(self, rho15) -> np.ndarray:
+        idx = np.clip(np.searchsorted(self.bounds, rho15, side='right') - 1, 0, len(self.bounds) - 1)
+        return self.a[idx] + self.k0[idx] / (rho15 * rho15) + self.k1[idx] / rho15
+
+    def vcf(self, rho15, temperature) -> np.ndarray:
+        """Коэффициент приведения объема от температуры t к 15 °C"""
+        alpha = self.alpha(rho15)
+        dt = np.asarray(temperature, dtype=float) - STANDARD_TEMPERATURE
+        return np.exp(-alpha * dt * (1 + 0.8 * alpha * dt))
+
+    def density_at_15(self, density, temperature) -> np.ndarray:
+        """Плотность при 15 °C по плотности, измеренной при температуре t (кг/м3)"""
+        density = np.asarray(density, dtype=float)
+        rho15 = density
+        for _ in range(_ITERATIONS):
+            updated = density / self.vcf(rho15, temperature)
+            converged = not np.any(np.abs(updated - rho15) >= _TOLERANCE)
+            rho15 = updated
+            if converged:
+                break
+        return rho15
+
+
+PRODUCTS = {
+    'crude': ProductClass('crude', [(0.0, 0.0, 613.9723, 0.0)]),
+    'products': ProductClass('products', [
+        (0.0, 0.0, 346.4228, 0.4388),
+        (770.5, -0.00336312, 2680.3206, 0.0),
+        (787.5, 0.0, 594.5418, 0.0),
+        (838.5, 0.0, 186.9696, 0.4862),
+    ]),
+    'lubricants': ProductClass('lubricants', [(0.0, 0.0, 0.0, 0.6278)]),
+}
+
+
+def correct(volumes, densities, temperatures, product: str = DEFAULT_PRODUCT,
+            density_temperature=STANDARD_TEMPERATURE):
+    """Объем при 15 °C и масса для массивов показаний
+
+    volumes - объем при температуре продукта, л; densities - плотность, кг/л,
+    измеренная при density_temperature (None - при температуре продукта).
+    Возвращает (volume15, mass) с округлением до 0.1, как в get_mass.
+    """
+    product_class = PRODUCTS[product]
+    temperatures = np.asarray(temperatures, dtype=float)
+    rho15 = _rho15(product_class, densities, temperatures, density_temperature)
+    volume15 = np.asarray(volumes, dtype=float) * product_class.vcf(rho15, temperatures)
+    return np.round(volume15, 1), np.round(volume15 * rho15 / 1000, 1)
+
+
+def observed_volumes(masses, densities, temperatures, product: str = DEFAULT_PRODUCT,
+                     density_temperature=STANDARD_TEMPERATURE) -> np.ndarray:
+    """Объем при температуре продукта для массы, кг (обратная к correct, без округления)"""
+    product_class = PRODUCTS[product]
+    temperatures = np.asarray(temperatures, dtype=float)
+    rho15 = _rho15(product_class, densities, temperatures, density_temperature)
+    return np.asarray(masses, dtype=float) * 1000 / (rho15 * product_class.vcf(rho15, temperatures))
+
+
+def _rho15(product_class, densities, temperatures, density_temperature) -> np.ndarray:
+    density = np.asarray(densities, dtype=float) * 1000
+    if density_temperature is None:
+        return product_class.density_at_15(density, temperatures)
+    if density_temperature != STANDARD_TEMPERATURE:
+        return product_class.density_at_15(density, density_temperature)
+    return density
@@ -0,0 +1,81 @@
+"""Расчет по парку станций: таблицы и показания каждой станции в отдельном процессе"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from core import Totals, default_tank_config, load_tank_config, load_tanks
+from readings import detect_format, iter_chunks, open_stream, read_readings
+
+READINGS_SUFFIXES = ('.csv', '.jsonl', '.ndjson')
+CONFIG_SUFFIX = '.tanks.json'
+MAX_MESSAGES = 20
+
+
+class StationResult:
+    """Итоги одной станции"""
+
+    def __init__(self, station: str):
+        self.station = station
+        self.readings = 0
+        self.errors = 0
+        self.messages = []
+        self.failure = None
+        self.totals = Totals()
+
+    def on_error(self, line, message):
+        self.errors += 1
+        if len(self.messages) < MAX_MESSAGES:
+            self.messages.append(f"запись {line}: {message}")
+
+
+def discover_stations(workbook_dir, readings_dir=None) -> list:
+    """(станция, файл таблиц, файл показаний, список резервуаров) по имени файла:
+    <станция>.xlsx + <станция>.csv и необязательный <станция>.tanks.json (нет - None)
+    """
+    stations = []
+    for name in sorted(os.listdir(workbook_dir)):
+        station, ext = os.path.splitext(name)
+        if ext.lower() != '.xlsx' or name.startswith('~$'):
+            continue
+        for suffix in READINGS_SUFFIXES:
+            readings_path = os.path.join(readings_dir or workbook_dir, station + suffix)
+            if os.path.exists(readings_path):
+                config_path = os.path.join(workbook_dir, station + CONFIG_SUFFIX)
+                stations.append((station, os.path.join(workbook_dir, name), readings_path,
+                                 config_path if os.path.exists(config_path) else None))
+                break
+    return stations
+
+
+def process_station(station, workbook_path, readings_path, config_path=None) -> StationResult:
+    """Загрузка таблиц станции и расчет всех ее показаний
+
+    Список резервуаров - только из config_path (None - резервуары книги по умолчанию),
+    tanks.json текущего каталога на станции не влияет.
+    """
+    result = StationResult(station)
+    try:
+        config = load_tank_config(config_path) if config_path else default_tank_config()
+        tanks = load_tanks(workbook_path, fallback=False, config=config)
+        with open_stream(readings_path, 'r') as source:
+            readings = read_readings(source, detect_format(readings_path))
+            for _, _, _, _, volumes, _, masses in iter_chunks(readings, tanks, result.on_error):
+                result.readings += len(volumes)
+                result.totals.add(float(volumes.sum()), float(masses.sum()))
+    except Exception as e:
+        result.failure = str(e)
+    return result
+
+
+def run_fleet(stations, jobs=None):
+    """Расчет станций в пуле процессов; возвращает результаты по станциям и общий итог"""
+    if jobs == 1:
+        results = [process_station(*station) for station in stations]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(process_station, *station) for station in stations]
+            results = [future.result() for future in futures]
+
+    totals = Totals()
+    for result in results:
+        totals.merge(result.totals)
+    return results, totals
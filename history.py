@@ -0,0 +1,272 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+HISTORY_FILE = 'history.sqlite3'
+BATCH_SIZE = 500
+FLUSH_TIMEOUT = 30
+
+log = logging.getLogger('fuelcalc.history')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    tank TEXT NOT NULL,
+    height INTEGER,
+    density REAL NOT NULL,
+    volume REAL NOT NULL,
+    mass REAL NOT NULL,
+    station TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_tank_ts ON readings (tank, ts);
+CREATE TABLE IF NOT EXISTS daily (
+    tank TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    volume_sum REAL NOT NULL,
+    mass_sum REAL NOT NULL,
+    volume_min REAL NOT NULL,
+    volume_max REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    last_volume REAL NOT NULL,
+    last_mass REAL NOT NULL,
+    PRIMARY KEY (tank, day)
+);
+"""
+
+DAILY_UPDATE = """
+UPDATE daily SET
+    count = count + ?,
+    volume_sum = volume_sum + ?,
+    mass_sum = mass_sum + ?,
+    volume_min = min(volume_min, ?),
+    volume_max = max(volume_max, ?),
+    last_volume = CASE WHEN ? >= last_ts THEN ? ELSE last_volume END,
+    last_mass = CASE WHEN ? >= last_ts THEN ? ELSE last_mass END,
+    last_ts = max(last_ts, ?)
+WHERE tank = ? AND day = ?
+"""
+
+
+_last_day = (0.0, 0.0, '')
+
+
+def day_of(ts: float) -> str:
+    """Местная дата 'YYYY-MM-DD'; границы последнего дня запоминаются (показания идут по времени)"""
+    global _last_day
+    start, end, day = _last_day
+    if start <= ts < end:
+        return day
+    local = time.localtime(ts)
+    day = time.strftime('%Y-%m-%d', local)
+    start = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    _last_day = (start, end, day)
+    return day
+
+
+def ensure_schema(db):
+    """Таблицы истории; в базе прежней версии добавляется колонка readings.station"""
+    db.executescript(SCHEMA)
+    columns = {row[1] for row in db.execute('PRAGMA table_info(readings)')}
+    if 'station' not in columns:
+        db.execute('ALTER TABLE readings ADD COLUMN station TEXT')
+        db.commit()
+
+
+def insert_rows(db, rows, station=None):
+    """Показания (ts, tank, height, density, volume, mass) и их дневные итоги в текущую транзакцию db
+
+    station - станция-источник принятых показаний (None - свои).
+    """
+    days = {}
+    for ts, tank, height, density, volume, mass in rows:
+        key = (tank, day_of(ts))
+        day = days.get(key)
+        if day is None:
+            days[key] = [1, volume, mass, volume, volume, ts, volume, mass]
+            continue
+        day[0] += 1
+        day[1] += volume
+        day[2] += mass
+        day[3] = min(day[3], volume)
+        day[4] = max(day[4], volume)
+        if ts >= day[5]:
+            day[5:] = [ts, volume, mass]
+
+    if station is None:
+        db.executemany(
+            'INSERT INTO readings (ts, tank, height, density, volume, mass) VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+    else:
+        db.executemany(
+            'INSERT INTO readings (ts, tank, height, density, volume, mass, station) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(*row, station) for row in rows]
+        )
+    for (tank, day), (count, volume_sum, mass_sum, volume_min, volume_max,
+                      last_ts, last_volume, last_mass) in days.items():
+        db.execute(
+            'INSERT OR IGNORE INTO daily VALUES (?, ?, 0, 0, 0, ?, ?, ?, ?, ?)',
+            (tank, day, volume_min, volume_max, last_ts, last_volume, last_mass)
+        )
+        db.execute(DAILY_UPDATE, (
+            count, volume_sum, mass_sum, volume_min, volume_max,
+            last_ts, last_volume, last_ts, last_mass, last_ts, tank, day
+        ))
+
+
+class HistoryStore:
+    """История расчетов в SQLite с записью пакетами в фоновом потоке
+
+    Строка показания: (ts, tank, height, density, volume, mass), где tank -
+    номер резервуара или ключ ручного объекта (у показаний, принятых от других станций, -
+    "станция/ключ", см. sync.py). Дневные итоги ведутся
+    в отдельной таблице при записи, поэтому запросы по дням не сканируют показания.
+    Пакет, который не записался (sqlite3.Error), пропускается: его строки считаются
+    в dropped, ошибка - в last_error, поток записи продолжает работу.
+    """
+
+    def __init__(self, path, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        db = self._connect()
+        try:
+            ensure_schema(db)
+        finally:
+            db.close()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def append(self, rows):
+        """Поставить показания в очередь записи (не блокирует вызывающий поток)"""
+        rows = [(ts, str(tank), height, density, volume, mass)
+                for ts, tank, height, density, volume, mass in rows]
+        if rows:
+            self._queue.put(rows)
+
+    def flush(self, timeout=FLUSH_TIMEOUT) -> bool:
+        """Дождаться обработки всего, что уже поставлено в очередь (timeout, с; None - без ограничения)
+
+        False - очередь не обработана за timeout. Пакеты с ошибкой записи видны по dropped и last_error.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        db = None
+        try:
+            stop = False
+            while not stop:
+                item = self._queue.get()
+                batch, waiters = [], []
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.extend(item)
+                    if stop or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                try:
+                    if batch:
+                        if db is None:
+                            db = self._connect()
+                        self._write(db, batch)
+                except sqlite3.Error as e:
+                    self.dropped += len(batch)
+                    self.last_error = e
+                    log.error("История: не записано показаний: %d (%s)", len(batch), e)
+                    if db is not None:
+                        db.close()
+                        db = None
+                finally:
+                    for waiter in waiters:
+                        waiter.set()
+        finally:
+            if db is not None:
+                db.close()
+
+    def _write(self, db, rows):
+        with db:
+            insert_rows(db, rows)
+
+    def _query(self, sql, params) -> list:
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def tank_range(self, tank, start=None, end=None) -> list:
+        """Показания объекта за [start, end): (ts, height, density, volume, mass)"""
+        sql = 'SELECT ts, height, density, volume, mass FROM readings WHERE tank = ?'
+        params = [str(tank)]
+        if start is not None:
+            sql += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND ts < ?'
+            params.append(end)
+        return self._query(sql + ' ORDER BY ts', params)
+
+    def iter_readings(self, tank=None, start=None, end=None):
+        """Показания за [start, end) по объектам, внутри объекта по времени:
+        (ts, tank, height, density, volume, mass); строки читаются курсором по мере обхода
+        """
+        sql = 'SELECT ts, tank, height, density, volume, mass FROM readings WHERE 1 = 1'
+        params = []
+        if tank is not None:
+            sql += ' AND tank = ?'
+            params.append(str(tank))
+        if start is not None:
+            sql += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND ts < ?'
+            params.append(end)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield from db.execute(sql + ' ORDER BY tank, ts', params)
+        finally:
+            db.close()
+
+    def daily(self, tank=None, start_day=None, end_day=None) -> list:
+        """Итоги по дням [start_day, end_day] в виде 'YYYY-MM-DD':
+        (tank, day, count, avg_volume, avg_mass, min_volume, max_volume, last_volume, last_mass)
+        """
+        sql = ('SELECT tank, day, count, volume_sum / count, mass_sum / count, '
+               'volume_min, volume_max, last_volume, last_mass FROM daily WHERE 1 = 1')
+        params = []
+        if tank is not None:
+            sql += ' AND tank = ?'
+            params.append(str(tank))
+        if start_day is not None:
+            sql += ' AND day >= ?'
+            params.append(start_day)
+        if end_day is not None:
+            sql += ' AND day <= ?'
+            params.append(end_day)
+        return self._query(sql + ' ORDER BY tank, day', params)
@@ -0,0 +1,282 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from time import perf_counter
+
+STARTUP_LOG_ENV = 'FUELCALC_STARTUP_LOG'
+FRAME_OVERLAY_ENV = 'FUELCALC_FRAME_OVERLAY'
+FRAME_BUDGET = 1 / 60
+FRAME_WINDOW = 120
+
+PROFILE_ENV = 'FUELCALC_PROFILE'
+PROFILE_CALC_ENV = 'FUELCALC_PROFILE_CALC'
+TIMINGS_LOG = 'timings.log'
+TIMINGS_LOG_BYTES = 1 << 20
+TIMINGS_LOG_BACKUPS = 3
+TIMINGS_DUMP_INTERVAL = 60
+HISTOGRAM_BUCKETS = 32
+PROFILE_TOP = 30
+
+
+class StartupTimer:
+    """Отметки времени запуска относительно импорта модуля"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def has(self, *names) -> bool:
+        return all(name in self.marks for name in names)
+
+    def report(self) -> dict:
+        """Отметки в миллисекундах"""
+        return {name: round(elapsed * 1000, 1) for name, elapsed in self.marks.items()}
+
+    def dump(self, path=None):
+        """Дописать отчет строкой JSON в файл из FUELCALC_STARTUP_LOG"""
+        path = path or os.environ.get(STARTUP_LOG_ENV)
+        if not path:
+            return
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.report()) + '\n')
+
+
+class FrameStats:
+    """Скользящие окна длительностей кадров и фоновых расчетов
+
+    calculation() вызывается из рабочего потока; добавление в deque потокобезопасно.
+    """
+
+    def __init__(self, window: int = FRAME_WINDOW, budget: float = FRAME_BUDGET):
+        self.budget = budget
+        self.frames = deque(maxlen=window)
+        self.calculations = deque(maxlen=window)
+
+    def frame(self, seconds: float):
+        self.frames.append(seconds)
+
+    def calculation(self, seconds: float):
+        self.calculations.append(seconds)
+
+    def report(self) -> dict:
+        """Миллисекунды: средний и худший кадр, пропуски (кадр > 1.5 бюджета), расчеты"""
+        frames, calculations = list(self.frames), list(self.calculations)
+        return {
+            'budget': round(self.budget * 1000, 1),
+            'frame_avg': round(sum(frames) / len(frames) * 1000, 1) if frames else 0.0,
+            'frame_max': round(max(frames, default=0.0) * 1000, 1),
+            'dropped': sum(1 for frame in frames if frame > 1.5 * self.budget),
+            'calc_last': round(calculations[-1] * 1000, 2) if calculations else 0.0,
+            'calc_max': round(max(calculations, default=0.0) * 1000, 2),
+        }
+
+    def text(self) -> str:
+        r = self.report()
+        return (f"кадр {r['frame_avg']}/{r['frame_max']} мс (бюджет {r['budget']}), пропущено {r['dropped']}\n"
+                f"расчет {r['calc_last']}/{r['calc_max']} мс")
+
+
+class TimingHistogram:
+    """Счетчик вызовов и гистограмма длительностей по степеням двойки микросекунд
+
+    Корзина b - длительности от 2**(b-1) до 2**b мкс; перцентили - верхняя граница корзины.
+    """
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction: float) -> int:
+        """Оценка перцентиля, мкс"""
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= threshold:
+                return 1 << bucket
+        return 0
+
+    def report(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_us': round(self.total / self.count * 1e6, 1) if self.count else 0.0,
+            'p50_us': self.percentile(0.5),
+            'p95_us': self.percentile(0.95),
+            'max_us': round(self.max * 1e6, 1),
+        }
+
+
+class Timings:
+    """Замеры участков кода по имени; включаются FUELCALC_PROFILE или enable()
+
+    Выключенный timed() стоит одной проверки флага. В FUELCALC_PROFILE - путь
+    журнала (или 1 для timings.log в текущем каталоге); журнал с ротацией.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.log_path = None
+        self._lock = threading.Lock()
+        self._logger = None
+        self._profile_next = set()
+        self._scoped = set()
+        setting = os.environ.get(PROFILE_ENV)
+        if setting:
+            self.enable(None if setting == '1' else setting)
+
+    def enable(self, log_path=None):
+        self.enabled = True
+        self.log_path = log_path or self.log_path or TIMINGS_LOG
+
+    def disable(self):
+        self.enabled = False
+
+    def histogram(self, name: str) -> TimingHistogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, TimingHistogram())
+        return histogram
+
+    def record(self, name: str, seconds: float):
+        self.histogram(name).record(seconds)
+
+    def count(self, name: str, n: int = 1):
+        """Счетчик событий под именем name (попадания в кэш и т.п.)"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def span(self, name: str):
+        """Контекстный менеджер для участка кода, который не оформлен функцией"""
+        return _Span(self, name)
+
+    def timed(self, name: str):
+        """Декоратор: время и число вызовов функции под именем name"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                if name in self._profile_next:
+                    return self._profiled(name, func, args, kwargs)
+                start = perf_counter()
+                result = func(*args, **kwargs)
+                self.histogram(name).record(perf_counter() - start)
+                return result
+            return wrapper
+        return decorator
+
+    def profile_next(self, name: str, log_path=None):
+        """Следующий вызов участка name выполнить под cProfile (отчет - в журнал)
+
+        Выключенные замеры включаются только на этот вызов, журнал - log_path.
+        """
+        if not self.enabled:
+            self.enable(log_path)
+            self._scoped.add(name)
+        self._profile_next.add(name)
+
+    def _profiled(self, name, func, args, kwargs):
+        import cProfile
+        import io
+        import pstats
+
+        self._profile_next.discard(name)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.record(name, time.perf_counter() - start)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            if self.log_path:
+                profiler.dump_stats(f"{os.path.splitext(self.log_path)[0]}-{name}-{int(time.time())}.prof")
+            self._log(f"profile {name}\n{text.getvalue()}")
+            if name in self._scoped:
+                self._scoped.discard(name)
+                if not self._scoped:
+                    self.disable()
+
+    def report(self) -> dict:
+        """Сводка по участкам; счетчики пишутся без блокировки, при гонке потоков возможна
+        потеря единичных отсчетов - для профилирования это допустимо
+        """
+        return {name: histogram.report() for name, histogram in sorted(self.histograms.items())}
+
+    def text(self) -> str:
+        lines = [f"{'участок':<28}{'вызовов':>9}{'среднее':>10}{'p95':>9}{'макс':>10}  мкс"]
+        for name, r in self.report().items():
+            lines.append(f"{name:<28}{r['count']:>9}{r['mean_us']:>10}{r['p95_us']:>9}{r['max_us']:>10}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<28}{value:>9}")
+        return "\n".join(lines)
+
+    def dump(self, reset: bool = False):
+        """Отчет строкой JSON в журнал с ротацией"""
+        report = self.report()
+        counters = dict(sorted(self.counters.items()))
+        if reset:
+            with self._lock:
+                self.histograms = {}
+                self.counters = {}
+        self._log(json.dumps({'ts': round(time.time(), 3), 'timings': report, 'counters': counters},
+                             ensure_ascii=False))
+        return report
+
+    def _log(self, message: str):
+        if not self.log_path:
+            return
+        if self._logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+
+            self._logger = logging.getLogger('fuelcalc.timings')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(self.log_path, maxBytes=TIMINGS_LOG_BYTES,
+                                          backupCount=TIMINGS_LOG_BACKUPS, encoding='utf-8')
+            self._logger.addHandler(handler)
+        self._logger.info(message)
+
+
+class _Span:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings.enabled:
+            self.timings.record(self.name, time.perf_counter() - self.start)
+
+
+startup_timer = StartupTimer()
+frame_stats = FrameStats()
+timings = Timings()
+timed = timings.timed
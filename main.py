@@ -1,96 +1,64 @@
+from instrumentation import (FRAME_OVERLAY_ENV, PROFILE_CALC_ENV, PROFILE_ENV, TIMINGS_DUMP_INTERVAL, TIMINGS_LOG,
+                             frame_stats, startup_timer, timed, timings)
+
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+
+from kivy.clock import Clock, mainthread
 from kivy.lang import Builder
-from kivy.properties import NumericProperty, StringProperty
+from kivy.logger import Logger
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.screenmanager import Screen
 from kivymd.app import MDApp
 from kivymd.uix.card import MDCard
 from kivymd.uix.tab import MDTabsBase
 from kivymd.uix.floatlayout import MDFloatLayout
-from kivymd.uix.dialog import MDDialog
-from kivymd.uix.button import MDFlatButton
-
-import pandas as pd
-import os
-
-class FuelTank:
-    def __init__(self, number: int, calibration_data: pd.DataFrame, name: str = ""):
-        self.number = number
-        self.name = name or f"Резервуар {number}"
-        self.calibration_data = calibration_data
-        if not calibration_data.empty:
-            self.max_height_mm = self.calibration_data['height_mm'].max()
-        else:
-            self.max_height_mm = 0
-        self.density = 0.83
-        self.current_height = 0
-
-    def set_height(self, height_mm: int):
-        self.current_height = height_mm
-
-    def set_density(self, density: float):
-        self.density = density
-
-    def get_volume(self) -> float:
-        if self.current_height <= 0 or self.calibration_data.empty:
-            return 0.0
-        elif self.current_height >= self.max_height_mm:
-            return round(self.calibration_data['liters'].iloc[-1], 1)
-        
-        heights = self.calibration_data['height_mm'].values
-        
-        exact_match = self.calibration_data[
-            self.calibration_data['height_mm'] == self.current_height
-        ]
-        if not exact_match.empty:
-            return round(exact_match['liters'].iloc[0], 1)
-        
-        for i in range(len(heights) - 1):
-            if heights[i] < self.current_height < heights[i + 1]:
-                h1, h2 = heights[i], heights[i + 1]
-                v1 = self.calibration_data[
-                    self.calibration_data['height_mm'] == h1
-                ]['liters'].iloc[0]
-                v2 = self.calibration_data[
-                    self.calibration_data['height_mm'] == h2
-                ]['liters'].iloc[0]
-                
-                volume = v1 + (v2 - v1) * (self.current_height - h1) / (h2 - h1)
-                return round(volume, 1)
-        
-        return 0.0
-
-    def get_mass(self) -> float:
-        volume = self.get_volume()
-        return round(volume * self.density, 1)
 
-class ManualStorage:
-    def __init__(self, name: str, volume: float = 0.0):
-        self.name = name
-        self.volume = volume
-        self.density = 0.85
+from core import (CalculationModel, ManualStorage, create_test_tank, default_tank_config, load_tank_config,
+                  load_tanks, plan_delivery)
+from history import HISTORY_FILE, HistoryStore
+from report import ResultSummary, export_report, history_report
+from results_cache import RESULTS_CACHE_FILE, results_cache
+from sync import export_bundle, find_sync_dir, record_calibrations
+from telemetry import TELEMETRY_ENV, TelemetryService, parse_address
+from worker import CoalescingWorker
 
-    def set_volume(self, volume: float):
-        self.volume = volume
-
-    def set_density(self, density: float):
-        self.density = density
-
-    def get_volume(self) -> float:
-        return round(self.volume, 1)
-
-    def get_mass(self) -> float:
-        return round(self.volume * self.density, 1)
+startup_timer.mark('imports')
 
 class Tab(MDFloatLayout, MDTabsBase):
     pass
 
-class TankCard(MDCard):
+class TankCard(RecycleDataViewBehavior, MDCard):
     tank_number = NumericProperty(1)
     tank_name = StringProperty("")
+    height_text = StringProperty("0")
+    density_text = StringProperty("0.85")
+    result_text = StringProperty("")
+    loaded = BooleanProperty(False)
+    refreshing = False
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.elevation = 8
         self.padding = 20
+    
+    def refresh_view_attrs(self, rv, index, data):
+        self.refreshing = True
+        try:
+            super().refresh_view_attrs(rv, index, data)
+        finally:
+            self.refreshing = False
+    
+    def on_input(self, field, text):
+        """Ввод в поле карточки передается в данные резервуара"""
+        if self.refreshing:
+            return
+        setattr(self, field, text)
+        MDApp.get_running_app().root.set_tank_input(self.tank_number, field, text)
 
 Builder.load_string('''
 <MainScreen>:
@@ -101,170 +69,20 @@ Builder.load_string('''
             id: tabs
             
             Tab:
-                title: "Резервуары 1-4"
-                
-                ScrollView:
-                    GridLayout:
-                        cols: 1
-                        size_hint_y: None
-                        height: self.minimum_height
-                        padding: "10dp"
-                        spacing: "10dp"
-                        
-                        TankCard:
-                            tank_number: 1
-                            tank_name: "Резервуар 1"
-                            MDTextField:
-                                id: height_1
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_1
-                                hint_text: "Плотность, кг/л"
-                                text: "0.83"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_1
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 2
-                            tank_name: "Резервуар 2"
-                            MDTextField:
-                                id: height_2
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_2
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_2
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 3
-                            tank_name: "Резервуар 3"
-                            MDTextField:
-                                id: height_3
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_3
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_3
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 4
-                            tank_name: "Резервуар 4"
-                            MDTextField:
-                                id: height_4
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_4
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_4
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-            
-            Tab:
-                title: "Резервуары 5-8"
+                title: "Резервуары"
                 
-                ScrollView:
-                    GridLayout:
-                        cols: 1
+                RecycleView:
+                    id: tanks_view
+                    viewclass: 'TankCard'
+                    
+                    RecycleBoxLayout:
+                        orientation: 'vertical'
+                        default_size: None, dp(230)
+                        default_size_hint: 1, None
                         size_hint_y: None
                         height: self.minimum_height
                         padding: "10dp"
                         spacing: "10dp"
-                        
-                        TankCard:
-                            tank_number: 5
-                            tank_name: "⛽ Резервуар 5 (Бензин)"
-                            MDTextField:
-                                id: height_5
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_5
-                                hint_text: "Плотность, кг/л"
-                                text: "0.74"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_5
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 6
-                            tank_name: "Резервуар 6"
-                            MDTextField:
-                                id: height_6
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_6
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_6
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 7
-                            tank_name: "Резервуар 7"
-                            MDTextField:
-                                id: height_7
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_7
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_7
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
-                        
-                        TankCard:
-                            tank_number: 8
-                            tank_name: "Резервуар 8"
-                            MDTextField:
-                                id: height_8
-                                hint_text: "Высота, мм"
-                                text: "0"
-                                input_filter: 'int'
-                            MDTextField:
-                                id: density_8
-                                hint_text: "Плотность, кг/л"
-                                text: "0.85"
-                                input_filter: 'float'
-                            MDLabel:
-                                id: result_8
-                                text: "Объем: 0.0 л\\nМасса: 0.0 кг"
-                                theme_text_color: "Primary"
             
             Tab:
                 title: "Доп. объекты"
@@ -293,12 +111,14 @@ Builder.load_string('''
                             
                             MDTextField:
                                 id: auto_volume
+                                on_text: root.update_storage('automobile')
                                 hint_text: "Объем, л"
                                 text: "0"
                                 input_filter: 'float'
                             
                             MDTextField:
                                 id: auto_density
+                                on_text: root.update_storage('automobile')
                                 hint_text: "Плотность, кг/л"
                                 text: "0.85"
                                 input_filter: 'float'
@@ -326,12 +146,14 @@ Builder.load_string('''
                             
                             MDTextField:
                                 id: pipe_volume
+                                on_text: root.update_storage('pipeline')
                                 hint_text: "Объем, л"
                                 text: "0"
                                 input_filter: 'float'
                             
                             MDTextField:
                                 id: pipe_density
+                                on_text: root.update_storage('pipeline')
                                 hint_text: "Плотность, кг/л"
                                 text: "0.85"
                                 input_filter: 'float'
@@ -342,19 +164,75 @@ Builder.load_string('''
                                 size_hint_y: None
                                 height: self.texture_size[1]
                                 theme_text_color: "Primary"
+                        
+                        MDCard:
+                            orientation: 'vertical'
+                            padding: "10dp"
+                            size_hint_y: None
+                            height: "200dp"
+                            elevation: 8
+                            
+                            MDLabel:
+                                text: "🚚 Приемка топлива"
+                                size_hint_y: None
+                                height: self.texture_size[1]
+                                theme_text_color: "Primary"
+                                font_style: "H6"
+                            
+                            MDTextField:
+                                id: delivery_tank
+                                on_text: root.update_delivery()
+                                hint_text: "Номер резервуара"
+                                text: "1"
+                                input_filter: 'int'
+                            
+                            MDTextField:
+                                id: delivery_volume
+                                on_text: root.update_delivery()
+                                hint_text: "Объем приемки, л"
+                                text: "0"
+                                input_filter: 'float'
+                            
+                            MDLabel:
+                                id: delivery_result
+                                text: ""
+                                size_hint_y: None
+                                height: self.texture_size[1]
+                                theme_text_color: "Primary"
             
             Tab:
                 title: "Результаты"
                 
-                ScrollView:
-                    MDLabel:
-                        id: results_text
-                        text: ""
+                BoxLayout:
+                    orientation: 'vertical'
+                    
+                    ScrollView:
+                        MDLabel:
+                            id: results_text
+                            text: ""
+                            size_hint_y: None
+                            height: self.texture_size[1]
+                            padding: [10, 10]
+                            text_size: self.width - 20, None
+                            theme_text_color: "Primary"
+                    
+                    BoxLayout:
                         size_hint_y: None
-                        height: self.texture_size[1]
-                        padding: [10, 10]
-                        text_size: self.width - 20, None
-                        theme_text_color: "Primary"
+                        height: "48dp"
+                        padding: "5dp"
+                        spacing: "5dp"
+                        
+                        MDFlatButton:
+                            text: "CSV"
+                            on_press: root.export_results('.csv')
+                        
+                        MDFlatButton:
+                            text: "XLSX"
+                            on_press: root.export_results('.xlsx')
+                        
+                        MDFlatButton:
+                            text: "PDF"
+                            on_press: root.export_results('.pdf')
         
         BoxLayout:
             size_hint_y: None
@@ -379,7 +257,7 @@ Builder.load_string('''
 <TankCard>:
     orientation: 'vertical'
     size_hint: 1, None
-    height: self.minimum_height
+    height: "230dp"
     padding: "15dp"
     spacing: "10dp"
     
@@ -390,202 +268,365 @@ Builder.load_string('''
         theme_text_color: "Primary"
         font_style: "H6"
     
-
+    MDTextField:
+        hint_text: "Высота, мм"
+        text: root.height_text
+        input_filter: 'int'
+        disabled: not root.loaded
+        on_text: root.on_input('height_text', self.text)
     
+    MDTextField:
+        hint_text: "Плотность, кг/л"
+        text: root.density_text
+        input_filter: 'float'
+        disabled: not root.loaded
+        on_text: root.on_input('density_text', self.text)
+    
+    MDLabel:
+        text: root.result_text
+        theme_text_color: "Primary"
 
 ''')
 
 class MainScreen(Screen):
     dialog = None
+    model = None
+    worker = None
+    summary = None
+    export_days = 31
+    storage_fields = {
+        'automobile': ('auto_volume', 'auto_density', 'auto_result', "автомобиля"),
+        'pipeline': ('pipe_volume', 'pipe_density', 'pipe_result', "трубопровода"),
+    }
     
     def __init__(self, **kwargs):
+        self.history = kwargs.pop('history', None)
         super().__init__(**kwargs)
+        self.tank_rows = {}
+        self.tank_index = {}
         self.tanks = {}
-        self.manual_storages = {}
-        self.load_data()
+        self.manual_storages = {
+            'automobile': ManualStorage("🚗 Автомобиль"),
+            'pipeline': ManualStorage("🔧 Трубопровод"),
+        }
+        self.model = CalculationModel({}, self.manual_storages)
+        self.worker = CoalescingWorker(self.compute, self.publish)
+        threading.Thread(target=self.load_data, daemon=True).start()
     
+    @mainthread
+    def show_loading(self, config):
+        """Карточки резервуаров из конфигурации с заглушками до загрузки таблиц"""
+        data = []
+        for tank in config:
+            row = {
+                'tank_number': tank.number,
+                'tank_name': tank.name,
+                'height_text': "0",
+                'density_text': str(tank.density),
+                'result_text': "Загрузка таблицы...",
+                'loaded': False,
+            }
+            self.tank_rows[tank.number] = row
+            self.tank_index[tank.number] = len(data)
+            data.append(row)
+        self.ids.tanks_view.data = data
+    
+    @timed('app.load_data')
     def load_data(self):
-        """Загрузка данных из Excel файла"""
+        """Загрузка конфигурации и данных из Excel файла (в фоновом потоке)
+
+        Ошибка на любом шаге не оставляет карточки в состоянии загрузки: резервуары
+        получают тестовые таблицы, а ошибка попадает в диалог проверки таблиц.
+        """
+        config, tanks, errors = None, None, []
         try:
-            file_paths = [
-                '/storage/emulated/0/резерв.xlsx',
-                './резерв.xlsx',
-                'резерв.xlsx'
-            ]
-            
-            file_path = None
-            for fp in file_paths:
-                if os.path.exists(fp):
-                    file_path = fp
-                    break
-            
-            if file_path is None:
-                self.create_test_data()
-                return
-            
-            df_raw = pd.read_excel(file_path, header=None)
-            
-            for tank_num in range(1, 9):
-                col_offset = (tank_num - 1) * 3
-                if col_offset + 1 >= df_raw.shape[1]:
-                    continue
-                
-                tank_data = []
-                for row in range(2, min(len(df_raw), 322)):
-                    try:
-                        cm_val = df_raw.iloc[row, col_offset]
-                        liters_val = df_raw.iloc[row, col_offset + 1]
-                        
-                        if pd.isna(cm_val) or pd.isna(liters_val):
-                            continue
-                        
-                        cm_val = float(cm_val)
-                        liters_val = float(liters_val)
-                        
-                        tank_data.append({
-                            'height_mm': cm_val * 10,
-                            'liters': liters_val
-                        })
-                    except:
-                        continue
-                
-                if tank_data:
-                    tank_df = pd.DataFrame(tank_data)
-                    tank_name = f"Резервуар {tank_num}"
-                    if tank_num == 5:
-                        tank_name = "⛽ Резервуар 5 (Бензин)"
-                    self.tanks[tank_num] = FuelTank(tank_num, tank_df, tank_name)
-            
-            for tank_num in range(1, 9):
-                if tank_num not in self.tanks:
-                    tank_name = f"Резервуар {tank_num}"
-                    if tank_num == 5:
-                        tank_name = "⛽ Резервуар 5 (Бензин)"
-                    self.create_test_data_for_tank(tank_num, tank_name)
-            
-            self.manual_storages['automobile'] = ManualStorage("🚗 Автомобиль")
-            self.manual_storages['pipeline'] = ManualStorage("🔧 Трубопровод")
-            
+            try:
+                config = load_tank_config()
+            except (OSError, ValueError, KeyError, TypeError):
+                config = default_tank_config()
+            self.show_loading(config)
+            if results_cache.path is not None:
+                results_cache.load()
+            loaded = load_tanks(config=config)
+            for tank in loaded.values():
+                tank.results_cache = results_cache
+            self.add_tanks(loaded)
+            tanks = loaded
+            for tank in tanks.values():
+                try:
+                    tank.load()
+                except Exception as e:
+                    errors.append(f"{tank.name}: {e}")
+                    tank.set_calibration(create_test_tank(tank.number).calibration)
+                    tank.source = None
+            stale = results_cache.retain({tank.number: tank.calibration_key for tank in tanks.values()})
+            if stale:
+                Logger.info(f"Results cache: таблицы изменились, удалено записей: {stale}")
         except Exception as e:
-            self.create_test_data()
-    
-    def create_test_data_for_tank(self, tank_num, name):
-        """Создание тестовых данных"""
-        heights = list(range(0, 32001, 1000))
-        coefficients = {1: 3.0, 2: 3.1, 3: 3.2, 4: 3.3, 5: 2.8, 6: 2.9, 7: 3.0, 8: 3.1}
-        coefficient = coefficients.get(tank_num, 3.0)
-        volumes = [h * coefficient for h in heights]
-        
-        tank_df = pd.DataFrame({
-            'height_mm': heights,
-            'liters': volumes
-        })
+            Logger.exception("Load: данные не загружены")
+            errors.append(f"Ошибка загрузки: {e}")
+            if tanks is None:
+                if config is None:
+                    config = default_tank_config()
+                    self.show_loading(config)
+                tanks = {tank.number: create_test_tank(tank.number, tank.name) for tank in config}
+                for tank in config:
+                    tanks[tank.number].product = tank.product
+                self.add_tanks(tanks)
+        self.check_tables(tanks, errors)
+        self.record_calibrations(tanks)
+    
+    def record_calibrations(self, tanks):
+        """Версии таблиц из файла - в историю для обмена между станциями
+
+        Тестовые таблицы не записываются, прореженные пропускает record_calibrations
+        (исходные таблицы книги записывает `cli.py sync-export -w`).
+        """
+        tables = {tank.number: tank.calibration for tank in tanks.values() if tank.source is not None}
+        if self.history is None or not tables:
+            return
+        try:
+            record_calibrations(self.history.path, tables)
+        except (OSError, sqlite3.Error) as e:
+            Logger.warning(f"Sync: таблицы не записаны: {e}")
+    
+    @mainthread
+    def add_tanks(self, tanks):
+        """Резервуары загружены: карточки становятся доступными"""
+        self.worker.submit(('tanks', None), tanks)
+        for tank in tanks.values():
+            self.tanks[tank.number] = tank
+            row = self.tank_rows.get(tank.number)
+            if row is not None:
+                row['loaded'] = True
+                row['result_text'] = "Объем: 0.0 л\nМасса: 0.0 кг"
+        self.ids.tanks_view.refresh_from_data()
+        self.update_delivery()
+        app = MDApp.get_running_app()
+        if app.telemetry is not None:
+            app.telemetry.tanks = dict(self.tanks)
+        app.startup_step('data_loaded')
+    
+    @mainthread
+    def check_tables(self, tanks, errors=()):
+        """Все таблицы прочитаны (листы книги - в фоне после появления карточек);
+        errors - листы, которые не прочитались: у этих резервуаров тестовые таблицы
+        """
+        self.update_delivery()
+        decimated = [f"{tank.name}: {tank.calibration.decimation.summary()}" for tank in tanks.values()
+                     if tank.calibration.decimation is not None]
+        if decimated:
+            Logger.info("Calibration: " + "; ".join(decimated))
+        issues = [f"{tank.name}: {tank.calibration.diagnostics.summary()}" for tank in tanks.values()
+                  if tank.calibration.diagnostics is not None and not tank.calibration.diagnostics.ok]
+        messages = []
+        if errors:
+            Logger.error("Calibration: " + "; ".join(errors))
+            messages.append("Листы не прочитаны, используются тестовые данные:\n" + "\n".join(errors))
+        if issues:
+            Logger.warning("Calibration: " + "; ".join(issues))
+            messages.append("Таблицы исправлены при загрузке:\n" + "\n".join(issues))
+        if messages:
+            self.show_error_dialog("Проверка таблиц", "\n\n".join(messages))
+    
+    def set_tank_input(self, tank_num, field, text):
+        self.tank_rows[tank_num][field] = text
+        self.update_tank(tank_num)
+        if self.ids.delivery_tank.text == str(tank_num):
+            self.update_delivery()
+    
+    def set_tank_result(self, tank_num, text):
+        """Результат в данные карточки и в саму карточку, если она видна"""
+        self.tank_rows[tank_num]['result_text'] = text
+        card = self.ids.tanks_view.view_adapter.get_visible_view(self.tank_index[tank_num])
+        if card is not None:
+            card.result_text = text
+    
+    def update_tank(self, tank_num, show_errors=False):
+        """Пересчет одного резервуара при изменении его полей"""
+        row = self.tank_rows.get(tank_num)
+        if row is None or tank_num not in self.tanks:
+            return True
+        try:
+            height = int(row['height_text'] or "0")
+            density = float(row['density_text'] or "0.85")
+        except ValueError:
+            if show_errors:
+                self.show_error_dialog("Ошибка", f"Некорректные данные для резервуара {tank_num}")
+            return False
         
-        self.tanks[tank_num] = FuelTank(tank_num, tank_df, name)
-    
-    def create_test_data(self):
-        """Создание полных тестовых данных"""
-        for tank_num in range(1, 9):
-            tank_name = f"Резервуар {tank_num}"
-            if tank_num == 5:
-                tank_name = "⛽ Резервуар 5 (Бензин)"
-            self.create_test_data_for_tank(tank_num, tank_name)
+        self.worker.submit(('tank', tank_num), (height, density))
+        return True
+    
+    def update_storage(self, key, show_errors=False):
+        """Пересчет автомобиля или трубопровода при изменении полей"""
+        if self.worker is None:
+            return True
+        volume_id, density_id, result_id, title = self.storage_fields[key]
+        try:
+            volume = float(self.ids[volume_id].text or "0")
+            density = float(self.ids[density_id].text or "0.85")
+        except ValueError:
+            if show_errors:
+                self.show_error_dialog("Ошибка", f"Некорректные данные для {title}")
+            return False
         
-        self.manual_storages['automobile'] = ManualStorage("🚗 Автомобиль")
-        self.manual_storages['pipeline'] = ManualStorage("🔧 Трубопровод")
+        self.worker.submit(('storage', key), (volume, density))
+        return True
     
-    def calculate_all(self):
-        """Расчет всех объемов"""
+    def update_delivery(self):
+        """План приемки по мере ввода: свободный объем и высота после слива"""
+        if self.worker is None:
+            return
         try:
-            total_volume = 0
-            total_mass = 0
-            results = []
-            
-            for tank_num in range(1, 9):
-                if f"height_{tank_num}" in self.ids:
-                    try:
-                        height_text = self.ids[f"height_{tank_num}"].text or "0"
-                        density_text = self.ids[f"density_{tank_num}"].text or "0.85"
-                        
-                        height = int(height_text)
-                        density = float(density_text)
-                        
-                        self.tanks[tank_num].set_height(height)
-                        self.tanks[tank_num].set_density(density)
-                        
-                        volume = self.tanks[tank_num].get_volume()
-                        mass = self.tanks[tank_num].get_mass()
-                        
-                        total_volume += volume
-                        total_mass += mass
-                        
-                        if f"result_{tank_num}" in self.ids:
-                            self.ids[f"result_{tank_num}"].text = f"Объем: {volume:,.1f} л\nМасса: {mass:,.1f} кг"
-                        
-                        results.append(f"{self.tanks[tank_num].name}: {height:,} мм = {volume:,.1f} л = {mass:,.1f} кг")
-                        
-                    except ValueError:
-                        self.show_error_dialog("Ошибка", f"Некорректные данные для резервуара {tank_num}")
-                        return
-            
-            try:
-                auto_volume = float(self.ids.auto_volume.text or "0")
-                auto_density = float(self.ids.auto_density.text or "0.85")
-                
-                self.manual_storages['automobile'].set_volume(auto_volume)
-                self.manual_storages['automobile'].set_density(auto_density)
-                
-                auto_mass = self.manual_storages['automobile'].get_mass()
-                total_volume += auto_volume
-                total_mass += auto_mass
-                
-                self.ids.auto_result.text = f"Масса: {auto_mass:,.1f} кг"
-                results.append(f"🚗 Автомобиль: {auto_volume:,.1f} л = {auto_mass:,.1f} кг")
-                
-            except ValueError:
-                self.show_error_dialog("Ошибка", "Некорректные данные для автомобиля")
+            tank_num = int(self.ids.delivery_tank.text or "0")
+            receipt = float(self.ids.delivery_volume.text or "0")
+        except ValueError:
+            return
+        tank = self.tanks.get(tank_num)
+        if tank is None:
+            self.ids.delivery_result.text = f"Резервуар {tank_num} не найден"
+            return
+        if not tank.loaded:
+            self.ids.delivery_result.text = "Загрузка таблицы..."
+            return
+        try:
+            height = int(self.tank_rows[tank_num]['height_text'] or "0")
+        except ValueError:
+            height = 0
+        plan = plan_delivery(self.tanks, {tank_num: height}, {tank_num: receipt})[0]
+        text = (f"Сейчас: {plan.volume:,.1f} л, свободно: {plan.ullage:,.1f} л\n"
+                f"После приемки: {plan.final_height:,.1f} мм ({plan.final_volume:,.1f} л)")
+        if plan.overflow > 0:
+            text += f"\n⚠️ Не поместится: {plan.overflow:,.1f} л"
+        self.ids.delivery_result.text = text
+    
+    @timed('app.compute')
+    def compute(self, pending):
+        """Расчет в рабочем потоке: (новые результаты по ключам, текст вкладки результатов)"""
+        updated = {}
+        save = False
+        for (kind, key), inputs in pending.items():
+            if kind == 'tanks':
+                for tank in inputs.values():
+                    self.model.tanks[tank.number] = tank
+                    self.model.discard(tank.number)
+            elif kind == 'tank':
+                updated[kind, key] = self.model.update_tank(key, *inputs)
+            elif kind == 'storage':
+                updated[kind, key] = self.model.update_storage(key, *inputs)
+            elif kind == 'save':
+                save = True
+        if save:
+            self.save_history()
+        return updated, ResultSummary.from_model(self.model)
+    
+    def publish(self, result, latency):
+        frame_stats.calculation(latency)
+        Clock.schedule_once(partial(self.apply_results, result))
+    
+    @timed('app.ui_update')
+    def apply_results(self, result, *args):
+        """Результаты расчета в интерфейс (поток интерфейса)"""
+        if isinstance(result, Exception):
+            self.show_error_dialog("Ошибка расчета", f"Ошибка: {str(result)}")
+            return
+        updated, self.summary = result
+        for (kind, key), entry in updated.items():
+            if kind == 'tank':
+                self.set_tank_result(key, f"Объем: {entry.volume:,.1f} л\nМасса: {entry.mass:,.1f} кг")
+            else:
+                self.ids[self.storage_fields[key][2]].text = f"Масса: {entry.mass:,.1f} кг"
+        self.ids.results_text.text = self.summary.text()
+    
+    def export_results(self, ext):
+        """Текущие результаты и история за export_days дней в файлы (в фоновом потоке)"""
+        if self.summary is None:
+            self.show_error_dialog("Экспорт", "Сначала выполните расчет")
+            return
+        threading.Thread(target=self.write_exports, args=(self.summary, ext), daemon=True).start()
+    
+    def write_exports(self, summary, ext):
+        folder = '/storage/emulated/0' if os.path.isdir('/storage/emulated/0') else MDApp.get_running_app().user_data_dir
+        stamp = time.strftime('%Y-%m-%d_%H%M')
+        paths = [os.path.join(folder, f"результаты_{stamp}{ext}")]
+        notes = []
+        try:
+            export_report(summary.report(), paths[0])
+            if self.history is not None:
+                if not self.history.flush():
+                    notes.append("⚠️ История еще записывается: последние показания могут не попасть в отчет")
+                if self.history.last_error is not None:
+                    notes.append(f"⚠️ Не записано в историю показаний: {self.history.dropped} "
+                                 f"({self.history.last_error})")
+                paths.append(os.path.join(folder, f"история_{stamp}{ext}"))
+                start = time.time() - self.export_days * 86400
+                export_report(history_report(self.history, start=start), paths[1])
+        except Exception as e:
+            self.show_export_result("Ошибка экспорта", f"Ошибка: {str(e)}")
+            return
+        self.show_export_result("Экспорт", "\n".join(["Сохранено:", *paths, *notes]))
+    
+    @mainthread
+    def show_export_result(self, title, text):
+        self.show_error_dialog(title, text)
+    
+    @timed('app.calculate_all')
+    def calculate_all(self):
+        """Расчет всех объемов в рабочем потоке (пересчитываются только измененные объекты)
+
+        С FUELCALC_PROFILE_CALC расчет, запущенный кнопкой, выполняется под cProfile;
+        выключенные замеры включаются только на этот расчет.
+        """
+        for tank_num in self.tank_rows:
+            if not self.update_tank(tank_num, show_errors=True):
                 return
-            
-            try:
-                pipe_volume = float(self.ids.pipe_volume.text or "0")
-                pipe_density = float(self.ids.pipe_density.text or "0.85")
-                
-                self.manual_storages['pipeline'].set_volume(pipe_volume)
-                self.manual_storages['pipeline'].set_density(pipe_density)
-                
-                pipe_mass = self.manual_storages['pipeline'].get_mass()
-                total_volume += pipe_volume
-                total_mass += pipe_mass
-                
-                self.ids.pipe_result.text = f"Масса: {pipe_mass:,.1f} кг"
-                results.append(f"🔧 Трубопровод: {pipe_volume:,.1f} л = {pipe_mass:,.1f} кг")
-                
-            except ValueError:
-                self.show_error_dialog("Ошибка", "Некорректные данные для трубопровода")
+        
+        for key in self.storage_fields:
+            if not self.update_storage(key, show_errors=True):
                 return
-            
-            result_text = "🔥 РЕЗУЛЬТАТЫ РАСЧЕТА\n\n"
-            for result in results:
-                result_text += f"• {result}\n"
-            
-            result_text += f"\n📊 ОБЩИЙ ОБЪЕМ: {total_volume:,.1f} л\n"
-            result_text += f"⚖️ ОБЩАЯ МАССА: {total_mass:,.1f} кг\n"
-            
-            if total_volume > 0:
-                result_text += f"📈 СРЕДНЯЯ ПЛОТНОСТЬ: {total_mass/total_volume:.3f} кг/л"
-            
-            self.ids.results_text.text = result_text
-            
-        except Exception as e:
-            self.show_error_dialog("Ошибка расчета", f"Ошибка: {str(e)}")
+        
+        if os.environ.get(PROFILE_CALC_ENV):
+            log_path = os.path.join(MDApp.get_running_app().user_data_dir, TIMINGS_LOG)
+            timings.profile_next('app.compute', log_path)
+        self.worker.submit(('save', None))
+    
+    def save_history(self):
+        """Добавить результаты расчета в историю (рабочий поток; запись - в потоке истории)"""
+        if self.history is None:
+            return
+        ts = time.time()
+        self.history.append(
+            (ts, key, entry.height, entry.density, float(entry.volume), float(entry.mass))
+            for key, entry in self.model.ordered_entries()
+        )
+    
+    def apply_telemetry(self, chunk):
+        """Пакет показаний уровнемеров (в потоке приема): в историю и последние высоты в карточки"""
+        tank_ids, heights, densities, _, volumes, _, masses = chunk
+        if self.history is not None:
+            ts = time.time()
+            self.history.append(zip([ts] * len(tank_ids), tank_ids.tolist(), heights.tolist(),
+                                     densities.tolist(), volumes.tolist(), masses.tolist()))
+        self.show_telemetry(dict(zip(tank_ids.tolist(), heights.tolist())))
+    
+    @mainthread
+    def show_telemetry(self, latest):
+        """Последняя высота по каждому резервуару; плотность остается введенной вручную"""
+        for tank_num, height in latest.items():
+            if tank_num in self.tank_rows:
+                self.tank_rows[tank_num]['height_text'] = str(height)
+                self.update_tank(tank_num)
+        self.ids.tanks_view.refresh_from_data()
     
     def clear_all(self):
         """Очистка всех полей"""
-        for tank_num in range(1, 9):
-            if f"height_{tank_num}" in self.ids:
-                self.ids[f"height_{tank_num}"].text = "0"
-                self.ids[f"density_{tank_num}"].text = "0.83"
-                self.ids[f"result_{tank_num}"].text = "Объем: 0.0 л\nМасса: 0.0 кг"
+        for tank_num, row in self.tank_rows.items():
+            row['height_text'] = "0"
+            row['density_text'] = "0.83"
+            row['result_text'] = "Объем: 0.0 л\nМасса: 0.0 кг"
+            self.update_tank(tank_num)
+        self.ids.tanks_view.refresh_from_data()
         
         self.ids.auto_volume.text = "0"
         self.ids.auto_density.text = "0.83"
@@ -594,12 +635,14 @@ class MainScreen(Screen):
         self.ids.pipe_volume.text = "0"
         self.ids.pipe_density.text = "0.83"
         self.ids.pipe_result.text = "Масса: 0.0 кг"
-        
-        self.ids.results_text.text = ""
     
+    @timed('app.error_dialog')
     def show_error_dialog(self, title, text):
         """Показать диалог ошибки"""
         if not self.dialog:
+            from kivymd.uix.button import MDFlatButton
+            from kivymd.uix.dialog import MDDialog
+            
             self.dialog = MDDialog(
                 title=title,
                 text=text,
@@ -619,7 +662,7 @@ class MainScreen(Screen):
         help_text = """🔥 SMART FUEL CALCULATOR - Android версия
 
 📱 ОСОБЕННОСТИ:
-• Полная поддержка 8 резервуаров
+• Любое число резервуаров (по умолчанию 8)
 • Material Design интерфейс
 • Автосохранение данных
 • Оптимизировано для мобильных устройств
@@ -629,18 +672,100 @@ class MainScreen(Screen):
 2. Укажите плотности для каждого объекта
 3. Нажмите "РАССЧИТАТЬ"
 4. Просмотрите результаты во вкладке "Результаты"
+5. Кнопки CSV / XLSX / PDF сохраняют результаты и историю за месяц
 
 📊 ФАЙЛ ДАННЫХ:
 • Поместите файл 'резерв.xlsx' в корневую папку устройства
+• Таблицы: блоки по 3 колонки на первом листе, лист на резервуар
+  или заголовки «Резервуар N, мм» над колонками высоты и объема
 • Или используйте тестовые данные
+• Список резервуаров: файл 'tanks.json' рядом с 'резерв.xlsx';
+  "decimate_tolerance": 0.1 в нем прореживает таблицы (ошибка до 0.1 л)
+• Обмен между станциями: создайте папку 'fuelcalc-sync' в памяти телефона -
+  при выходе в нее выгружаются новые показания и версии таблиц
 """
+        if timings.enabled:
+            timings.dump()
+            help_text += f"\n⏱ ЗАМЕРЫ ({timings.log_path}):\n{timings.text()}\n"
         self.show_error_dialog("📖 Справка", help_text)
 
 class FuelCalculatorApp(MDApp):
     def build(self):
         self.theme_cls.theme_style = "Dark"
         self.theme_cls.primary_palette = "Blue"
-        return MainScreen()
+        self.history = HistoryStore(os.path.join(self.user_data_dir, HISTORY_FILE))
+        results_cache.path = os.path.join(self.user_data_dir, RESULTS_CACHE_FILE)
+        if os.environ.get(PROFILE_ENV) == '1':
+            timings.log_path = os.path.join(self.user_data_dir, TIMINGS_LOG)
+        screen = MainScreen(history=self.history)
+        self.telemetry = None
+        address = os.environ.get(TELEMETRY_ENV)
+        if address:
+            try:
+                host, port = parse_address(address)
+                telemetry = TelemetryService(dict(screen.tanks), screen.apply_telemetry, host, port)
+                telemetry.start()
+            except (OSError, ValueError) as e:
+                Logger.warning(f"Telemetry: прием показаний не запущен ({address}): {e}")
+            else:
+                self.telemetry = telemetry
+        startup_timer.mark('build')
+        return screen
+    
+    def on_stop(self):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        self.root.worker.shutdown()
+        self.history.close()
+        Logger.info(f"Results cache: {results_cache.summary()}")
+        try:
+            results_cache.save()
+        except OSError as e:
+            Logger.warning(f"Results cache: не сохранен: {e}")
+        sync_dir = find_sync_dir()
+        if sync_dir is not None:
+            try:
+                bundle = export_bundle(self.history.path, sync_dir)
+                if bundle is not None:
+                    Logger.info(f"Sync: {bundle.summary()}")
+            except (OSError, ValueError, sqlite3.Error) as e:
+                Logger.warning(f"Sync: выгрузка не удалась: {e}")
+        if timings.enabled:
+            timings.dump()
+    
+    def on_start(self):
+        from kivy.core.window import Window
+        
+        def on_first_frame(*args):
+            Window.unbind(on_flip=on_first_frame)
+            self.startup_step('first_frame')
+        
+        Window.bind(on_flip=on_first_frame)
+        if os.environ.get(FRAME_OVERLAY_ENV):
+            self.show_frame_overlay()
+        Clock.schedule_interval(lambda dt: timings.enabled and timings.dump(), TIMINGS_DUMP_INTERVAL)
+    
+    def show_frame_overlay(self):
+        """Время кадра против бюджета и задержка фонового расчета поверх интерфейса"""
+        from kivy.uix.label import Label
+        
+        overlay = Label(size_hint=(None, None), size=("320dp", "40dp"), font_size="11sp",
+                        pos_hint={'right': 1, 'top': 1}, color=(1, 1, 0, 1))
+        self.root.add_widget(overlay)
+        Clock.schedule_interval(lambda dt: frame_stats.frame(dt), 0)
+        
+        def refresh(dt):
+            overlay.text = frame_stats.text()
+        
+        Clock.schedule_interval(refresh, 0.5)
+    
+    def startup_step(self, name):
+        """Отметка этапа запуска; интерактивность = первый кадр + данные"""
+        startup_timer.mark(name)
+        if startup_timer.has('first_frame', 'data_loaded') and not startup_timer.has('interactive'):
+            startup_timer.mark('interactive')
+            Logger.info(f"Startup: {startup_timer.report()}")
+            startup_timer.dump()
 
 if __name__ == "__main__":
     FuelCalculatorApp().run()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import contextlib
+import csv
+import json
+import sys
+from itertools import islice
+
+import numpy as np
+
+from core import DEFAULT_DENSITY, masses
+from density import STANDARD_TEMPERATURE, correct
+
+CHUNK_SIZE = 65536
+
+
+def detect_format(path) -> str:
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+@contextlib.contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+    else:
+        with open(path, mode, newline='', encoding='utf-8') as f:
+            yield f
+
+
+def read_readings(stream, fmt):
+    """Поток сырых показаний (tank, height_mm, density, temperature) из CSV или JSONL"""
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                row = json.loads(line)
+                yield row.get('tank'), row.get('height_mm'), row.get('density'), row.get('temperature')
+    else:
+        reader = csv.reader(stream)
+        header = next(reader, [])
+        tank, height = header.index('tank'), header.index('height_mm')
+        optional = [header.index(name) if name in header else None for name in ('density', 'temperature')]
+        for row in reader:
+            if row:
+                cells = row + [None] * (len(header) - len(row))
+                yield (cells[tank], cells[height],
+                       *(cells[index] if index is not None else None for index in optional))
+
+
+def parse_reading(tank, height, density, temperature=None):
+    """Разбор показания по тем же правилам, что и поля ввода приложения
+
+    Температура необязательна: без нее (NaN) масса считается без приведения к 15 °C.
+    """
+    temperature = float(str(temperature)) if temperature not in (None, '') else np.nan
+    return int(str(tank)), int(str(height or 0)), float(str(density or DEFAULT_DENSITY)), temperature
+
+
+def report_error(line, message):
+    print(f"запись {line}: {message}", file=sys.stderr)
+
+
+def compute_chunk(tank_ids, heights, densities, temperatures, tanks,
+                  density_temperature=STANDARD_TEMPERATURE):
+    """Объемы, объемы при 15 °C и массы для блока показаний в исходном порядке
+
+    Строки без температуры сохраняют прежний расчет: volume15 = volume, масса = volume * density.
+    """
+    volumes = np.empty(len(heights))
+    for tank_num in np.unique(tank_ids):
+        mask = tank_ids == tank_num
+        volumes[mask] = tanks[tank_num].volumes_for_heights(heights[mask])
+    volumes15 = volumes.copy()
+    chunk_masses = masses(volumes, densities)
+
+    measured = ~np.isnan(temperatures)
+    if measured.any():
+        for tank_num in np.unique(tank_ids[measured]):
+            mask = measured & (tank_ids == tank_num)
+            volumes15[mask], chunk_masses[mask] = correct(
+                volumes[mask], densities[mask], temperatures[mask],
+                tanks[tank_num].product, density_temperature
+            )
+    return volumes, volumes15, chunk_masses
+
+
+def iter_chunks(readings, tanks, on_error=report_error, chunk_size=CHUNK_SIZE,
+                density_temperature=STANDARD_TEMPERATURE):
+    """Блоки массивов (tank_ids, heights, densities, temperatures, volumes, volumes15, masses)"""
+    line = 0
+    readings = iter(readings)
+    while True:
+        chunk = list(islice(readings, chunk_size))
+        if not chunk:
+            return
+
+        parsed = []
+        for raw in chunk:
+            line += 1
+            try:
+                reading = parse_reading(*raw)
+            except (TypeError, ValueError):
+                on_error(line, f"некорректные данные {raw}")
+                continue
+            if reading[0] not in tanks:
+                on_error(line, f"неизвестный резервуар {reading[0]}")
+                continue
+            parsed.append(reading)
+        if not parsed:
+            continue
+
+        tank_ids, heights, densities, temperatures = (np.array(column) for column in zip(*parsed))
+        yield (tank_ids, heights, densities, temperatures,
+               *compute_chunk(tank_ids, heights, densities, temperatures, tanks, density_temperature))
+
+
+def iter_results(readings, tanks, on_error=report_error, chunk_size=CHUNK_SIZE,
+                 density_temperature=STANDARD_TEMPERATURE):
+    """Поток строк (tank, height_mm, density, temperature, volume, volume15, mass)"""
+    for columns in iter_chunks(readings, tanks, on_error, chunk_size, density_temperature):
+        yield from zip(*(column.tolist() for column in columns))
@@ -0,0 +1,503 @@
+"""Отчеты по результатам расчета и истории: CSV, XLSX и PDF с потоковой записью
+
+Report - заголовок, колонки и поток строк. Экспорт читает строки по одной,
+поэтому история за месяц выгружается в постоянной памяти. Строки итогов
+считаются по ходу чтения и идут после строк своего объекта.
+"""
+import csv
+import importlib.util
+import os
+import struct
+import time
+import zlib
+
+from core import Totals
+from workbook import find_file
+
+ROW = 'row'
+TOTAL = 'total'
+
+RESULT_COLUMNS = [
+    ("Объект", ''), ("Высота, мм", ''), ("Плотность, кг/л", '.3f'), ("Объем, л", '.1f'), ("Масса, кг", '.1f'),
+]
+HISTORY_COLUMNS = [
+    ("Время", ''), ("Объект", ''), ("Высота, мм", ''), ("Плотность, кг/л", '.3f'),
+    ("Объем, л", '.1f'), ("Масса, кг", '.1f'),
+]
+
+FONT_PATHS = [
+    '/system/fonts/Roboto-Regular.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+FONT_SIZE = 8
+TITLE_SIZE = 12
+LINE_HEIGHT = 12
+
+# Таблицы TrueType, которые нужны PDF для CIDFontType2 (cmap, name, post и т.п. не нужны)
+SUBSET_TABLES = ('head', 'hhea', 'maxp', 'hmtx', 'cvt ', 'fpgm', 'prep', 'loca', 'glyf')
+
+
+class Report:
+    """Табличный отчет: строки (kind, values), kind - ROW или TOTAL
+
+    columns - пары (заголовок, формат для format()); None в ячейке - пустая ячейка.
+    """
+
+    __slots__ = ('title', 'columns', 'rows')
+
+    def __init__(self, title: str, columns, rows):
+        self.title = title
+        self.columns = columns
+        self.rows = rows
+
+    def formatted(self, values) -> list:
+        return ["" if value is None else format(value, fmt) for value, (_, fmt) in zip(values, self.columns)]
+
+
+class ResultSummary:
+    """Снимок результатов расчета: пары (ключ, результат) и итоги
+
+    Из него строятся и текст вкладки результатов, и отчеты.
+    """
+
+    __slots__ = ('entries', 'totals')
+
+    def __init__(self, entries, totals: Totals):
+        self.entries = entries
+        self.totals = totals
+
+    @classmethod
+    def from_model(cls, model):
+        totals = Totals()
+        totals.add(model.totals.volume, model.totals.mass)
+        return cls(model.ordered_entries(), totals)
+
+    def text(self) -> str:
+        lines = ["🔥 РЕЗУЛЬТАТЫ РАСЧЕТА", ""]
+        for _, entry in self.entries:
+            if entry.height is None:
+                lines.append(f"• {entry.name}: {entry.volume:,.1f} л = {entry.mass:,.1f} кг")
+            else:
+                lines.append(f"• {entry.name}: {entry.height:,} мм = {entry.volume:,.1f} л = {entry.mass:,.1f} кг")
+        lines.append("")
+        lines.append(f"📊 ОБЩИЙ ОБЪЕМ: {self.totals.volume:,.1f} л")
+        lines.append(f"⚖️ ОБЩАЯ МАССА: {self.totals.mass:,.1f} кг")
+        if self.totals.volume > 0:
+            lines.append(f"📈 СРЕДНЯЯ ПЛОТНОСТЬ: {self.totals.average_density:.3f} кг/л")
+        return "\n".join(lines)
+
+    def report(self, title=None) -> Report:
+        def rows():
+            for _, entry in self.entries:
+                yield ROW, (entry.name, entry.height, entry.density, entry.volume, entry.mass)
+            yield TOTAL, ("ИТОГО", None, self.totals.average_density, self.totals.volume, self.totals.mass)
+
+        title = title or f"Результаты расчета {time.strftime('%Y-%m-%d %H:%M')}"
+        return Report(title, RESULT_COLUMNS, rows())
+
+
+def history_report(store, tank=None, start=None, end=None, title=None) -> Report:
+    """Показания из истории по объектам с их средними и общим средним в конце"""
+    def average_row(label, tank, count, totals):
+        return TOTAL, (f"{label} ({count})", tank, None, totals.average_density,
+                       totals.volume / count, totals.mass / count)
+
+    def rows():
+        overall, overall_count = Totals(), 0
+        current, totals, count = None, Totals(), 0
+        for ts, key, height, density, volume, mass in store.iter_readings(tank, start, end):
+            if key != current:
+                if count:
+                    yield average_row("Среднее", current, count, totals)
+                current, totals, count = key, Totals(), 0
+            totals.add(volume, mass)
+            overall.add(volume, mass)
+            count += 1
+            overall_count += 1
+            yield ROW, (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), key, height, density, volume, mass)
+        if count:
+            yield average_row("Среднее", current, count, totals)
+        if overall_count:
+            yield average_row("Среднее, всего", None, overall_count, overall)
+
+    return Report(title or "История расчетов", HISTORY_COLUMNS, rows())
+
+
+def write_csv(report: Report, stream):
+    writer = csv.writer(stream)
+    writer.writerow([title for title, _ in report.columns])
+    for _, values in report.rows:
+        writer.writerow(report.formatted(values))
+
+
+def write_xlsx(report: Report, path):
+    """Запись листа в режиме write_only: строки сразу уходят в файл
+
+    Стили (жирный шрифт) только у строк итогов: ячейка со стилем в разы дороже.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(''.join(c for c in report.title if c not in '[]:*?/\\')[:31] or "Отчет")
+    bold = Font(bold=True)
+    header = []
+    for title, _ in report.columns:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = bold
+        header.append(cell)
+    sheet.append(header)
+
+    for kind, values in report.rows:
+        if kind == TOTAL:
+            values = [WriteOnlyCell(sheet, value=value) for value in values]
+            for cell in values:
+                cell.font = bold
+        sheet.append(values)
+    workbook.save(path)
+
+
+def find_font():
+    """Шрифт TrueType с кириллицей: системный или из поставки Kivy"""
+    paths = list(FONT_PATHS)
+    spec = importlib.util.find_spec('kivy')
+    if spec is not None and spec.submodule_search_locations:
+        paths.insert(1, os.path.join(spec.submodule_search_locations[0], 'data', 'fonts', 'Roboto-Regular.ttf'))
+    return find_file(paths)
+
+
+class TrueTypeFont:
+    """Разбор TrueType в объеме, нужном для встраивания в PDF: глифы символов, ширины
+    и подмножество шрифта с контурами только использованных глифов
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = data = f.read()
+        num_tables = struct.unpack_from('>H', data, 4)[0]
+        self.tables = tables = {}
+        for i in range(num_tables):
+            tag, _, offset, length = struct.unpack_from('>4sIII', data, 12 + 16 * i)
+            tables[tag.decode('latin-1')] = (offset, length)
+
+        head, hhea = tables['head'][0], tables['hhea'][0]
+        self.units_per_em = struct.unpack_from('>H', data, head + 18)[0]
+        self.bbox = struct.unpack_from('>4h', data, head + 36)
+        self.ascent, self.descent = struct.unpack_from('>hh', data, hhea + 4)
+        metrics = struct.unpack_from('>H', data, hhea + 34)[0]
+        self.advances = struct.unpack_from(f'>{metrics * 2}H', data, tables['hmtx'][0])[::2]
+        self.glyphs = self._parse_cmap(data, tables['cmap'][0])
+
+    @staticmethod
+    def _parse_cmap(data, offset) -> dict:
+        """Таблица cmap формата 4 (Unicode BMP) -> {код символа: номер глифа}"""
+        count = struct.unpack_from('>H', data, offset + 2)[0]
+        subtables = {}
+        for i in range(count):
+            platform, encoding, start = struct.unpack_from('>HHI', data, offset + 4 + 8 * i)
+            subtables[platform, encoding] = offset + start
+        for key in ((3, 1), (0, 3), (0, 4), (0, 1), (0, 0)):
+            start = subtables.get(key)
+            if start is not None and struct.unpack_from('>H', data, start)[0] == 4:
+                break
+        else:
+            raise ValueError("в шрифте нет таблицы символов Unicode (cmap 4)")
+
+        segments = struct.unpack_from('>H', data, start + 6)[0] // 2
+        ends = struct.unpack_from(f'>{segments}H', data, start + 14)
+        starts_at = start + 16 + 2 * segments
+        starts = struct.unpack_from(f'>{segments}H', data, starts_at)
+        deltas = struct.unpack_from(f'>{segments}H', data, starts_at + 2 * segments)
+        ranges_at = starts_at + 4 * segments
+        ranges = struct.unpack_from(f'>{segments}H', data, ranges_at)
+
+        glyphs = {}
+        for i in range(segments):
+            for code in range(starts[i], min(ends[i], 0xFFFE) + 1):
+                if ranges[i] == 0:
+                    glyph = (code + deltas[i]) & 0xFFFF
+                else:
+                    address = ranges_at + 2 * i + ranges[i] + 2 * (code - starts[i])
+                    glyph = struct.unpack_from('>H', data, address)[0]
+                    glyph = (glyph + deltas[i]) & 0xFFFF if glyph else 0
+                if glyph:
+                    glyphs[code] = glyph
+        return glyphs
+
+    def width(self, glyph) -> float:
+        """Ширина глифа в тысячных долях кегля"""
+        return self.advances[min(glyph, len(self.advances) - 1)] * 1000 / self.units_per_em
+
+    def scale(self, value) -> int:
+        return round(value * 1000 / self.units_per_em)
+
+    def subset(self, glyphs) -> bytes:
+        """Файл шрифта с контурами только glyphs (с составляющими их глифами и .notdef)
+
+        Номера глифов не меняются (в PDF - /CIDToGIDMap /Identity), контуры остальных
+        пусты, таблицы из SUBSET_TABLES. Шрифт без glyf/loca (CFF) встраивается целиком.
+        """
+        if 'glyf' not in self.tables or 'loca' not in self.tables:
+            return self.data
+        data = self.data
+        head_at = self.tables['head'][0]
+        glyf_at = self.tables['glyf'][0]
+        num_glyphs = struct.unpack_from('>H', data, self.tables['maxp'][0] + 4)[0]
+        if struct.unpack_from('>h', data, head_at + 50)[0]:
+            loca = struct.unpack_from(f'>{num_glyphs + 1}I', data, self.tables['loca'][0])
+        else:
+            loca = [2 * offset for offset in struct.unpack_from(f'>{num_glyphs + 1}H', data, self.tables['loca'][0])]
+
+        keep = {0} | {glyph for glyph in glyphs if glyph < num_glyphs}
+        pending = list(keep)
+        while pending:
+            glyph = pending.pop()
+            start, end = loca[glyph], loca[glyph + 1]
+            if end - start < 10 or struct.unpack_from('>h', data, glyf_at + start)[0] >= 0:
+                continue
+            position = glyf_at + start + 10  # составной глиф: ссылки на другие глифы
+            while True:
+                flags, component = struct.unpack_from('>HH', data, position)
+                if component < num_glyphs and component not in keep:
+                    keep.add(component)
+                    pending.append(component)
+                position += 4 + (4 if flags & 0x0001 else 2)
+                position += 8 if flags & 0x0080 else 4 if flags & 0x0040 else 2 if flags & 0x0008 else 0
+                if not flags & 0x0020:
+                    break
+
+        outlines, offsets, size = [], [], 0
+        for glyph in range(num_glyphs):
+            offsets.append(size)
+            if glyph in keep:
+                outline = data[glyf_at + loca[glyph]:glyf_at + loca[glyph + 1]]
+                outline += b'\0' * (-len(outline) % 4)
+                outlines.append(outline)
+                size += len(outline)
+        offsets.append(size)
+
+        tables = {tag: data[offset:offset + length] for tag, (offset, length) in self.tables.items()
+                  if tag in SUBSET_TABLES}
+        tables['glyf'] = b''.join(outlines)
+        tables['loca'] = struct.pack(f'>{num_glyphs + 1}I', *offsets)
+        head = tables['head']
+        tables['head'] = head[:8] + bytes(4) + head[12:50] + struct.pack('>h', 1) + head[52:]
+        return _font_file(tables)
+
+
+def _checksum(data: bytes) -> int:
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _font_file(tables: dict) -> bytes:
+    """Файл TrueType из таблиц {тег: данные} с контрольными суммами"""
+    tags = sorted(tables)
+    power = 1 << (len(tags).bit_length() - 1)
+    directory = [struct.pack('>IHHHH', 0x00010000, len(tags), power * 16, power.bit_length() - 1,
+                             (len(tags) - power) * 16)]
+    body, offset, head_at = [], 12 + 16 * len(tags), None
+    for tag in tags:
+        table = tables[tag]
+        directory.append(struct.pack('>4sIII', tag.encode('latin-1'), _checksum(table), offset, len(table)))
+        if tag == 'head':
+            head_at = offset
+        body.append(table + b'\0' * (-len(table) % 4))
+        offset += len(body[-1])
+    font = bytearray(b''.join(directory + body))
+    if head_at is not None:
+        struct.pack_into('>I', font, head_at + 8, (0xB1B0AFBA - _checksum(bytes(font))) & 0xFFFFFFFF)
+    return bytes(font)
+
+
+class PdfWriter:
+    """Потоковая запись PDF: объекты пишутся сразу, в памяти - только смещения"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offsets = {}
+        self.count = 0
+        self.position = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data: bytes):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def reserve(self) -> int:
+        self.count += 1
+        return self.count
+
+    def add(self, body: str, number: int = None) -> int:
+        number = number or self.reserve()
+        self.offsets[number] = self.position
+        self._write(f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+        return number
+
+    def add_stream(self, data: bytes, entries: str = '') -> int:
+        number = self.reserve()
+        self.offsets[number] = self.position
+        data = zlib.compress(data)
+        self._write(f'{number} 0 obj\n<< /Length {len(data)} /Filter /FlateDecode {entries}>>\nstream\n'
+                    .encode('latin-1'))
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+        return number
+
+    def close(self, root: int):
+        xref = self.position
+        lines = [f'xref\n0 {self.count + 1}\n', '0000000000 65535 f \n']
+        lines += [f'{self.offsets[number]:010d} 00000 n \n' for number in range(1, self.count + 1)]
+        lines.append(f'trailer\n<< /Size {self.count + 1} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n')
+        self._write(''.join(lines).encode('latin-1'))
+
+
+class _PdfText:
+    """Текст шрифтом с кодировкой Identity-H: коды - номера глифов"""
+
+    def __init__(self, font: TrueTypeFont):
+        self.font = font
+        self.used = {}
+        self._chars = {}
+
+    def _char(self, char):
+        glyph = self.font.glyphs.get(ord(char))
+        if glyph is None:
+            return '', 0.0
+        self.used.setdefault(glyph, char)
+        return f'{glyph:04X}', self.font.width(glyph)
+
+    def encode(self, text: str):
+        """Шестнадцатеричная строка глифов и ширина текста в тысячных кегля"""
+        codes, width = [], 0.0
+        for char in text:
+            encoded = self._chars.get(char)
+            if encoded is None:
+                encoded = self._chars[char] = self._char(char)
+            codes.append(encoded[0])
+            width += encoded[1]
+        return ''.join(codes), width
+
+    def widths(self) -> str:
+        return ' '.join(f'{glyph} [{round(self.font.width(glyph))}]' for glyph in sorted(self.used))
+
+    def to_unicode(self) -> bytes:
+        entries = [f'<{glyph:04X}> <{ord(char):04X}>' for glyph, char in sorted(self.used.items())
+                   if ord(char) <= 0xFFFF]
+        blocks = [entries[i:i + 100] for i in range(0, len(entries), 100)]
+        body = ''.join(f'{len(block)} beginbfchar\n' + '\n'.join(block) + '\nendbfchar\n' for block in blocks)
+        return ('/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+                '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+                '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+                '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+                f'{body}endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n').encode('ascii')
+
+
+def write_pdf(report: Report, stream, font_path=None):
+    """Страницы A4 с таблицей; каждая страница пишется, как только заполнена
+
+    Нужен шрифт TrueType с кириллицей (find_font); встраивается подмножество
+    с использованными глифами. Символы, которых в шрифте нет (например, эмодзи
+    в именах), пропускаются.
+    """
+    font_path = font_path or find_font()
+    if font_path is None:
+        raise FileNotFoundError("не найден шрифт TrueType для PDF")
+    font = TrueTypeFont(font_path)
+    text = _PdfText(font)
+    pdf = PdfWriter(stream)
+    catalog, pages, font_ref = pdf.reserve(), pdf.reserve(), pdf.reserve()
+    kids = []
+
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / len(report.columns)
+    rows_per_page = int((PAGE_HEIGHT - 2 * MARGIN - 2 * LINE_HEIGHT) // LINE_HEIGHT) - 1
+
+    def draw(x, y, value, size, align_right=False):
+        codes, width = text.encode(value)
+        if align_right:
+            x -= width * size / 1000
+        return f'BT /F1 {size} Tf {x:.2f} {y:.2f} Td <{codes}> Tj ET\n'
+
+    def cells(values, y):
+        parts = []
+        for i, value in enumerate(values):
+            if i == 0:
+                parts.append(draw(MARGIN, y, value, FONT_SIZE))
+            else:
+                parts.append(draw(MARGIN + (i + 1) * column_width - 4, y, value, FONT_SIZE, True))
+        return ''.join(parts)
+
+    def new_page():
+        y = PAGE_HEIGHT - MARGIN - TITLE_SIZE
+        parts = [draw(MARGIN, y, f"{report.title} - стр. {len(kids) + 1}", TITLE_SIZE)]
+        y -= 2 * LINE_HEIGHT
+        parts.append(cells([title for title, _ in report.columns], y))
+        parts.append(f'{MARGIN} {y - 3:.2f} m {PAGE_WIDTH - MARGIN} {y - 3:.2f} l S\n')
+        return parts, y - LINE_HEIGHT
+
+    def flush_page(parts):
+        content = pdf.add_stream(''.join(parts).encode('latin-1'))
+        kids.append(pdf.add(
+            f'<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {font_ref} 0 R >> >> /Contents {content} 0 R >>'
+        ))
+
+    parts, y = new_page()
+    rows = 0
+    for kind, values in report.rows:
+        if rows == rows_per_page:
+            flush_page(parts)
+            (parts, y), rows = new_page(), 0
+        if kind == TOTAL:
+            parts.append(f'{MARGIN} {y + LINE_HEIGHT - 3:.2f} m {PAGE_WIDTH - MARGIN} '
+                         f'{y + LINE_HEIGHT - 3:.2f} l S\n')
+        parts.append(cells(report.formatted(values), y))
+        y -= LINE_HEIGHT
+        rows += 1
+    flush_page(parts)
+
+    font_data = font.subset(text.used)
+    font_file = pdf.add_stream(font_data, f'/Length1 {len(font_data)} ')
+    # имя подмножества шрифта: шесть заглавных букв + '+' (PDF 1.4, 5.5.3)
+    tag = zlib.crc32(repr(sorted(text.used)).encode('ascii'))
+    name = ''.join(chr(65 + tag // 26 ** i % 26) for i in range(6)) + '+EmbeddedFont'
+    left, bottom, right, top = (font.scale(value) for value in font.bbox)
+    descriptor = pdf.add(
+        f'<< /Type /FontDescriptor /FontName /{name} /Flags 32 /FontBBox [{left} {bottom} {right} {top}] '
+        f'/ItalicAngle 0 /Ascent {font.scale(font.ascent)} /Descent {font.scale(font.descent)} '
+        f'/CapHeight {font.scale(font.ascent)} /StemV 80 /FontFile2 {font_file} 0 R >>'
+    )
+    cid_font = pdf.add(
+        f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} '
+        f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+        f'/FontDescriptor {descriptor} 0 R /CIDToGIDMap /Identity /W [{text.widths()}] >>'
+    )
+    to_unicode = pdf.add_stream(text.to_unicode())
+    pdf.add(f'<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H '
+            f'/DescendantFonts [{cid_font} 0 R] /ToUnicode {to_unicode} 0 R >>', number=font_ref)
+    pdf.add(f'<< /Type /Pages /Kids [{" ".join(f"{kid} 0 R" for kid in kids)}] /Count {len(kids)} >>',
+            number=pages)
+    pdf.add(f'<< /Type /Catalog /Pages {pages} 0 R >>', number=catalog)
+    pdf.close(catalog)
+
+
+def export_report(report: Report, path, font_path=None):
+    """Запись отчета в файл; формат по расширению: .csv, .xlsx или .pdf"""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == '.csv':
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            write_csv(report, f)
+    elif ext == '.xlsx':
+        write_xlsx(report, path)
+    elif ext == '.pdf':
+        with open(path, 'wb') as f:
+            write_pdf(report, f, font_path)
+    else:
+        raise ValueError(f"Неизвестный формат отчета: {ext or path}")
@@ -0,0 +1,132 @@
+"""Кэш вычисленных объемов, общий для резервуаров и сохраняемый между запусками
+
+Ключ - (резервуар, отпечаток таблицы с режимом интерполяции, высота): результат
+по измененной таблице никогда не берется из кэша, а retain() сразу убирает такие
+записи после загрузки новых таблиц. Размер ограничен max_entries, вытесняется
+запись, к которой дольше всего не обращались. Файл - JSON в порядке обращений.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import timings
+
+RESULTS_CACHE_FILE = 'results_cache.json'
+RESULTS_CACHE_ENTRIES = 4096
+RESULTS_CACHE_VERSION = 1
+
+
+class ResultsCache:
+    """LRU-кэш объемов по ключу (резервуар, ключ таблицы, высота); потокобезопасный
+
+    Счетчики hits/misses/evictions/invalidations ведутся всегда, при включенных
+    замерах они же попадают в timings как results_cache.*.
+    """
+
+    def __init__(self, max_entries: int = RESULTS_CACHE_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Объем по ключу или None"""
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if timings.enabled:
+            timings.count('results_cache.miss' if value is None else 'results_cache.hit')
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            evicted = len(self.entries) - self.max_entries
+            for _ in range(evicted):
+                self.entries.popitem(last=False)
+            self.evictions += max(evicted, 0)
+            self._dirty = True
+        if evicted > 0 and timings.enabled:
+            timings.count('results_cache.eviction', evicted)
+
+    def retain(self, current: dict) -> int:
+        """Оставить записи только текущих таблиц {резервуар: ключ таблицы}; число удаленных"""
+        with self._lock:
+            stale = [key for key in self.entries if current.get(key[0]) != key[1]]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+            self._dirty = self._dirty or bool(stale)
+        if stale and timings.enabled:
+            timings.count('results_cache.invalidation', len(stale))
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self.entries)
+            self._dirty = self._dirty or bool(self.entries)
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0.0}
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (f"записей: {stats['entries']} из {self.max_entries}, попаданий: {stats['hits']} "
+                f"({stats['hit_rate']:.0%}), промахов: {stats['misses']}, вытеснено: {stats['evictions']}, "
+                f"устарело: {stats['invalidations']}")
+
+    def load(self, path=None) -> int:
+        """Добавить записи из файла (отсутствующий или поврежденный файл - пустой кэш); число записей"""
+        path = path or self.path
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != RESULTS_CACHE_VERSION:
+                return 0
+            loaded = [((tank, calibration, height), np.float64(volume))
+                      for tank, calibration, height, volume in data['entries'][-self.max_entries:]]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return 0
+        with self._lock:
+            for key, value in loaded:
+                self.entries.setdefault(key, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return len(loaded)
+
+    def save(self, path=None) -> bool:
+        """Записать кэш, если он менялся (через временный файл)"""
+        path = path or self.path
+        with self._lock:
+            if not self._dirty:
+                return False
+            entries = [[*key, float(value)] for key, value in self.entries.items()]
+            self._dirty = False
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': RESULTS_CACHE_VERSION, 'entries': entries}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return True
+
+
+results_cache = ResultsCache()
@@ -0,0 +1,373 @@
+"""Обмен показаниями и градуировочными таблицами между станциями
+
+Станция выгружает пакет изменений - gzip JSONL: строка заголовка, версии таблиц
+и блоки показаний по колонкам. Номер последовательности - id строки в базе
+истории станции: пакет содержит все свои показания с номерами (since, until]
+и версии таблиц с номерами (since, until]. Принятые диапазоны запоминаются по
+станциям, поэтому импорт идемпотентен: повтор, перекрытие и любой порядок
+пакетов не дают дублей, а уже принятый пакет пропускается по заголовку.
+
+Транспорт - каталог: станции кладут в него файлы, центральная база забирает все.
+Принятые показания хранятся с ключом "станция/резервуар", таблицы - с колонкой station.
+"""
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+from calibration import CalibrationTable
+from history import ensure_schema, insert_rows
+
+SYNC_PATHS = [
+    '/storage/emulated/0/fuelcalc-sync',
+    './sync',
+]
+
+BUNDLE_FORMAT = 'fuelcalc-sync'
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = '.jsonl.gz'
+CHUNK_ROWS = 10000
+STATION_SEPARATOR = '/'
+STATION_NAME = re.compile(r'[\w.-]+')
+KIND_READINGS = 'readings'
+KIND_CALIBRATIONS = 'calibrations'
+KINDS = (KIND_READINGS, KIND_CALIBRATIONS)
+READING_COLUMNS = ('seq', 'ts', 'tank', 'height', 'density', 'volume', 'mass')
+
+SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS calibrations (
+    id INTEGER PRIMARY KEY,
+    station TEXT,
+    seq INTEGER,
+    ts REAL NOT NULL,
+    tank TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    heights BLOB NOT NULL,
+    liters BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calibrations_tank ON calibrations (station, tank, id);
+CREATE TABLE IF NOT EXISTS sync_ranges (
+    station TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sync_ranges_station ON sync_ranges (station, kind);
+"""
+
+
+def find_sync_dir(paths=None):
+    """Каталог обмена, если он создан (выгрузка включается его появлением)"""
+    for path in paths or SYNC_PATHS:
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=30)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    ensure_schema(db)
+    db.executescript(SYNC_SCHEMA)
+    return db
+
+
+def _meta(db, key, default=None):
+    row = db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(db, key, value):
+    db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+
+def station_name(db, name=None) -> str:
+    """Имя станции этой базы: задается один раз (name или случайное), затем не меняется"""
+    stored = _meta(db, 'station')
+    if stored is not None:
+        if name is not None and name != stored:
+            raise ValueError(f"база уже выгружалась как станция '{stored}'")
+        return stored
+    name = name or f"station-{uuid.uuid4().hex[:8]}"
+    if not STATION_NAME.fullmatch(name):
+        raise ValueError(f"имя станции - буквы, цифры, '.', '_' и '-': {name!r}")
+    with db:
+        _set_meta(db, 'station', name)
+    return name
+
+
+def record_calibrations(path, tables, ts=None) -> int:
+    """Запомнить новые версии таблиц {резервуар: CalibrationTable}; число добавленных
+
+    Версия добавляется, если таблица отличается от последней записанной для резервуара.
+    Прореженные таблицы (calibration.decimation) - не версии градуировки и пропускаются.
+    """
+    ts = time.time() if ts is None else ts
+    db = connect(path)
+    try:
+        added = 0
+        with db:
+            for tank, table in tables.items():
+                if table.decimation is not None:
+                    continue
+                digest = table.digest()
+                row = db.execute('SELECT digest FROM calibrations WHERE station IS NULL AND tank = ? '
+                                 'ORDER BY id DESC LIMIT 1', (str(tank),)).fetchone()
+                if row is None or row[0] != digest:
+                    db.execute('INSERT INTO calibrations (ts, tank, digest, heights, liters) VALUES (?, ?, ?, ?, ?)',
+                               (ts, str(tank), digest, np.ascontiguousarray(table.heights, dtype='<f8').tobytes(),
+                                np.ascontiguousarray(table.liters, dtype='<f8').tobytes()))
+                    added += 1
+        return added
+    finally:
+        db.close()
+
+
+def latest_calibrations(path, station=None) -> dict:
+    """Последние версии таблиц станции (None - своей): {резервуар: CalibrationTable}"""
+    db = connect(path)
+    try:
+        rows = db.execute('SELECT tank, heights, liters FROM calibrations WHERE station IS ? ORDER BY id',
+                          (station,)).fetchall()
+    finally:
+        db.close()
+    return {tank: CalibrationTable(np.frombuffer(heights, dtype='<f8'), np.frombuffer(liters, dtype='<f8'))
+            for tank, heights, liters in rows}
+
+
+class BundleInfo:
+    """Выгруженный пакет: файл, станция, диапазоны номеров (since, until] и число записей"""
+
+    __slots__ = ('path', 'station', 'readings', 'calibrations', 'rows', 'versions')
+
+    def __init__(self, path, station, readings, calibrations, rows=0, versions=0):
+        self.path = path
+        self.station = station
+        self.readings = readings
+        self.calibrations = calibrations
+        self.rows = rows
+        self.versions = versions
+
+    def summary(self) -> str:
+        return (f"{os.path.basename(self.path)}: показаний {self.rows}, версий таблиц {self.versions}, "
+                f"номера {self.readings[0] + 1}..{self.readings[1]}")
+
+
+def _max_id(db, table) -> int:
+    return db.execute(f'SELECT coalesce(max(id), 0) FROM {table} WHERE station IS NULL').fetchone()[0]
+
+
+def _parse_since(since):
+    """Курсор выгрузки: число (показания) или пара (показания, таблицы)"""
+    if isinstance(since, int):
+        return since, 0
+    readings, calibrations = since
+    return int(readings), int(calibrations)
+
+
+def export_bundle(path, directory, since=None, station=None):
+    """Выгрузить свои показания и версии таблиц после since в каталог directory
+
+    since - None (с прошлой выгрузки этой базы), номер показания или пара
+    (показания, таблицы). Возвращает BundleInfo или None, если выгружать нечего.
+    Файл появляется в каталоге целиком (запись во временный и переименование).
+    """
+    db = connect(path)
+    try:
+        station = station_name(db, station)
+        if since is None:
+            since = (int(_meta(db, 'export.readings', 0)), int(_meta(db, 'export.calibrations', 0)))
+        since = _parse_since(since)
+        until = (_max_id(db, 'readings'), _max_id(db, 'calibrations'))
+        if until[0] <= since[0] and until[1] <= since[1]:
+            return None
+        until = (max(until[0], since[0]), max(until[1], since[1]))
+
+        name = f"{station}-{since[0]:012d}-{until[0]:012d}-{since[1]:08d}-{until[1]:08d}{BUNDLE_SUFFIX}"
+        info = BundleInfo(os.path.join(directory, name), station, (since[0], until[0]), (since[1], until[1]))
+        temp_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as target:
+                _write_bundle(db, target, info)
+            os.replace(temp_path, info.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with db:
+            _set_meta(db, 'export.readings', max(until[0], int(_meta(db, 'export.readings', 0))))
+            _set_meta(db, 'export.calibrations', max(until[1], int(_meta(db, 'export.calibrations', 0))))
+        return info
+    finally:
+        db.close()
+
+
+def _write_bundle(db, target, info):
+    header = {'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION, 'station': info.station,
+              'created': time.time(), KIND_READINGS: info.readings, KIND_CALIBRATIONS: info.calibrations}
+    target.write(json.dumps(header, ensure_ascii=False) + '\n')
+
+    for seq, ts, tank, digest, heights, liters in db.execute(
+            'SELECT id, ts, tank, digest, heights, liters FROM calibrations '
+            'WHERE station IS NULL AND id > ? AND id <= ? ORDER BY id', info.calibrations):
+        version = {'seq': seq, 'ts': ts, 'tank': tank, 'digest': digest,
+                   'heights': np.frombuffer(heights, dtype='<f8').tolist(),
+                   'liters': np.frombuffer(liters, dtype='<f8').tolist()}
+        target.write(json.dumps({'calibration': version}, ensure_ascii=False) + '\n')
+        info.versions += 1
+
+    cursor = db.execute('SELECT id, ts, tank, height, density, volume, mass FROM readings '
+                        'WHERE station IS NULL AND id > ? AND id <= ? ORDER BY id', info.readings)
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        chunk = dict(zip(READING_COLUMNS, (list(column) for column in zip(*rows))))
+        target.write(json.dumps({'readings': chunk}, ensure_ascii=False) + '\n')
+        info.rows += len(rows)
+
+
+def _ranges(db, station, kind) -> list:
+    return db.execute('SELECT first, last FROM sync_ranges WHERE station = ? AND kind = ? ORDER BY first',
+                      (station, kind)).fetchall()
+
+
+def _add_range(db, station, kind, first, last):
+    """Отметить номера [first, last] принятыми; соседние и перекрытые диапазоны сливаются"""
+    merged = []
+    for start, stop in sorted(_ranges(db, station, kind) + [(first, last)]):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    db.execute('DELETE FROM sync_ranges WHERE station = ? AND kind = ?', (station, kind))
+    db.executemany('INSERT INTO sync_ranges VALUES (?, ?, ?, ?)',
+                   [(station, kind, start, stop) for start, stop in merged])
+
+
+def _covered(seq, ranges) -> np.ndarray:
+    """Маска номеров seq, уже попавших в принятые диапазоны [(first, last), ...]"""
+    seq = np.asarray(seq, dtype=np.int64)
+    if not ranges:
+        return np.zeros(len(seq), dtype=bool)
+    firsts, lasts = (np.array(column, dtype=np.int64) for column in zip(*ranges))
+    index = np.searchsorted(firsts, seq, side='right') - 1
+    return (index >= 0) & (seq <= lasts[np.maximum(index, 0)])
+
+
+def _fully_covered(span, ranges) -> bool:
+    since, until = span
+    return until <= since or any(first <= since + 1 and until <= last for first, last in ranges)
+
+
+class ImportSummary:
+    """Итоги приема пакетов"""
+
+    __slots__ = ('bundles', 'skipped', 'rows', 'duplicates', 'versions', 'stations', 'failures')
+
+    def __init__(self):
+        self.bundles = 0
+        self.skipped = 0
+        self.rows = 0
+        self.duplicates = 0
+        self.versions = 0
+        self.stations = set()
+        self.failures = []
+
+    def summary(self) -> str:
+        text = (f"пакетов: {self.bundles} (уже принятых: {self.skipped}), станций: {len(self.stations)}, "
+                f"показаний: {self.rows} (повторов: {self.duplicates}), версий таблиц: {self.versions}")
+        if self.failures:
+            text += f", ошибок: {len(self.failures)}"
+        return text
+
+
+def _read_header(source) -> dict:
+    header = json.loads(source.readline() or 'null')
+    if not isinstance(header, dict) or header.get('format') != BUNDLE_FORMAT:
+        raise ValueError("не пакет обмена")
+    if header.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"версия пакета {header.get('version')} не поддерживается")
+    if not STATION_NAME.fullmatch(str(header.get('station', ''))):
+        raise ValueError(f"недопустимое имя станции {header.get('station')!r}")
+    return header
+
+
+def import_bundle(db, file_path, summary=None, own_station=None) -> ImportSummary:
+    """Принять пакет в открытую базу db одной транзакцией (ошибка - без изменений)"""
+    summary = ImportSummary() if summary is None else summary
+    with gzip.open(file_path, 'rt', encoding='utf-8') as source:
+        header = _read_header(source)
+        station = header['station']
+        spans = {kind: tuple(header[kind]) for kind in KINDS}
+        ranges = {kind: _ranges(db, station, kind) for kind in KINDS}
+        if station == own_station or all(_fully_covered(spans[kind], ranges[kind]) for kind in KINDS):
+            summary.skipped += 1
+            return summary
+
+        prefix = station + STATION_SEPARATOR
+        rows_added = duplicates = versions = 0
+        with db:
+            for line in source:
+                record = json.loads(line)
+                if 'readings' in record:
+                    chunk = record['readings']
+                    fresh = ~_covered(chunk['seq'], ranges[KIND_READINGS])
+                    rows = [(ts, prefix + str(tank), height, density, volume, mass)
+                            for keep, ts, tank, height, density, volume, mass
+                            in zip(fresh.tolist(), *(chunk[name] for name in READING_COLUMNS[1:])) if keep]
+                    insert_rows(db, rows, station)
+                    rows_added += len(rows)
+                    duplicates += len(fresh) - len(rows)
+                elif 'calibration' in record:
+                    version = record['calibration']
+                    if _covered([version['seq']], ranges[KIND_CALIBRATIONS])[0]:
+                        continue
+                    db.execute('INSERT INTO calibrations (station, seq, ts, tank, digest, heights, liters) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (station, version['seq'], version['ts'], str(version['tank']), version['digest'],
+                                np.asarray(version['heights'], dtype='<f8').tobytes(),
+                                np.asarray(version['liters'], dtype='<f8').tobytes()))
+                    versions += 1
+            for kind in KINDS:
+                since, until = spans[kind]
+                if until > since:
+                    _add_range(db, station, kind, since + 1, until)
+        # счетчики - только после фиксации транзакции: ошибка в середине пакета откатывает все
+        summary.rows += rows_added
+        summary.duplicates += duplicates
+        summary.versions += versions
+        summary.bundles += 1
+        summary.stations.add(station)
+    return summary
+
+
+def import_directory(path, directory) -> ImportSummary:
+    """Принять все пакеты каталога в базу path; повторный запуск ничего не добавляет
+
+    Поврежденный пакет не принимается (в failures), остальные обрабатываются.
+    """
+    summary = ImportSummary()
+    db = connect(path)
+    try:
+        own_station = _meta(db, 'station')
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(BUNDLE_SUFFIX) or name.startswith('.'):
+                continue
+            try:
+                import_bundle(db, os.path.join(directory, name), summary, own_station)
+            except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+                summary.failures.append(f"{name}: {e}")
+    finally:
+        db.close()
+    return summary
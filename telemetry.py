@@ -0,0 +1,241 @@
+"""Прием показаний автоматических уровнемеров без блокировки интерфейса
+
+Показание - строка JSON {"tank": 1, "height_mm": 1500, "density": 0.84, "temperature": 12.5}
+или CSV "tank,height_mm[,density[,temperature]]". Один TCP-порт принимает и поток
+таких строк, и HTTP POST /readings со строками в теле; последовательный порт
+(или FIFO вместо него) читается построчно.
+
+Сервис работает в своем потоке со своим циклом asyncio. Строки идут через
+ограниченную очередь: когда она заполнена, сервис перестает читать сокеты и
+уровнемеры притормаживаются механизмом окна TCP. Пакеты считаются векторно
+через iter_chunks и передаются в on_batch в потоке сервиса.
+"""
+import asyncio
+import json
+import random
+import threading
+
+from readings import iter_chunks
+
+TELEMETRY_ENV = 'FUELCALC_TELEMETRY'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7070
+QUEUE_SIZE = 10000
+BATCH_SIZE = 2000
+BATCH_INTERVAL = 0.2
+MAX_HEADER_LINES = 100
+
+
+def parse_address(address: str):
+    """'host:port' или 'port' -> (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or DEFAULT_HOST, int(port)
+
+
+def parse_line(line: bytes):
+    """Сырое показание (tank, height_mm, density, temperature) из строки JSON или CSV"""
+    text = line.decode('utf-8').strip()
+    if text.startswith('{'):
+        row = json.loads(text)
+        return row.get('tank'), row.get('height_mm'), row.get('density'), row.get('temperature')
+    cells = text.split(',')
+    return tuple(cells[:4]) + (None,) * (4 - len(cells))
+
+
+class TelemetryService:
+    """Сервер приема показаний: TCP/HTTP и необязательный последовательный порт
+
+    tanks читается потоком приема без блокировок, поэтому словарь не изменяют на
+    месте, а заменяют целиком: service.tanks = dict(...).
+    """
+
+    def __init__(self, tanks, on_batch, host=DEFAULT_HOST, port=DEFAULT_PORT, serial_path=None,
+                 queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL):
+        self.tanks = tanks
+        self.on_batch = on_batch
+        self.host = host
+        self.port = port
+        self.serial_path = serial_path
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        self.last_error = None
+        self._loop = None
+        self._queue = None
+        self._stopping = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._failure = None
+
+    def start(self, timeout=10):
+        """Запуск в фоновом потоке; возвращает, когда порт открыт"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        if self._failure is not None:
+            raise self._failure
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self._failure = e
+            self._ready.set()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        tasks = [asyncio.ensure_future(self._batch_loop())]
+        if self.serial_path:
+            threading.Thread(target=self._read_serial, args=(self.serial_path,), daemon=True).start()
+        self._ready.set()
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._process(self._drain())
+
+    def on_error(self, line, message):
+        self.errors += 1
+        self.last_error = message
+
+    async def _put(self, line):
+        if line.strip():
+            self.received += 1
+            await self._queue.put(line)
+
+    async def _handle(self, reader, writer):
+        try:
+            first = await reader.readline()
+            if first.startswith(b'POST '):
+                await self._handle_http(first, reader, writer)
+            else:
+                line = first
+                while line:
+                    await self._put(line)
+                    line = await reader.readline()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_http(self, request_line, reader, writer):
+        length = 0
+        for _ in range(MAX_HEADER_LINES):
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b''
+        if path.rstrip(b'/') != b'/readings':
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            return
+        body = await reader.readexactly(length)
+        for line in body.splitlines():
+            await self._put(line)
+        writer.write(b'HTTP/1.1 202 Accepted\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+
+    def _read_serial(self, path):
+        """Построчное чтение устройства или FIFO в отдельном потоке
+
+        Поток ждет места в очереди, так что обратное давление работает и здесь;
+        поток фоновый и не мешает остановке, если порт так и не открылся.
+        """
+        with open(path, 'rb') as port:
+            for line in iter(port.readline, b''):
+                if self._stopping.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(self._put(line), self._loop).result()
+
+    def _drain(self) -> list:
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _batch_loop(self):
+        """Пакет - до batch_size строк или все, что пришло за batch_interval"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            self._process(batch)
+
+    def _parsed(self, lines):
+        for number, line in enumerate(lines, 1):
+            try:
+                yield parse_line(line)
+            except ValueError:
+                self.on_error(number, f"некорректная строка {line[:80]!r}")
+
+    def _process(self, lines):
+        if not lines:
+            return
+        for chunk in iter_chunks(self._parsed(lines), self.tanks, self.on_error, len(lines)):
+            self.processed += len(chunk[0])
+            self.on_batch(chunk)
+
+
+def gauge_lines(max_heights: dict, seed=None):
+    """Бесконечный поток показаний имитатора: медленное случайное блуждание уровня"""
+    rng = random.Random(seed)
+    levels = {tank: rng.uniform(0.2, 0.8) * height for tank, height in max_heights.items()}
+    while True:
+        for tank, max_height in max_heights.items():
+            level = levels[tank] + rng.uniform(-0.001, 0.001) * max_height
+            levels[tank] = min(max(level, 0.0), max_height)
+            temperature = round(15 + rng.uniform(-10, 10), 1)
+            yield f"{tank},{int(levels[tank])},,{temperature}\n".encode()
+
+
+async def simulate_gauge(host, port, max_heights: dict, count: int, rate: float = 0, seed=None):
+    """Имитатор уровнемера: count строк по TCP, rate строк/с (0 - без ограничения)
+
+    Ожидание drain() передает обратное давление сервера имитатору.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = gauge_lines(max_heights, seed)
+    step = max(int(rate / 100), 1) if rate else 1000
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    sent = 0
+    while sent < count:
+        block = min(step, count - sent)
+        writer.writelines(next(lines) for _ in range(block))
+        sent += block
+        await writer.drain()
+        if rate:
+            delay = start + sent / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    writer.close()
+    await writer.wait_closed()
+    return sent
@@ -0,0 +1,259 @@
+"""Градуировочные таблицы из книги Excel
+
+Раскладка определяется по строкам заголовка каждого листа:
+
+- ячейка вида "Резервуар 5" ("РВС-5", "Tank 5", "Емкость №5") начинает блок
+  резервуара: высота в этой колонке, объем в следующей, данные - со следующей строки;
+- лист без таких ячеек, названный по резервуару ("Резервуар 5" или "5"), - блок
+  одного резервуара в колонках A и B;
+- если не нашлось ни того, ни другого - прежняя раскладка первого листа: блоки
+  по 3 колонки на резервуар, данные с FIRST_ROW.
+
+Единицы высоты - по тексту заголовка блока ("мм" или "см"), по умолчанию сантиметры.
+Число строк не ограничено. Листы читаются по требованию: при первом обращении
+к любому резервуару листа читаются все его блоки.
+"""
+import os
+import re
+import threading
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from calibration import CalibrationTable
+from instrumentation import timed
+
+WORKBOOK_PATHS = [
+    '/storage/emulated/0/резерв.xlsx',
+    './резерв.xlsx',
+    'резерв.xlsx'
+]
+
+TANK_COUNT = 8
+COLUMNS_PER_TANK = 3
+FIRST_ROW = 3
+HEADER_ROWS = 3
+TANK_HEADER = re.compile(r'(?:резервуар|рвс|емкость|ёмкость|tank)\s*[№#-]?\s*(\d+)', re.IGNORECASE)
+MM_PER_UNIT = {'мм': 1, 'mm': 1, 'см': 10, 'cm': 10}
+DEFAULT_MM_PER_UNIT = 10
+
+
+def find_file(paths):
+    """Первый существующий файл из списка путей или None"""
+    for fp in paths:
+        if os.path.isfile(fp):
+            return fp
+    return None
+
+
+def find_workbook(paths=None):
+    """Поиск файла градуировочных таблиц"""
+    return find_file(paths or WORKBOOK_PATHS)
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class TankBlock:
+    """Место таблицы резервуара в книге: лист, колонка высоты (с 0), множитель до мм,
+    первая строка данных (с 1)
+    """
+
+    __slots__ = ('number', 'sheet', 'column', 'scale', 'first_row')
+
+    def __init__(self, number: int, sheet: str, column: int, scale: int = DEFAULT_MM_PER_UNIT,
+                 first_row: int = FIRST_ROW):
+        self.number = number
+        self.sheet = sheet
+        self.column = column
+        self.scale = scale
+        self.first_row = first_row
+
+
+def _unit_scale(*texts) -> int:
+    for text in texts:
+        if isinstance(text, str):
+            for word in re.findall(r'[^\W\d_]+', text.lower()):
+                if word in MM_PER_UNIT:
+                    return MM_PER_UNIT[word]
+    return DEFAULT_MM_PER_UNIT
+
+
+def _cell(rows, row, column):
+    if row < len(rows) and column < len(rows[row]):
+        return rows[row][column]
+    return None
+
+
+def _sheet_blocks(title: str, header) -> list:
+    """Блоки листа по строкам заголовка header (первые HEADER_ROWS строк)"""
+    blocks = []
+    for row, values in enumerate(header):
+        for column, value in enumerate(values):
+            match = TANK_HEADER.search(value) if isinstance(value, str) else None
+            if match:
+                scale = _unit_scale(value[match.end():], _cell(header, row + 1, column))
+                blocks.append(TankBlock(int(match.group(1)), title, column, scale, row + 2))
+    if blocks:
+        return blocks
+    match = TANK_HEADER.search(title)
+    number = match.group(1) if match else title.strip()
+    if number.isdigit():
+        texts = [_cell(header, row, 0) for row in range(len(header))]
+        return [TankBlock(int(number), title, 0, _unit_scale(*texts), 1)]
+    return []
+
+
+def legacy_blocks(sheet: str, tank_count: int = TANK_COUNT) -> list:
+    """Прежняя раскладка: блоки по 3 колонки, сантиметры, данные с FIRST_ROW"""
+    return [TankBlock(tank_num, sheet, (tank_num - 1) * COLUMNS_PER_TANK) for tank_num in range(1, tank_count + 1)]
+
+
+def scan_layout(workbook, tank_count: int = TANK_COUNT) -> list:
+    """Блоки резервуаров книги по строкам заголовка всех листов (данные не читаются)
+
+    Повтор номера резервуара игнорируется - остается первый блок.
+    """
+    blocks, seen = [], set()
+    for sheet in workbook.worksheets:
+        header = [list(row) for row in sheet.iter_rows(max_row=HEADER_ROWS, values_only=True)]
+        for block in _sheet_blocks(sheet.title, header):
+            if block.number not in seen:
+                seen.add(block.number)
+                blocks.append(block)
+    return blocks or legacy_blocks(workbook.worksheets[0].title, tank_count)
+
+
+@timed('workbook.read')
+def read_blocks(workbook, sheet: str, blocks) -> dict:
+    """Потоковое чтение листа: таблицы его блоков по номерам резервуаров
+
+    Пустые строки пропускаются; номера строк в diagnostics - строки листа.
+    """
+    first_row = min(block.first_row for block in blocks)
+    first_column = min(block.column for block in blocks)
+    last_column = max(block.column for block in blocks) + 2
+    columns = [array('d') for _ in range(last_column - first_column)]
+    for row in workbook[sheet].iter_rows(min_row=first_row, min_col=first_column + 1,
+                                         max_col=last_column, values_only=True):
+        for column, value in zip(columns, row):
+            column.append(_to_float(value))
+        for column in columns[len(row):]:
+            column.append(np.nan)
+
+    tables = {}
+    for block in blocks:
+        skip = block.first_row - first_row
+        index = block.column - first_column
+        heights = np.frombuffer(columns[index], dtype=float)[skip:]
+        liters = np.frombuffer(columns[index + 1], dtype=float)[skip:]
+        table = CalibrationTable(heights * block.scale, liters)
+        table.diagnostics.first_row = block.first_row
+        table.diagnostics.sheet = sheet
+        tables[block.number] = table
+    return tables
+
+
+def open_workbook(file_path):
+    from openpyxl import load_workbook
+
+    return load_workbook(file_path, read_only=True, data_only=True)
+
+
+class WorkbookTables(Mapping):
+    """Таблицы книги по номерам резервуаров с чтением листов по требованию
+
+    Ключи известны после разбора заголовков; лист читается при первом обращении
+    к любому его резервуару (под блокировкой - из любого потока). Пустой блок дает
+    пустую таблицу. transform(номер, таблица) применяется к каждой непустой прочитанной
+    таблице; on_complete(tables) вызывается, когда прочитаны все листы.
+    """
+
+    def __init__(self, file_path, blocks, on_complete=None, transform=None):
+        self.file_path = file_path
+        self.blocks = {block.number: block for block in blocks}
+        self.sheets = {}
+        for block in blocks:
+            self.sheets.setdefault(block.sheet, []).append(block)
+        self.on_complete = on_complete
+        self.transform = transform
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, tank_num):
+        table = self.tables.get(tank_num)
+        if table is None:
+            block = self.blocks[tank_num]
+            with self._lock:
+                if tank_num not in self.tables:
+                    workbook = open_workbook(self.file_path)
+                    try:
+                        self._read(workbook, block.sheet)
+                    finally:
+                        workbook.close()
+            table = self.tables[tank_num]
+        return table
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @property
+    def complete(self) -> bool:
+        return len(self.tables) == len(self.blocks)
+
+    def load_all(self, workbook=None) -> dict:
+        """Прочитать оставшиеся листы за одно открытие книги (или в уже открытой workbook)"""
+        with self._lock:
+            pending = [sheet for sheet, blocks in self.sheets.items()
+                       if any(block.number not in self.tables for block in blocks)]
+            if pending and workbook is not None:
+                for sheet in pending:
+                    self._read(workbook, sheet)
+            elif pending:
+                workbook = open_workbook(self.file_path)
+                try:
+                    for sheet in pending:
+                        self._read(workbook, sheet)
+                finally:
+                    workbook.close()
+        return self.tables
+
+    def _read(self, workbook, sheet):
+        tables = read_blocks(workbook, sheet, self.sheets[sheet])
+        if self.transform is not None:
+            tables = {tank_num: table if table.empty else self.transform(tank_num, table)
+                      for tank_num, table in tables.items()}
+        self.tables.update(tables)
+        if self.complete and self.on_complete is not None:
+            self.on_complete(self.tables)
+
+
+def open_workbook_tables(file_path, tank_count: int = TANK_COUNT, lazy: bool = True,
+                         transform=None) -> WorkbookTables:
+    """Разбор раскладки книги; данные читаются за то же открытие, если lazy=False
+    или лист один (по требованию он все равно читался бы целиком)
+    """
+    workbook = open_workbook(file_path)
+    try:
+        tables = WorkbookTables(file_path, scan_layout(workbook, tank_count), transform=transform)
+        if not lazy or len(tables.sheets) == 1:
+            tables.load_all(workbook)
+    finally:
+        workbook.close()
+    return tables
+
+
+def load_calibration_tables(file_path, tank_count: int = TANK_COUNT) -> dict:
+    """Загрузка градуировочных таблиц всех резервуаров сразу (пустые блоки пропускаются)"""
+    tables = open_workbook_tables(file_path, tank_count, lazy=False).tables
+    return {tank_num: table for tank_num, table in sorted(tables.items()) if not table.empty}
@@ -0,0 +1,56 @@
+"""Фоновый расчет с объединением входов для интерфейса"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CoalescingWorker:
+    """Расчеты вне потока интерфейса; устаревшие входы не считаются
+
+    submit() не блокирует вызывающий поток. Пока расчет ждет или идет, новые
+    входы копятся в словаре по ключу объекта: при быстром вводе считается только
+    последнее значение каждого поля. compute(pending) выполняется строго по одному,
+    поэтому модель расчета трогает только один поток. publish(result, latency)
+    вызывается в рабочем потоке; передать результат в интерфейс - его задача.
+    Исключение из compute передается в publish вместо результата.
+    """
+
+    def __init__(self, compute, publish, executor=None):
+        self.compute = compute
+        self.publish = publish
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='calc')
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._scheduled = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.runs = 0
+
+    def submit(self, key, inputs=None):
+        with self._lock:
+            self.submitted += 1
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = inputs
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self._run)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if not pending:
+                    self._scheduled = False
+                    return
+            start = time.perf_counter()
+            try:
+                result = self.compute(pending)
+            except Exception as e:
+                result = e
+            self.runs += 1
+            self.publish(result, time.perf_counter() - start)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)